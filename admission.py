@@ -0,0 +1,149 @@
+"""
+Memory-aware admission of ComfyUI jobs.
+
+Jobs belong to a workflow family (image, video, upscale). Consecutive jobs
+of one family reuse the models ComfyUI already holds and are admitted
+straight away. When the family changes, the next job is admitted only if
+ComfyUI's free VRAM and RAM (/system_stats) cover that family's footprint:
+
+    1. fits                  -> submit
+    2. doesn't fit / unknown -> POST /free (unload_models, free_memory),
+                                wait for the memory to come back, re-check
+    3. still doesn't fit     -> restart ComfyUI (the caller's `restart`)
+
+Footprints are learned from the telemetry ring buffer: for each of the
+last FOOTPRINT_RUNS runs, the peak VRAM use and ComfyUI RSS during the
+family's stage above that run's idle baseline (its lowest reading, before
+any model was loaded), and the largest of those is kept. Measuring from the
+baseline rather than from the stage's own start counts models loaded
+earlier, e.g. Flux during warm-up for the image stage. A family with no
+history, or one whose footprint is implausibly small, counts as not
+fitting, so switching to it always frees memory first, which is what the
+old restart achieved at a fraction of the cost.
+"""
+import time
+import asyncio
+import logging
+
+
+FOOTPRINT_RUNS = 10
+SAFETY_MARGIN = 1.1  # footprint headroom for activations and fragmentation
+RESERVE_MB = 512  # kept free for the driver, display and ffmpeg
+FREE_SETTLE_SECONDS = 30  # ComfyUI unloads between prompts, not on request
+MIN_FOOTPRINT_MB = 256  # less VRAM than this means the load wasn't seen
+STAGE_FAMILIES = {"video_chain": "video"}  # telemetry stages counted as another family
+
+
+def learn_footprints(runs=FOOTPRINT_RUNS):
+    """{stage: {"vram_mb": .., "ram_mb": ..}} from recorded telemetry."""
+    try:
+        import numpy as np
+        import telemetry
+
+        rows, labels = telemetry.load_samples()
+    except ImportError:
+        return {}
+    except Exception as e:
+        logging.warning(f"Could not read telemetry for memory footprints: {e}")
+        return {}
+
+    rises = {}
+    for run in np.unique(rows["run"])[-runs:]:
+        run_rows = rows[rows["run"] == run]
+        for field, key in (("vram_used_mb", "vram_mb"), ("comfy_rss_mb", "ram_mb")):
+            # NaN while ComfyUI was down, 0 RSS before it was started
+            readings = run_rows[np.isfinite(run_rows[field]) & (run_rows[field] > 0)]
+            if not len(readings):
+                continue
+            baseline = float(readings[field].min())
+            for stage in np.unique(readings["stage"]):
+                peak = float(readings[field][readings["stage"] == stage].max())
+                family = STAGE_FAMILIES.get(labels[stage], labels[stage])
+                rise = rises.setdefault(family, {"vram_mb": 0.0, "ram_mb": 0.0})
+                rise[key] = max(rise[key], peak - baseline)
+    return {
+        stage: rise for stage, rise in rises.items() if rise["vram_mb"] >= MIN_FOOTPRINT_MB
+    }
+
+
+def memory_state(stats):
+    """Free VRAM and RAM in MB from a /system_stats body."""
+    device = (stats.get("devices") or [{}])[0]
+    system = stats.get("system") or {}
+    return {
+        "vram_free_mb": device.get("vram_free", 0) / 1024**2,
+        "vram_total_mb": device.get("vram_total", 0) / 1024**2,
+        "ram_free_mb": system.get("ram_free", 0) / 1024**2,
+        "ram_total_mb": system.get("ram_total", 0) / 1024**2,
+    }
+
+
+class Admission:
+    def __init__(self, comfy, restart, footprints=None):
+        self.comfy = comfy
+        self.restart = restart
+        self.footprints = footprints
+        self.resident = None  # family whose models ComfyUI holds, as far as we know
+
+    def footprint(self, family):
+        if self.footprints is None:
+            self.footprints = learn_footprints()
+        return self.footprints.get(family)
+
+    def _fits(self, family, state):
+        need = self.footprint(family)
+        if not need:
+            return False
+        # A family that fills the card (SeedVR2 swapping blocks) only needs it empty
+        vram = min(need["vram_mb"] * SAFETY_MARGIN + RESERVE_MB, state["vram_total_mb"] * 0.9)
+        ram = min(need["ram_mb"] * SAFETY_MARGIN + RESERVE_MB, state["ram_total_mb"] * 0.9)
+        return state["vram_free_mb"] >= vram and state["ram_free_mb"] >= ram
+
+    async def _state(self):
+        return memory_state(await self.comfy.get_json("/system_stats", timeout=5))
+
+    async def admit(self, family):
+        """
+        Make room for a `family` job. Returns what it took: "resident",
+        "fits", "freed" or "restarted".
+        """
+        if family == self.resident:
+            return "resident"
+
+        state = await self._state()
+        if self._fits(family, state):
+            action = "fits"
+        else:
+            await self.comfy.post_json("/free", {"unload_models": True, "free_memory": True})
+            state = await self._wait_for_free(family)
+            # Without a footprint there is nothing to judge the result by;
+            # freeing is what the old unconditional restart achieved
+            if self.footprint(family) is None or self._fits(family, state):
+                action = "freed"
+            else:
+                logging.warning(
+                    f"{state['vram_free_mb']:.0f} MB VRAM free after /free, not enough for "
+                    f"{family} ({self.footprint(family)}); restarting ComfyUI"
+                )
+                await self.restart()
+                action = "restarted"
+
+        logging.info(
+            f"Admitted {family} job ({action}); was holding {self.resident}, "
+            f"{state['vram_free_mb']:.0f}/{state['vram_total_mb']:.0f} MB VRAM free"
+        )
+        self.resident = family
+        return action
+
+    async def _wait_for_free(self, family):
+        # /free is applied by ComfyUI's prompt worker once it is idle, so
+        # poll until the family fits or free VRAM stops rising
+        deadline = time.monotonic() + FREE_SETTLE_SECONDS
+        state = await self._state()
+        while time.monotonic() < deadline and not self._fits(family, state):
+            await asyncio.sleep(2)
+            latest = await self._state()
+            if latest["vram_free_mb"] <= state["vram_free_mb"]:
+                return latest
+            state = latest
+        return state
@@ -0,0 +1,239 @@
+"""
+Bookkeeping for everything the pipeline writes to disk.
+
+Each file is registered with a kind:
+
+    intermediate  images, raw and upscaled segments, extracted frames
+    input         links placed in the ComfyUI input folder
+    cache         upscaled reaction clips, kept while the disk budget allows
+    final         finished shorts, kept for FINAL_RETENTION_DAYS
+
+and the pipeline stages that still need it. Intermediates and inputs are
+deleted once no stage of the current run holds them (or, for earlier and
+crashed runs, after INTERMEDIATE_RETENTION_HOURS). Finals stay while their
+upload is queued. If the tracked files still exceed the disk budget, caches
+and leftover intermediates are evicted least recently used first.
+
+ComfyUI writes into runs/<run_id>/ below its output folder (see
+comfy_prefix), so one run's files never mix with another's.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+
+from metrics import RUN_ID
+
+
+MANIFEST_FILE = os.path.join(os.getcwd(), "outputs", "artefacts.json")
+DISK_BUDGET = 50 * 1024**3
+FINAL_RETENTION_DAYS = 14
+INTERMEDIATE_RETENTION_HOURS = 24  # time to look at what a failed run left behind
+
+KINDS = ("intermediate", "input", "cache", "final")
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _queued_uploads():
+    try:
+        import upload_queue
+
+        return {
+            j["video_path"]
+            for j in upload_queue.load_jobs()
+            if j["status"] in ("pending", "uploading")
+        }
+    except Exception as e:
+        logging.warning(f"Could not read the upload queue: {e}")
+        return None
+
+
+class ArtefactStore:
+    def __init__(
+        self,
+        manifest_path=MANIFEST_FILE,
+        run_roots=(),
+        budget_bytes=DISK_BUDGET,
+        final_retention_days=FINAL_RETENTION_DAYS,
+        run_id=RUN_ID,
+    ):
+        self.manifest_path = manifest_path
+        self.run_roots = list(run_roots)
+        self.budget_bytes = budget_bytes
+        self.final_retention = final_retention_days * 86400
+        self.run_id = run_id
+        self._items = None
+        self._lock = threading.RLock()
+
+    # MANIFEST
+
+    @property
+    def items(self):
+        if self._items is None:
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._items = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._items = {}
+        return self._items
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    # PLACEMENT
+
+    def comfy_prefix(self, name):
+        """A filename_prefix that keeps ComfyUI's output for this run together."""
+        return f"runs/{self.run_id}/{name}"
+
+    def run_dir(self, root):
+        path = os.path.join(root, "runs", self.run_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def link(self, src, dest_dir, name=None, kind="input", stages=()):
+        """
+        Make `src` available as dest_dir/name (default: its own name). A
+        hardlink costs no space or copy time; other filesystems get a copy.
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        dest = os.path.join(dest_dir, name or os.path.basename(src))
+        if os.path.abspath(dest) != os.path.abspath(src):
+            if os.path.lexists(dest):
+                os.remove(dest)  # stale link from an earlier run
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copy2(src, dest)
+        return self.add(dest, kind=kind, stages=stages)
+
+    # REFERENCES
+
+    def add(self, path, kind="intermediate", stages=()):
+        """Track `path` (again), held by `stages` of this run. Returns the path."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown artefact kind: {kind}")
+        path = os.path.abspath(path)
+        now = time.time()
+        with self._lock:
+            item = self.items.setdefault(
+                path, {"kind": kind, "run_id": self.run_id, "refs": [], "created": now}
+            )
+            if item["run_id"] != self.run_id:
+                # Picked up again by this run; older references are void
+                item["run_id"], item["refs"] = self.run_id, []
+            item["kind"] = kind
+            item["refs"] = sorted(set(item["refs"]) | set(stages))
+            item["size"] = _size(path)
+            item["last_access"] = now
+            self._save()
+        return path
+
+    def release_stage(self, stage):
+        """`stage` is finished with everything it held."""
+        with self._lock:
+            for item in self.items.values():
+                if stage in item["refs"]:
+                    item["refs"].remove(stage)
+            self._save()
+
+    def release(self, path):
+        """Nothing needs `path` any more (a rejected take, say)."""
+        with self._lock:
+            item = self.items.get(os.path.abspath(path))
+            if item:
+                item["refs"] = []
+                self._save()
+
+    # CLEANUP
+
+    def _delete(self, path, reason):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not delete {path}: {e}")
+            return 0
+        size = self.items.pop(path).get("size", 0)
+        logging.info(f"Deleted {reason} artefact {path} ({size:,}B)")
+        return size
+
+    def _prune_run_dirs(self):
+        for root in self.run_roots:
+            runs = os.path.join(root, "runs")
+            if not os.path.isdir(runs):
+                continue
+            for dirpath, _, _ in sorted(os.walk(runs), key=lambda w: -len(w[0])):
+                if dirpath != runs and not os.listdir(dirpath):
+                    os.rmdir(dirpath)
+
+    def collect(self):
+        """Apply retention, then the disk budget. Returns the bytes freed."""
+        now = time.time()
+        queued = _queued_uploads()
+        freed = 0
+
+        with self._lock:
+            for path, item in list(self.items.items()):
+                if not os.path.exists(path):
+                    del self.items[path]
+                    continue
+                if item["run_id"] == self.run_id and item["refs"]:
+                    continue
+                if queued is None or path in queued:
+                    continue
+
+                age = now - item["created"]
+                if item["kind"] in ("intermediate", "input"):
+                    if item["run_id"] == self.run_id or age > INTERMEDIATE_RETENTION_HOURS * 3600:
+                        freed += self._delete(path, item["kind"])
+                elif item["kind"] == "final" and age > self.final_retention:
+                    freed += self._delete(path, "expired final")
+
+            total = sum(item.get("size", 0) for item in self.items.values())
+            if total > self.budget_bytes:
+                # Least recently used first; finals are only removed by retention
+                evictable = sorted(
+                    (
+                        (item["last_access"], path)
+                        for path, item in self.items.items()
+                        if item["kind"] != "final"
+                        and not (item["run_id"] == self.run_id and item["refs"])
+                        and (queued is not None and path not in queued)
+                    ),
+                )
+                for _, path in evictable:
+                    if total <= self.budget_bytes:
+                        break
+                    size = self._delete(path, "over-budget")
+                    total -= size
+                    freed += size
+                if total > self.budget_bytes:
+                    logging.warning(
+                        f"Artefacts still use {total:,}B after eviction (budget {self.budget_bytes:,}B)"
+                    )
+
+            self._save()
+        self._prune_run_dirs()
+        logging.info(f"Artefact collection freed {freed:,}B")
+        return freed
+
+    def summary(self):
+        usage = {}
+        for item in self.items.values():
+            count, size = usage.get(item["kind"], (0, 0))
+            usage[item["kind"]] = (count + 1, size + item.get("size", 0))
+        return usage
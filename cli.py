@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Command line entry point for the content machine.
+
+    python cli.py run [--draft]         full nightly pipeline, or a cheap preview
+    python cli.py drafts                list drafts waiting for review
+    python cli.py promote RUN_ID        re-render a draft at full quality and upload
+    python cli.py generate-metadata     ask Ollama for prompts/title/tags
+    python cli.py upload-latest         upload the newest final short
+    python cli.py concat OUT IN [IN...] stitch clips with the pipeline settings
+    python cli.py upscale IN            run the SeedVR2 workflow on one clip
+    python cli.py images PROMPT...      batch starting images in one ComfyUI job
+    python cli.py assemble LAYOUT OUT   render a layout file from given clips
+    python cli.py status                are ComfyUI / Ollama up, what is queued
+    python cli.py uploads [--drain]     list or drain the upload queue
+    python cli.py reactions [--full]    rescan and summarise the reaction index
+    python cli.py artefacts [--collect] disk usage of tracked outputs, or clean up
+    python cli.py telemetry [--run ID]  peak/average resource use per stage
+    python cli.py durations             learned per-unit stage times behind timeouts/ETAs
+    python cli.py youtube-check [DOC]   build the YouTube client offline from a stored discovery doc
+
+Each command imports only what it needs, so quick operational commands
+don't pay for ffmpeg, websockets, Ollama or the Google API client.
+"""
+import sys
+import json
+import argparse
+
+
+def cmd_run(args):
+    import main
+
+    main.run(draft=args.draft)
+
+
+def cmd_drafts(args):
+    from run_manifest import list_manifests
+
+    for m in list_manifests(mode="draft"):
+        note = f" -> {m['promoted_by']}" if m.get("promoted_by") else ""
+        print(f"{m['run_id']}  {m['status']:<9}{note}  {m['meta']['title'][:60]}")
+        if m.get("output"):
+            print(f"    {m['output']}")
+
+
+def cmd_promote(args):
+    from run_manifest import load_manifest
+
+    try:
+        manifest = load_manifest(args.run_id)
+    except OSError:
+        print(f"No manifest for run {args.run_id}")
+        return 1
+    if manifest["mode"] != "draft":
+        print(f"Run {args.run_id} is not a draft")
+        return 1
+    if manifest["status"] != "draft" and not args.force:
+        print(f"Draft {args.run_id} is {manifest['status']}; use --force to render it again")
+        return 1
+
+    import main
+
+    main.run(promote=args.run_id)
+
+
+def cmd_generate_metadata(args):
+    from prompts import generate_full_video_metadata
+
+    meta = generate_full_video_metadata()
+    print(json.dumps(meta, indent=2, ensure_ascii=False))
+
+
+def cmd_upload_latest(args):
+    from upload import get_latest_final_video, upload_short
+
+    video_path = args.video or get_latest_final_video()
+    if not video_path:
+        print("No finished video found.")
+        return 1
+
+    if args.title:
+        meta = {"title": args.title, "description": args.description, "tags": args.tags}
+    else:
+        from prompts import generate_full_video_metadata
+
+        meta = generate_full_video_metadata()
+
+    print(f"Uploading: {video_path}")
+    print(f"Title: {meta['title']}")
+    upload_short(video_path, meta["title"], meta["description"], meta["tags"])
+
+
+def cmd_concat(args):
+    import asyncio
+    import main
+    from logs import stop_logging
+
+    main.init()
+    try:
+        size = tuple(int(x) for x in args.size.lower().split("x")) if args.size else None
+        asyncio.run(main.concat_videos(args.inputs, args.output, size=size))
+    finally:
+        stop_logging()
+    print(args.output)
+
+
+def cmd_assemble(args):
+    import os
+    import random
+    import asyncio
+    import timeline
+
+    sources = dict(s.split("=", 1) for s in args.source)
+    pool_dirs = dict(p.split("=", 1) for p in args.pool)
+
+    layout = timeline.load_timeline(args.layout)
+    pools = {}
+    for pool, count in timeline.pool_demand(layout).items():
+        if pool not in pool_dirs:
+            print(f"Layout needs {count} clips from pool {pool!r}; pass --pool {pool}=DIR")
+            return 1
+        clips = [
+            os.path.join(pool_dirs[pool], f)
+            for f in os.listdir(pool_dirs[pool])
+            if f.lower().endswith(".mp4")
+        ]
+        pools[pool] = random.sample(clips, count)
+
+    plan = asyncio.run(timeline.plan_timeline(layout, sources, pools=pools))
+    print(json.dumps(timeline.estimate_cost(plan), indent=2))
+    if args.dry_run:
+        print(" ".join(["ffmpeg", *timeline.build_ffmpeg_args(plan, args.output)]))
+        return
+
+    asyncio.run(timeline.render_timeline(plan, args.output))
+    print(args.output)
+
+
+def cmd_upscale(args):
+    import asyncio
+    import main
+    from logs import stop_logging
+
+    main.init()
+    try:
+        if not main.find_comfy_port():
+            print(f"ComfyUI is not answering on {main.COMFY_URL_BASE}")
+            return 1
+        main.use_external_comfyui()
+
+        async def upscale():
+            await main.comfy.start()
+            try:
+                return await main.upscale_video(args.input, kind="final")
+            finally:
+                await main.comfy.close()
+
+        print(asyncio.run(upscale()))
+    finally:
+        stop_logging()
+
+
+def cmd_images(args):
+    import asyncio
+    import main
+    from logs import stop_logging
+
+    main.init()
+    try:
+        if not main.find_comfy_port():
+            print(f"ComfyUI is not answering on {main.COMFY_URL_BASE}")
+            return 1
+        main.use_external_comfyui()
+
+        async def images():
+            await main.comfy.start()
+            try:
+                return await main.generate_images(
+                    args.prompts, per_prompt=args.per_prompt, kind="final"
+                )
+            finally:
+                await main.comfy.close()
+
+        results = asyncio.run(images())
+    finally:
+        stop_logging()
+    for prompt, paths in zip(args.prompts, results):
+        print(f"{prompt[:60]}:")
+        for path in paths:
+            print(f"  {path}")
+
+
+def cmd_status(args):
+    import config
+    from probes import get_session, http_ok
+    from upload import get_latest_final_video
+
+    comfy_up = http_ok(f"{config.COMFY_URL_BASE}/system_stats", timeout=1)
+    print(f"ComfyUI: {'up' if comfy_up else 'down'} ({config.COMFY_URL_BASE})")
+    if comfy_up:
+        try:
+            q = get_session().get(f"{config.COMFY_URL_BASE}/queue", timeout=2).json()
+            print(
+                f"  queue: {len(q.get('queue_running', []))} running, "
+                f"{len(q.get('queue_pending', []))} pending"
+            )
+        except Exception as e:
+            print(f"  queue: unavailable ({e})")
+
+    ollama_up = http_ok(f"{config.OLLAMA_URL_BASE}/api/version", timeout=1)
+    print(f"Ollama: {'up' if ollama_up else 'down'} ({config.OLLAMA_URL_BASE})")
+
+    print(f"Latest final video: {get_latest_final_video() or 'none'}")
+
+
+def cmd_uploads(args):
+    import upload_queue
+
+    if args.drain:
+        for job in upload_queue.process_queue(max_concurrent=args.concurrency):
+            print(f"{job['id']}: {job['status']} {job.get('video_id') or job.get('error') or ''}")
+
+    for job in upload_queue.load_jobs():
+        when = job.get("publish_at") or "immediately"
+        print(f"{job['id']}  {job['status']:<9} attempts={job['attempts']}  publish={when}  {job['title'][:60]}")
+    print(upload_queue.summary())
+
+
+def cmd_reactions(args):
+    import asyncio
+    from reaction_index import ReactionIndex
+
+    index = ReactionIndex()
+    try:
+        print(asyncio.run(index.rescan(full=args.full)))
+        for pool in index.summary():
+            print(
+                f"pool {pool['pool']}: {pool['clips']} clips ({pool['unreadable']} unreadable, "
+                f"{pool['cached']} upscaled), uses {pool['min_uses']}-{pool['max_uses']}"
+            )
+    finally:
+        index.close()
+
+
+def cmd_artefacts(args):
+    import config
+    from artefacts import ArtefactStore
+
+    artefacts = ArtefactStore(
+        config.ARTEFACTS_FILE,
+        run_roots=(config.OUTPUT_DIR,),
+        budget_bytes=config.DISK_BUDGET_GB * 1024**3,
+    )
+    if args.collect:
+        print(f"Freed {artefacts.collect() / 1024**2:.0f} MB")
+    for kind, (count, size) in sorted(artefacts.summary().items()):
+        print(f"{kind:<13} {count:>5} files  {size / 1024**2:>10.0f} MB")
+    print(f"budget        {config.DISK_BUDGET_GB} GB")
+
+
+def cmd_telemetry(args):
+    import telemetry
+
+    rows, labels = telemetry.load_samples(run_id=args.run)
+    if not len(rows):
+        print("No telemetry recorded" + (f" for run {args.run}" if args.run else ""))
+        return 1
+    runs = sorted({labels[r] for r in set(rows["run"].tolist())})
+    print(f"{len(rows)} samples from {len(runs)} run(s): {', '.join(runs[-5:])}")
+    print(telemetry.format_report(telemetry.summarise(rows, labels)))
+
+
+def cmd_durations(args):
+    import durations
+
+    rows = durations.get_model().summary()
+    if not rows:
+        print("No stage history with recorded work yet")
+        return 1
+    for row in rows:
+        enough = "" if row["samples"] >= durations.MIN_SAMPLES else "  (default timeout until more runs)"
+        print(
+            f"{row['stage']:<8} {row['key']:<40} n={row['samples']:<3} "
+            f"p50 {row['p50']:.3f}s/unit  p95 {row['p95']:.3f}s/unit{enough}"
+        )
+
+
+def cmd_youtube_check(args):
+    from upload import DISCOVERY_FILE, check_offline
+
+    path = args.discovery or DISCOVERY_FILE
+    try:
+        check_offline(path)
+    except Exception as e:
+        print(f"Offline YouTube client check failed: {e}")
+        return 1
+    print(f"YouTube client builds offline from {path}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="content_machine")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run the full pipeline")
+    p.add_argument("--draft", action="store_true", help="reduced preview, no upscale or upload")
+    p.set_defaults(func=cmd_run)
+
+    sub.add_parser("drafts", help="list draft runs").set_defaults(func=cmd_drafts)
+
+    p = sub.add_parser("promote", help="render an approved draft at full quality")
+    p.add_argument("run_id")
+    p.add_argument("--force", action="store_true", help="promote even if already promoted")
+    p.set_defaults(func=cmd_promote)
+
+    sub.add_parser(
+        "generate-metadata", help="generate prompts, title, description and tags"
+    ).set_defaults(func=cmd_generate_metadata)
+
+    p = sub.add_parser("upload-latest", help="upload the newest final short")
+    p.add_argument("--video", help="upload this file instead of the newest final_*.mp4")
+    p.add_argument("--title", help="skip metadata generation and use this title")
+    p.add_argument("--description", default="")
+    p.add_argument("--tags", nargs="*", default=None)
+    p.set_defaults(func=cmd_upload_latest)
+
+    p = sub.add_parser("concat", help="stitch clips together")
+    p.add_argument("output")
+    p.add_argument("inputs", nargs="+")
+    p.add_argument("--size", help="assemble at WxH, e.g. 1080x1920")
+    p.set_defaults(func=cmd_concat)
+
+    p = sub.add_parser("assemble", help="render a timeline layout")
+    p.add_argument("layout", help="layout JSON, e.g. layouts/reaction_sandwich.json")
+    p.add_argument("output")
+    p.add_argument("--source", action="append", default=[], metavar="NAME=PATH")
+    p.add_argument("--pool", action="append", default=[], metavar="NAME=DIR")
+    p.add_argument("--dry-run", action="store_true", help="validate and estimate only")
+    p.set_defaults(func=cmd_assemble)
+
+    p = sub.add_parser("upscale", help="upscale one clip on a running ComfyUI")
+    p.add_argument("input")
+    p.set_defaults(func=cmd_upscale)
+
+    p = sub.add_parser("images", help="render starting images for several prompts at once")
+    p.add_argument("prompts", nargs="+")
+    p.add_argument("--per-prompt", type=int, default=1, help="seeds per prompt (latent batch size)")
+    p.set_defaults(func=cmd_images)
+
+    sub.add_parser("status", help="show service and queue status").set_defaults(
+        func=cmd_status
+    )
+
+    p = sub.add_parser("uploads", help="list or drain the upload queue")
+    p.add_argument("--drain", action="store_true", help="upload every due job now")
+    p.add_argument("--concurrency", type=int, default=2)
+    p.set_defaults(func=cmd_uploads)
+
+    p = sub.add_parser("reactions", help="rescan and summarise the reaction library")
+    p.add_argument("--full", action="store_true", help="re-stat every clip, not just changed pools")
+    p.set_defaults(func=cmd_reactions)
+
+    p = sub.add_parser("artefacts", help="show or clean up tracked pipeline outputs")
+    p.add_argument("--collect", action="store_true", help="apply retention and the disk budget now")
+    p.set_defaults(func=cmd_artefacts)
+
+    p = sub.add_parser("telemetry", help="summarise sampled CPU/RAM/VRAM/disk use per stage")
+    p.add_argument("--run", help="only this run id (default: every run in the buffer)")
+    p.set_defaults(func=cmd_telemetry)
+
+    sub.add_parser(
+        "durations", help="show the stage duration model behind timeouts and ETAs"
+    ).set_defaults(func=cmd_durations)
+
+    p = sub.add_parser("youtube-check", help="build the YouTube client without network access")
+    p.add_argument("discovery", nargs="?", help="discovery document (default: the cached one)")
+    p.set_defaults(func=cmd_youtube_check)
+
+    return parser
+
+
+def cli(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
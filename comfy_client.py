@@ -0,0 +1,658 @@
+import os
+import json
+import time
+import uuid
+import random
+import struct
+import asyncio
+import logging
+
+from probes import get_session
+from workflows import static_signature
+
+
+STALL_SECONDS = 600  # default silence allowed from a running node
+STALL_CHECK_INTERVAL = 10
+INTERRUPT_GRACE = 10  # seconds to wait for ComfyUI's account of a prompt we interrupted
+REPORT_HISTORY = 16  # node reports kept for prompts that are over
+
+# From execution_error events and history messages
+ERROR_DETAILS = ("node_id", "node_type", "exception_type", "exception_message", "traceback")
+
+# Binary websocket frames: a big-endian event type, then its payload
+PREVIEW_IMAGE = 1  # payload: image format (1 JPEG, 2 PNG), image bytes
+PREVIEW_IMAGE_WITH_METADATA = 4  # payload: JSON length, JSON (prompt_id, node_id..), image bytes
+IMAGE_FORMATS = {1: "jpeg", 2: "png"}
+
+
+class ComfyError(RuntimeError):
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details or {}
+
+
+class ComfyStalled(ComfyError):
+    """A running prompt went quiet for longer than its node's threshold and was interrupted."""
+
+
+class ComfyAborted(ComfyError):
+    """A preview hook judged a running prompt a lost cause and it was interrupted."""
+
+
+def _error_details(data):
+    return {key: data.get(key) for key in ERROR_DETAILS}
+
+
+class ComfyClient:
+    """
+    Async ComfyUI client: HTTP for submitting work plus one long-lived
+    websocket that resolves each prompt as soon as ComfyUI reports it done.
+
+    Every websocket message is also handed to the registered listeners as
+    (msg_type, data), so progress reporting and other observers share the
+    same connection.
+
+    Output nodes of a running prompt can be awaited individually
+    (wait_output), so a graph that saves several results hands each one
+    over as soon as its node has run rather than when the whole prompt ends.
+
+    For every prompt the client also records which nodes ComfyUI served
+    from its cache and which it executed (node_report), and warns when a
+    loader's inputs differ from the last job that used the same node id,
+    since that throws the loaded model out of the cache.
+
+    A watchdog follows the last progress/executing event of each running
+    prompt. When the current node has been silent for longer than its
+    threshold (`stall_thresholds` by class_type, else STALL_SECONDS) the
+    prompt is interrupted and its waiters get ComfyStalled; resubmitting
+    is up to the caller. Before the waiters are failed, the node and
+    traceback ComfyUI reports for the interruption are added to the
+    error's details.
+
+    Binary preview frames are decoded and the newest one per prompt is
+    kept (latest_preview), tagged with the node and sampler step. Preview
+    hooks (add_preview_hook) get each new step's preview in a worker
+    thread; one returning a reason aborts the prompt with ComfyAborted.
+    """
+
+    def __init__(self, base_url, ws_url, output_dir, stall_thresholds=None):
+        self.base_url = base_url
+        self.ws_url = ws_url
+        self.output_dir = output_dir
+        self.client_id = uuid.uuid4().hex
+        self.listeners = []
+        self._pending = {}
+        self._outputs = {}  # prompt_id -> {node_id: output} seen so far
+        self._watchers = {}  # prompt_id -> {node_id: future}
+        self._node_runs = {}  # prompt_id -> {"cached": [...], "executed": [...]}
+        self._reports = {}  # the same for the last REPORT_HISTORY prompts that are over
+        self._static = {}  # node_id -> signature of the last loader submitted there
+        self._classes = {}  # prompt_id -> {node_id: class_type}
+        self._activity = {}  # prompt_id -> (last event time, current node id) once running
+        self.stall_thresholds = dict(stall_thresholds or {})
+        self.preview_hooks = []
+        self._previews = {}  # prompt_id -> newest preview
+        self._progress = {}  # prompt_id -> (node_id, step, steps)
+        self._running = None  # prompt ComfyUI last reported executing
+        self._checked = {}  # prompt_id -> (node_id, step) last given to the hooks
+        self._checking = set()
+        self._failing = {}  # prompt_id -> (error, reported event) while being interrupted
+        self._task = None
+        self._watchdog = None
+        self._tasks = set()  # background work started from events, kept referenced until done
+        self._connected = asyncio.Event()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def add_preview_hook(self, callback):
+        """`callback(preview) -> reason or None`, run off the event loop."""
+        self.preview_hooks.append(callback)
+
+    # CONNECTION
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen(), name="comfy-ws")
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch_stalls(), name="comfy-watchdog")
+
+    async def close(self):
+        for task in (self._task, self._watchdog, *self._tasks):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._watchdog = None
+        self._tasks.clear()
+        self._connected.clear()
+
+    def _spawn(self, coro):
+        # The loop only holds weak references to tasks; keep ours alive
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"ComfyUI background task failed: {task.exception()!r}")
+
+    async def _listen(self):
+        import websockets
+
+        url = f"{self.ws_url}?clientId={self.client_id}"
+        failures = 0
+
+        while True:
+            try:
+                async with websockets.connect(
+                    url, ping_interval=20, ping_timeout=10, close_timeout=10, max_size=None
+                ) as ws:
+                    logging.info("ComfyUI websocket connected")
+                    self._connected.set()
+                    failures = 0
+                    # Events were lost while disconnected; don't count that as silence
+                    now = time.monotonic()
+                    for prompt_id, (_, node_id) in self._activity.items():
+                        self._activity[prompt_id] = (now, node_id)
+                    # Anything that finished while we were disconnected
+                    for prompt_id in list(self._pending):
+                        await self._resolve_from_history(prompt_id)
+
+                    async for raw in ws:
+                        if isinstance(raw, bytes):
+                            self._on_binary(raw)
+                            continue
+                        try:
+                            msg = json.loads(raw)
+                        except json.JSONDecodeError:
+                            logging.warning(f"Unparseable websocket message: {raw[:200]}")
+                            continue
+                        self._dispatch(msg.get("type"), msg.get("data") or {})
+
+            except asyncio.CancelledError:
+                raise
+            except (websockets.exceptions.WebSocketException, OSError) as e:
+                self._connected.clear()
+                failures += 1
+                delay = min(0.5 * (2 ** (failures - 1)), 30) * random.uniform(0.75, 1.25)
+                logging.warning(
+                    f"ComfyUI websocket unavailable (attempt {failures}): {e}; retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+    def _dispatch(self, msg_type, data):
+        for callback in self.listeners:
+            try:
+                callback(msg_type, data)
+            except Exception as e:
+                logging.warning(f"Websocket listener failed on {msg_type}: {e}")
+
+        prompt_id = data.get("prompt_id")
+        future = self._pending.get(prompt_id)
+        if future is None or future.done():
+            return
+
+        if msg_type in ("execution_start", "executing", "progress", "executed", "execution_cached"):
+            _, node_id = self._activity.get(prompt_id, (None, None))
+            if msg_type in ("executing", "progress") and data.get("node") is not None:
+                node_id = str(data["node"])
+            self._activity[prompt_id] = (time.monotonic(), node_id)
+            self._running = prompt_id
+        if msg_type == "progress":
+            self._progress[prompt_id] = (
+                str(data.get("node")) if data.get("node") is not None else None,
+                data.get("value"),
+                data.get("max"),
+            )
+
+        runs = self._node_runs.get(prompt_id)
+        if msg_type == "execution_cached":
+            runs["cached"].extend(str(n) for n in data.get("nodes") or [])
+        elif msg_type == "executing" and data.get("node") is not None:
+            if str(data["node"]) not in runs["executed"]:
+                runs["executed"].append(str(data["node"]))
+
+        if msg_type == "executed" and data.get("node") is not None:
+            node_id = str(data["node"])
+            output = data.get("output") or {}
+            self._outputs.setdefault(prompt_id, {})[node_id] = output
+            watcher = self._watchers.get(prompt_id, {}).get(node_id)
+            if watcher and not watcher.done():
+                watcher.set_result(output)
+
+        if msg_type == "execution_success" or (
+            msg_type == "executing" and data.get("node") is None
+        ):
+            self._spawn(self._resolve_from_history(prompt_id, attempts=20))
+        elif msg_type in ("execution_error", "execution_interrupted") and prompt_id in self._failing:
+            # Our own interrupt: what ComfyUI says about it goes into our error
+            error, reported = self._failing[prompt_id]
+            for key, value in _error_details(data).items():
+                if value is not None:
+                    error.details.setdefault(key, value)
+            error.details["comfy_event"] = msg_type
+            reported.set()
+        elif msg_type == "execution_error":
+            future.set_exception(
+                ComfyError(
+                    f"Node {data.get('node_id')} ({data.get('node_type')}) failed: "
+                    f"{(data.get('exception_message') or '').strip()}",
+                    details=_error_details(data),
+                )
+            )
+        elif msg_type == "execution_interrupted":
+            future.set_exception(ComfyError(f"Prompt {prompt_id} was interrupted"))
+
+    # HTTP
+
+    async def get_json(self, path, timeout=10):
+        r = await asyncio.to_thread(
+            get_session().get, f"{self.base_url}{path}", timeout=timeout
+        )
+        r.raise_for_status()
+        return r.json()
+
+    async def post_json(self, path, payload, timeout=30):
+        r = await asyncio.to_thread(
+            get_session().post, f"{self.base_url}{path}", json=payload, timeout=timeout
+        )
+        if r.status_code != 200:
+            raise ComfyError(f"POST {path} failed ({r.status_code}): {r.text[:500]}")
+        return r.json() if r.content else {}
+
+    async def _resolve_from_history(self, prompt_id, attempts=1, delay=0.25):
+        # ComfyUI announces completion slightly before the history entry is
+        # stored, so callers reacting to an event retry a few times
+        future = self._pending.get(prompt_id)
+        entry = None
+        for attempt in range(attempts):
+            if future is None or future.done():
+                return
+            try:
+                history = await self.get_json(f"/history/{prompt_id}")
+                entry = history.get(prompt_id)
+            except Exception as e:
+                logging.warning(f"Could not fetch history for {prompt_id}: {e}")
+            if entry:
+                break
+            if attempt < attempts - 1:
+                await asyncio.sleep(delay)
+
+        # An interrupt of ours is failed by _fail_and_interrupt, with its own error
+        if not entry or future.done() or prompt_id in self._failing:
+            return
+
+        status = entry.get("status", {})
+        if status.get("status_str") == "error":
+            # messages is a list of [event type, data] pairs
+            error = next(
+                (m[1] for m in status.get("messages") or [] if m and m[0] == "execution_error"),
+                None,
+            )
+            future.set_exception(
+                ComfyError(
+                    f"ComfyUI prompt {prompt_id} failed: {status.get('messages')}",
+                    details=_error_details(error) if error else None,
+                )
+            )
+        else:
+            future.set_result(entry)
+
+    # JOBS
+
+    async def wait_connected(self, timeout=30):
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def submit(self, workflow):
+        """Queue a workflow and return its prompt_id."""
+        # Make sure we are listening before the job can start, otherwise its
+        # events go nowhere and we fall back to polling /history
+        if not await self.wait_connected():
+            logging.warning("ComfyUI websocket not connected; relying on /history polling")
+        self._check_static(workflow)
+        response = await self.post_json(
+            "/prompt", {"prompt": workflow, "client_id": self.client_id}
+        )
+        prompt_id = response["prompt_id"]
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: self._settle_watchers(prompt_id, f))
+        future.add_done_callback(lambda f: self._log_node_report(prompt_id))
+        future.add_done_callback(lambda f: self._forget_activity(prompt_id))
+        self._pending[prompt_id] = future
+        self._classes[prompt_id] = {nid: node.get("class_type") for nid, node in workflow.items()}
+        self._node_runs[prompt_id] = {"cached": [], "executed": []}
+        logging.info(f"Queued prompt {prompt_id}")
+        return prompt_id
+
+    # STALL WATCHDOG
+
+    def _forget_activity(self, prompt_id):
+        for state in (self._activity, self._classes, self._previews, self._progress, self._checked):
+            state.pop(prompt_id, None)
+
+    def stall_threshold(self, prompt_id, node_id):
+        class_type = self._classes.get(prompt_id, {}).get(node_id)
+        return self.stall_thresholds.get(class_type, STALL_SECONDS)
+
+    async def _watch_stalls(self):
+        while True:
+            await asyncio.sleep(STALL_CHECK_INTERVAL)
+            if not self._connected.is_set():
+                continue
+            now = time.monotonic()
+            for prompt_id, (last, node_id) in list(self._activity.items()):
+                future = self._pending.get(prompt_id)
+                if future is None or future.done() or prompt_id in self._failing:
+                    continue
+                silent = now - last
+                if silent > self.stall_threshold(prompt_id, node_id):
+                    await self._stalled(prompt_id, node_id, silent)
+
+    async def _stalled(self, prompt_id, node_id, silent):
+        class_type = self._classes.get(prompt_id, {}).get(node_id)
+        message = (
+            f"Prompt {prompt_id} stalled: node {node_id} ({class_type}) silent for {silent:.0f}s"
+        )
+        logging.error(message)
+        await self._fail_and_interrupt(
+            prompt_id,
+            ComfyStalled(
+                message,
+                details={"node_id": node_id, "node_type": class_type, "silent": round(silent)},
+            ),
+        )
+
+    async def _fail_and_interrupt(self, prompt_id, error):
+        future = self._pending.get(prompt_id)
+        if future is None or future.done() or prompt_id in self._failing:
+            return
+        # Interrupt first and give ComfyUI a moment to say where it stopped;
+        # _dispatch merges that into the error instead of failing the prompt
+        reported = asyncio.Event()
+        self._failing[prompt_id] = (error, reported)
+        try:
+            await self.interrupt(prompt_id)
+            try:
+                await asyncio.wait_for(reported.wait(), timeout=INTERRUPT_GRACE)
+            except asyncio.TimeoutError:
+                logging.warning(f"ComfyUI did not report interrupting {prompt_id} within {INTERRUPT_GRACE}s")
+        finally:
+            self._failing.pop(prompt_id, None)
+        if not future.done():
+            future.set_exception(error)
+            future.exception()
+
+    # PREVIEWS
+
+    def latest_preview(self, prompt_id):
+        """
+        The newest preview of a running prompt: {"image": bytes, "format",
+        "prompt_id", "node_id", "class_type", "step", "steps", "time"}.
+        """
+        return self._previews.get(prompt_id)
+
+    def _on_binary(self, raw):
+        if len(raw) < 8:
+            return
+        (event,) = struct.unpack(">I", raw[:4])
+        if event == PREVIEW_IMAGE:
+            (image_format,) = struct.unpack(">I", raw[4:8])
+            meta, image = {}, raw[8:]
+            image_format = IMAGE_FORMATS.get(image_format, "unknown")
+        elif event == PREVIEW_IMAGE_WITH_METADATA:
+            (size,) = struct.unpack(">I", raw[4:8])
+            try:
+                meta = json.loads(raw[8 : 8 + size])
+            except ValueError:
+                logging.warning("Unparseable preview metadata")
+                return
+            image = raw[8 + size :]
+            image_format = str(meta.get("image_type", "unknown")).rpartition("/")[2]
+        else:
+            return  # raw previews and text aren't used
+
+        # Plain previews don't say whose they are: the prompt running now
+        prompt_id = meta.get("prompt_id") or self._running
+        future = self._pending.get(prompt_id)
+        if future is None or future.done():
+            return
+        node_id, step, steps = self._progress.get(prompt_id, (None, None, None))
+        node_id = meta.get("node_id") or node_id or self._activity.get(prompt_id, (None, None))[1]
+        node_id = str(node_id) if node_id is not None else None
+        preview = {
+            "image": image,
+            "format": image_format,
+            "prompt_id": prompt_id,
+            "node_id": node_id,
+            "class_type": self._classes.get(prompt_id, {}).get(node_id),
+            "step": step,
+            "steps": steps,
+            "time": time.time(),
+        }
+        self._previews[prompt_id] = preview
+
+        # One check per sampler step, never two at once for a prompt
+        if (
+            self.preview_hooks
+            and prompt_id not in self._checking
+            and self._checked.get(prompt_id) != (node_id, step)
+        ):
+            self._checked[prompt_id] = (node_id, step)
+            self._checking.add(prompt_id)
+            self._spawn(self._check_preview(preview))
+
+    async def _check_preview(self, preview):
+        prompt_id = preview["prompt_id"]
+        try:
+            for hook in self.preview_hooks:
+                reason = await asyncio.to_thread(hook, preview)
+                if reason:
+                    message = (
+                        f"Prompt {prompt_id} aborted at step {preview['step']}/{preview['steps']} "
+                        f"of node {preview['node_id']} ({preview['class_type']}): {reason}"
+                    )
+                    logging.warning(message)
+                    await self._fail_and_interrupt(
+                        prompt_id,
+                        ComfyAborted(
+                            message,
+                            details={
+                                "node_id": preview["node_id"],
+                                "node_type": preview["class_type"],
+                                "step": preview["step"],
+                                "reason": reason,
+                            },
+                        ),
+                    )
+                    return
+        except Exception as e:
+            logging.warning(f"Preview hook failed for {prompt_id}: {e}")
+        finally:
+            self._checking.discard(prompt_id)
+
+    def _check_static(self, workflow):
+        signature = static_signature(workflow)
+        changed = sorted(
+            nid for nid, sig in signature.items() if self._static.get(nid, sig) != sig
+        )
+        if changed:
+            logging.warning(
+                f"Loader node(s) {', '.join(changed)} differ from the previous job; "
+                "ComfyUI will load them again"
+            )
+        self._static.update(signature)
+
+    def node_report(self, prompt_id):
+        """{"cached": [...], "executed": [...]} node ids of a prompt so far."""
+        runs = (
+            self._node_runs.get(prompt_id)
+            or self._reports.get(prompt_id)
+            or {"cached": [], "executed": []}
+        )
+        return {"cached": list(runs["cached"]), "executed": list(runs["executed"])}
+
+    def _log_node_report(self, prompt_id):
+        report = self.node_report(prompt_id)
+        # Finished prompts keep only their report, and only the last few
+        self._node_runs.pop(prompt_id, None)
+        self._reports[prompt_id] = report
+        for old in list(self._reports)[:-REPORT_HISTORY]:
+            del self._reports[old]
+        logging.info(
+            f"Prompt {prompt_id}: {len(report['cached'])} node(s) cached, "
+            f"{len(report['executed'])} executed ({', '.join(report['executed']) or 'none'})"
+        )
+
+    def _settle_watchers(self, prompt_id, future):
+        # The history entry has every output, including ones whose executed
+        # event was missed; anything still unresolved now never will be
+        error = future.exception() if not future.cancelled() else ComfyError(
+            f"Prompt {prompt_id} was cancelled"
+        )
+        # Outputs saved before a failure are still good
+        outputs = dict(self._outputs.get(prompt_id, {}))
+        if not error:
+            outputs.update(future.result().get("outputs", {}))
+        for node_id, watcher in self._watchers.pop(prompt_id, {}).items():
+            if watcher.done():
+                continue
+            if node_id in outputs:
+                watcher.set_result(outputs[node_id])
+            elif error:
+                watcher.set_exception(error)
+                watcher.exception()
+            else:
+                watcher.set_exception(
+                    ComfyError(f"Prompt {prompt_id} finished without output from node {node_id}")
+                )
+                watcher.exception()
+
+    async def wait(self, prompt_id, timeout=None, poll_interval=30):
+        """
+        Wait for a submitted prompt and return its history entry. Completion
+        normally arrives over the websocket; /history is also checked every
+        `poll_interval` seconds in case an event was missed.
+        """
+        future = self._pending[prompt_id]
+
+        async def backstop():
+            while not future.done():
+                await self._resolve_from_history(prompt_id)
+                await asyncio.sleep(poll_interval)
+
+        poller = asyncio.create_task(backstop())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"ComfyUI prompt {prompt_id} did not finish within {timeout}s")
+        finally:
+            poller.cancel()
+            if future.done():
+                self.release(prompt_id)
+
+    async def wait_output(self, prompt_id, node_id, timeout=None, poll_interval=30):
+        """
+        Wait for one output node of a submitted prompt and return its output
+        ({"images": [...], ...}), while the rest of the prompt keeps running.
+        """
+        node_id = str(node_id)
+        future = self._pending.get(prompt_id)
+        if future is None:
+            raise ComfyError(f"Prompt {prompt_id} is not pending")
+        loop = asyncio.get_running_loop()
+        if future.done():
+            # Already over: take the output from its history entry
+            watcher = loop.create_future()
+            self._watchers[prompt_id] = {node_id: watcher}
+            self._settle_watchers(prompt_id, future)
+        else:
+            watcher = self._watchers.setdefault(prompt_id, {}).get(node_id)
+            if watcher is None:
+                watcher = loop.create_future()
+                self._watchers[prompt_id][node_id] = watcher
+                seen = self._outputs.get(prompt_id, {})
+                if node_id in seen:
+                    watcher.set_result(seen[node_id])
+
+        async def backstop():
+            while not future.done():
+                await self._resolve_from_history(prompt_id)
+                await asyncio.sleep(poll_interval)
+
+        poller = asyncio.create_task(backstop())
+        try:
+            return await asyncio.wait_for(asyncio.shield(watcher), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"ComfyUI prompt {prompt_id} produced no output on node {node_id} within {timeout}s"
+            )
+        finally:
+            poller.cancel()
+            # A failed prompt stays until cancel(), so its other outputs
+            # can still be asked for and fail the same way
+            if (
+                future.done()
+                and not future.cancelled()
+                and future.exception() is None
+                and not self._watchers.get(prompt_id)
+            ):
+                self.release(prompt_id)
+
+    async def interrupt(self, prompt_id=None):
+        """Stop the prompt ComfyUI is executing (only `prompt_id`, if given)."""
+        try:
+            await self.post_json("/interrupt", {"prompt_id": prompt_id} if prompt_id else {})
+        except Exception as e:
+            logging.warning(f"Could not interrupt ComfyUI: {e}")
+
+    async def cancel(self, prompt_ids):
+        """Drop queued prompts that haven't started; their waiters get a ComfyError."""
+        prompt_ids = [p for p in prompt_ids if p in self._pending]
+        if not prompt_ids:
+            return
+        try:
+            await self.post_json("/queue", {"delete": prompt_ids})
+        except Exception as e:
+            logging.warning(f"Could not remove {prompt_ids} from the ComfyUI queue: {e}")
+        for prompt_id in prompt_ids:
+            self.release(prompt_id, reason="cancelled")
+
+    def release(self, prompt_id, reason="released"):
+        """
+        Forget a prompt nobody will wait on any more, e.g. a chain whose
+        last output has been collected. If it hasn't finished, its waiters
+        get a ComfyError; its node report stays available.
+        """
+        self._outputs.pop(prompt_id, None)
+        future = self._pending.pop(prompt_id, None)
+        if future is not None and not future.done():
+            future.set_exception(ComfyError(f"Prompt {prompt_id} was {reason}"))
+            future.exception()  # nobody may be waiting on it
+
+    def output_files(self, entry, node_id=None):
+        """Absolute paths of the files a finished prompt wrote to the output folder."""
+        paths = []
+        for nid, node_output in entry.get("outputs", {}).items():
+            if node_id is not None and str(nid) != str(node_id):
+                continue
+            for items in node_output.values():
+                if not isinstance(items, list):
+                    continue
+                for item in items:
+                    if not isinstance(item, dict) or "filename" not in item:
+                        continue
+                    if item.get("type", "output") != "output":
+                        continue
+                    paths.append(
+                        os.path.join(self.output_dir, item.get("subfolder", ""), item["filename"])
+                    )
+        return paths
@@ -0,0 +1,20 @@
+"""
+Where the services listen and where files live: the settings shared by the
+pipeline (main.py) and the quick CLI commands, kept free of imports so
+reading them costs nothing. Pipeline tuning stays in main.py.
+"""
+import os
+
+
+PORT = 8000
+COMFY_URL_BASE = f"http://127.0.0.1:{PORT}"
+WS_URL = f"ws://127.0.0.1:{PORT}/ws"
+OLLAMA_URL_BASE = "http://127.0.0.1:11434"
+PATH_TO_COMFY = r"C:\Users\User\AppData\Local\Programs\ComfyUI\ComfyUI.exe"
+PATH_TO_OLLAMA = r"C:\Users\User\AppData\Local\Programs\Ollama\ollama.exe"
+
+OUTPUT_DIR = os.path.expanduser("~/Documents/ComfyUI/output")
+COMFY_INPUT_DIR = os.path.expanduser("~/Documents/ComfyUI/input")
+PROJECT_OUTPUT = os.path.join(os.getcwd(), "outputs")
+ARTEFACTS_FILE = os.path.join(PROJECT_OUTPUT, "artefacts.json")
+DISK_BUDGET_GB = 50  # finals, run intermediates and the reaction cache together
@@ -0,0 +1,123 @@
+"""
+Stage durations learned from past runs.
+
+Spans that call `budget` record what they processed: a key naming the kind
+of job (workflow and resolution, say) and how many units of work it was
+(images, frames, estimated encode seconds). From metrics/spans.jsonl the
+model keeps the seconds per unit of the last HISTORY_LIMIT successful
+spans for each (stage, key), and derives
+
+    timeout  TIMEOUT_PERCENTILE of that rate x units x TIMEOUT_MARGIN
+    ETA      the median rate x units
+
+Until a key has MIN_SAMPLES observations the caller's default applies, so
+a new workflow or resolution starts with the old fixed limits. Only the
+newest SPAN_WINDOW spans are read, and the model is rebuilt only when the
+file has changed since.
+"""
+import os
+import logging
+
+from metrics import SPANS_FILE, current_span, load_spans
+
+
+HISTORY_LIMIT = 50
+MIN_SAMPLES = 5
+TIMEOUT_PERCENTILE = 0.95
+TIMEOUT_MARGIN = 1.5
+MIN_TIMEOUT = 60  # seconds; queue hiccups and model loads on short jobs
+SPAN_WINDOW = 5000  # newest spans read from the history; it is never truncated
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+class DurationModel:
+    def __init__(self, spans):
+        self.rates = {}
+        for s in spans:
+            if s.get("status") != "ok" or not s.get("units") or s.get("key") is None:
+                continue
+            self.rates.setdefault((s["stage"], s["key"]), []).append(s["duration"] / s["units"])
+        for key, rates in self.rates.items():
+            self.rates[key] = rates[-HISTORY_LIMIT:]
+
+    def _rates(self, stage, key):
+        rates = self.rates.get((stage, key), [])
+        return rates if len(rates) >= MIN_SAMPLES else None
+
+    def timeout(self, stage, key, units=1, default=None, floor=MIN_TIMEOUT):
+        rates = self._rates(stage, key)
+        if rates is None:
+            return default
+        return max(_quantile(rates, TIMEOUT_PERCENTILE) * units * TIMEOUT_MARGIN, floor)
+
+    def eta(self, stage, key, units=1):
+        rates = self._rates(stage, key)
+        return None if rates is None else _quantile(rates, 0.5) * units
+
+    def summary(self):
+        return [
+            {
+                "stage": stage,
+                "key": key,
+                "samples": len(rates),
+                "p50": _quantile(rates, 0.5),
+                "p95": _quantile(rates, TIMEOUT_PERCENTILE),
+            }
+            for (stage, key), rates in sorted(self.rates.items())
+        ]
+
+
+_model = None
+_model_mtime = None
+
+
+def get_model(path=SPANS_FILE):
+    """The model for the span history as it is now, rebuilt only when the file changed."""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if _model is None or mtime != _model_mtime:
+        try:
+            _model = DurationModel(load_spans(path, tail=SPAN_WINDOW))
+        except OSError as e:
+            logging.warning(f"Could not read span history: {e}")
+            _model = DurationModel([])
+        _model_mtime = mtime
+    return _model
+
+
+def budget(stage, key, units=1, default=None, floor=MIN_TIMEOUT):
+    """
+    (timeout, eta) in seconds for `units` of `key` work in `stage`; either
+    is the default / None without enough history. The work is also added
+    to the current span when it belongs to `stage`, so this run feeds the
+    model for the next.
+    """
+    s = current_span()
+    if s is not None and s.stage == stage:
+        s.add_work(key, units)
+    model = get_model()
+    timeout = model.timeout(stage, key, units, default=default, floor=floor)
+    eta = model.eta(stage, key, units)
+    logging.info(
+        f"Budget for {stage} [{key}] x{units:g}: timeout "
+        f"{'none' if timeout is None else f'{timeout:.0f}s'}, "
+        f"ETA {'unknown' if eta is None else f'{eta:.0f}s'}"
+    )
+    return timeout, eta
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
@@ -0,0 +1,88 @@
+import re
+import asyncio
+import logging
+
+
+READ_CHUNK = 64 * 1024
+# ffmpeg ends its progress stats with \r and everything else with \n
+_LINE_END = re.compile(rb"\r\n|\r|\n")
+
+
+class FFmpegError(RuntimeError):
+    pass
+
+
+async def run_process(cmd, timeout=None, on_stderr_line=None):
+    """
+    Run a command without blocking the event loop and return (stdout, stderr).
+
+    stderr is read in chunks and split into lines at \r as well as \n, so
+    each ffmpeg progress update is its own line; lines are passed to
+    `on_stderr_line` if given. If anything goes wrong while waiting (timeout,
+    cancellation, a failing callback) the child is killed and reaped before
+    the exception propagates, so no orphaned encoders are left behind.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stderr_lines = []
+
+    def emit(line):
+        text = line.decode("utf-8", errors="replace").rstrip()
+        if not text:
+            return
+        stderr_lines.append(text)
+        if on_stderr_line:
+            on_stderr_line(text)
+
+    async def read_stderr():
+        pending = b""
+        while True:
+            chunk = await proc.stderr.read(READ_CHUNK)
+            if not chunk:
+                break
+            *lines, pending = _LINE_END.split(pending + chunk)
+            for line in lines:
+                emit(line)
+        emit(pending)
+
+    async def communicate():
+        stdout, _ = await asyncio.gather(proc.stdout.read(), read_stderr())
+        await proc.wait()
+        return stdout
+
+    try:
+        stdout = await asyncio.wait_for(communicate(), timeout=timeout)
+    except BaseException as e:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if isinstance(e, asyncio.TimeoutError):
+            raise FFmpegError(f"{cmd[0]} timed out after {timeout} seconds") from None
+        raise
+
+    stderr = "\n".join(stderr_lines)
+    if proc.returncode != 0:
+        last = stderr_lines[-1] if stderr_lines else "unknown error"
+        logging.error(f"{cmd[0]} failed (rc={proc.returncode}): {stderr[-2000:]}")
+        raise FFmpegError(f"{cmd[0]} failed (rc={proc.returncode}): {last}")
+
+    return stdout.decode("utf-8", errors="replace"), stderr
+
+
+async def run_ffmpeg(args, timeout=None, on_stderr_line=None):
+    _, stderr = await run_process(
+        ["ffmpeg", "-hide_banner", "-y", *args],
+        timeout=timeout,
+        on_stderr_line=on_stderr_line,
+    )
+    return stderr
+
+
+async def ffprobe(path, entries, stream=None, timeout=30):
+    cmd = ["ffprobe", "-v", "error"]
+    if stream:
+        cmd += ["-select_streams", stream]
+    cmd += ["-show_entries", entries, "-of", "default=noprint_wrappers=1:nokey=1", path]
+    stdout, _ = await run_process(cmd, timeout=timeout)
+    return stdout.strip()
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from metrics import RUN_ID, current_stage
+
+
+LOG_DIR = os.path.join(os.getcwd(), "logs")
+LOG_FILE = os.path.join(LOG_DIR, "pipeline.jsonl")
+
+_listener = None
+
+
+class SizedTimedRotatingFileHandler(RotatingFileHandler):
+    """Rotates once the file passes `max_bytes` or is older than `max_age` seconds."""
+
+    def __init__(self, filename, max_bytes=20 * 1024 * 1024, backup_count=14, max_age=24 * 3600):
+        super().__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        self.max_age = max_age
+        try:
+            opened = os.path.getmtime(filename)
+        except OSError:
+            opened = time.time()
+        self.rollover_at = opened + max_age
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.max_age
+
+
+class ContextFilter(logging.Filter):
+    """Stamp every record with the run id and the pipeline stage active in the caller."""
+
+    def filter(self, record):
+        record.run_id = RUN_ID
+        record.stage = current_stage()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `limit` records per `interval` seconds through for each
+    source (the `source` extra, falling back to the logger name). The number
+    of suppressed records is reported on the next record that gets through.
+    Records at `exempt_level` or above always pass and don't use up the
+    allowance, so an error isn't lost in a flood of progress messages.
+    """
+
+    def __init__(self, sources, limit=5, interval=10.0, exempt_level=logging.WARNING):
+        super().__init__()
+        self.sources = set(sources)
+        self.limit = limit
+        self.interval = interval
+        self.exempt_level = exempt_level
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        source = getattr(record, "source", None) or record.name
+        if source not in self.sources or record.levelno >= self.exempt_level:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            start, count, dropped = self._windows.get(source, (now, 0, 0))
+            if now - start >= self.interval:
+                start, count = now, 0
+            if count >= self.limit:
+                self._windows[source] = (start, count, dropped + 1)
+                return False
+            self._windows[source] = (start, count + 1, 0)
+
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", RUN_ID),
+            "stage": getattr(record, "stage", None),
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "suppressed", None):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level=logging.INFO, log_file=LOG_FILE, noisy_sources=("ffmpeg", "comfy.ws")):
+    """
+    Route all logging through a queue so callers never block on disk. A
+    single listener thread formats records as JSON lines and writes them to
+    a size- and time-rotated file.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    file_handler = SizedTimedRotatingFileHandler(log_file)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # Filters run on the caller's thread, so the stage context is still visible
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(RateLimitFilter(noisy_sources))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush whatever is still queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -3,48 +3,89 @@ import os
 import sys
 import json
 import time
-import glob
-import subprocess
 import requests
-import random
-import psutil
 import shutil
-import ffmpeg
-import socket
-import websockets
 import asyncio
 import logging
-import threading
 from datetime import datetime
-
-from prompts import generate_full_video_metadata
-from upload import upload_short
-
-log_file_path = r"C:\Users\User\Desktop\content_machine\output.log"
-os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-
-logging.basicConfig(
-    filename=log_file_path,
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    force=True,
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    ARTEFACTS_FILE,
+    COMFY_INPUT_DIR,
+    COMFY_URL_BASE,
+    DISK_BUDGET_GB,
+    OLLAMA_URL_BASE,
+    OUTPUT_DIR,
+    PATH_TO_COMFY,
+    PATH_TO_OLLAMA,
+    PROJECT_OUTPUT,
+    WS_URL,
+)
+from supervisor import ManagedProcess, kill_by_exe_name
+from probes import get_session
+from metrics import ROOT_STAGE, span, start_prometheus_server, waiting, write_prometheus
+from logs import setup_logging, stop_logging
+from comfy_client import ComfyAborted, ComfyClient, ComfyError, ComfyStalled
+from ffmpeg_runner import run_ffmpeg, ffprobe
+import timeline
+from reaction_index import ReactionIndex, file_hash
+from artefacts import ArtefactStore
+from admission import Admission
+import quality
+import run_manifest
+import telemetry
+import durations
+import previews
+from durations import format_eta
+from workflows import (
+    apply_video_profile,
+    build_image_batch,
+    build_video_chain,
+    find_vhs_load_node,
+    get_nodes_map,
+    load_workflow,
+    prune_to_outputs,
+    randomize_workflow,
+    reseed_segments,
+    set_output_prefix,
 )
 
 sys.stdout.flush()
 
-
-# Config
-
-PORT = 8000
-COMFY_URL_BASE = f"http://127.0.0.1:{PORT}"
-PATH_TO_COMFY = r"C:\Users\User\AppData\Local\Programs\ComfyUI\ComfyUI.exe"
-PATH_TO_OLLAMA = r"C:\Users\User\AppData\Local\Programs\Ollama\ollama.exe"
-OUTPUT_DIR = os.path.expanduser("~/Documents/ComfyUI/output")
-PROJECT_OUTPUT = os.path.join(os.getcwd(), "outputs")
-os.makedirs(PROJECT_OUTPUT, exist_ok=True)
+ffmpeg_log = logging.getLogger("ffmpeg")
+ws_log = logging.getLogger("comfy.ws")
+
+
+# Config (service addresses and paths are in config.py)
+
+REACTION_CACHE_DIR = os.path.join(PROJECT_OUTPUT, "reaction_cache")
+UPSCALE_SIZE = (1080, 1920)  # matches ImageScale node 14 in upscale_workflow.json
+REENCODE_CONCURRENCY = 2
+CHAIN_VIDEO_JOBS = True  # all video segments in one graph, frames handed over in-graph
+QUALITY_REGENERATIONS = 2  # new seeds for a black/frozen/static clip before giving up
+IMAGE_CANDIDATES = 2  # seeds batched into one image job; the first good one is used
+DRAFT_PROFILE = {
+    "video_size": (176, 320),  # Wan resize target (node 64), multiples of 16
+    "video_length": 33,  # frames per segment (node 50)
+    "video_steps": 4,  # sampler steps, split evenly between the two experts
+    "assemble_size": (540, 960),  # drafts skip SeedVR2 and assemble at this size
+}
+TIMELINE_FILE = os.path.join(os.getcwd(), "layouts", "reaction_sandwich.json")
+PUBLISH_CADENCE_HOURS = None  # e.g. 4 to release queued shorts every 4 hours
+STALL_RETRIES = 2  # stalled/failed jobs resubmitted before ComfyUI is restarted
+METRICS_PORT = None  # e.g. 9464 to serve live stage metrics at /metrics for Prometheus
+PREVIEW_ABORT = True  # interrupt samplers whose live preview is black/uniform/collapsed
+STALL_THRESHOLDS = {  # seconds a running node may go without progress, by class_type
+    "UnetLoaderGGUF": 900,
+    "KSampler": 300,
+    "KSamplerAdvanced": 600,
+    "VAEDecode": 600,
+    "SeedVR2GGUF": 1800,  # block swap reports progress per batch, not per step
+    "VHS_VideoCombine": 900,
+}
 
 DISCORD_WEBHOOK = {YOUR_WEBHOOK_URL_HERE}
-WS_URL = f"ws://127.0.0.1:{PORT}/ws"
 
 
 
@@ -53,10 +94,10 @@ WS_URL = f"ws://127.0.0.1:{PORT}/ws"
 def send_discord(message):
     max_retries = 3
     retry_delay = 2
-    
+
     for attempt in range(max_retries):
         try:
-            response = requests.post(
+            response = get_session().post(
                 DISCORD_WEBHOOK,
                 json={"content": message},
                 timeout=10
@@ -72,673 +113,508 @@ def send_discord(message):
                 logging.error(f"Failed to send Discord notification after {max_retries} attempts")
                 return False
 
-ws_monitor_active = False
-
-def start_websocket_monitor():
-    global ws_monitor_active
-
-    def run_monitor():
-        async def listen():
-            global ws_monitor_active
-            ws_monitor_active = True
-            
-            reconnect_delay = 5
-            max_reconnect_delay = 300
-            consecutive_failures = 0
-            
-            while ws_monitor_active:
-                try:
-                    logging.info(f"Attempting WebSocket connection to {WS_URL}")
-                    
-                    async with websockets.connect(
-                        WS_URL,
-                        ping_interval=20,
-                        ping_timeout=10,
-                        close_timeout=10
-                    ) as ws:
-                        logging.info("WebSocket monitor connected")
-                        send_discord("WebSocket monitor connected")
-                        
-                        reconnect_delay = 5
-                        consecutive_failures = 0
-                        
-                        while ws_monitor_active:
-                            try:
-                                raw = await asyncio.wait_for(ws.recv(), timeout=1.0)
-                                msg = json.loads(raw)
-                                
-                                msg_type = msg.get("type")
-                                
-                                if msg_type == "status":
-                                    continue
-                                elif msg_type == "progress":
-                                    data = msg.get("data", {})
-                                    value = data.get("value", "?")
-                                    max_val = data.get("max", "?")
-                                    try:
-                                        requests.post(
-                                            DISCORD_WEBHOOK,
-                                            json={"content": f"Progress: {value}/{max_val}"},
-                                            timeout=5
-                                        )
-                                    except Exception as e:
-                                        logging.warning(f"Failed to send progress to Discord: {e}")
-                                else:
-                                    pretty = json.dumps(msg, indent=2)
-                                    try:
-                                        requests.post(
-                                            DISCORD_WEBHOOK,
-                                            json={"content": f"[ComfyUI] {pretty[:1800]}"},
-                                            timeout=5
-                                        )
-                                    except Exception as e:
-                                        logging.warning(f"Failed to send message to Discord: {e}")
-                                        
-                            except asyncio.TimeoutError:
-                                continue
-                            except websockets.exceptions.ConnectionClosed as e:
-                                logging.warning(f"WebSocket connection closed: {e}")
-                                break
-                            except Exception as e:
-                                logging.error(f"Error processing WebSocket message: {e}")
-                                continue
-                
-                except (
-                    websockets.exceptions.WebSocketException,
-                    ConnectionRefusedError,
-                    OSError,
-                    asyncio.TimeoutError
-                ) as e:
-                    consecutive_failures += 1
-                    logging.warning(
-                        f"WebSocket connection failed (attempt {consecutive_failures}): {e}"
-                    )
-                    
-                    if ws_monitor_active:
-                        current_delay = min(
-                            reconnect_delay * (1.5 ** (consecutive_failures - 1)),
-                            max_reconnect_delay
-                        )
-                        
-                        logging.info(f"Reconnecting in {current_delay:.1f} seconds...")
-                        
-                        if consecutive_failures == 1 or current_delay >= 60:
-                            try:
-                                send_discord(
-                                    f"WebSocket disconnected. Reconnecting in {int(current_delay)}s..."
-                                )
-                            except:
-                                pass
-                        
-                        wait_start = time.time()
-                        while time.time() - wait_start < current_delay and ws_monitor_active:
-                            await asyncio.sleep(1)
-                
-                except Exception as e:
-                    logging.error(f"Unexpected WebSocket error: {e}", exc_info=True)
-                    if ws_monitor_active:
-                        await asyncio.sleep(10)
-            
-            logging.info("WebSocket monitor stopped")
 
+# One worker keeps messages in order; callers never wait on Discord
+_discord_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="discord")
 
-        try:
-            asyncio.run(listen())
-        except Exception as e:
-            logging.error(f"WebSocket monitor thread crashed: {e}", exc_info=True)
-        finally:
-            ws_monitor_active = False
 
-    import threading
-    thread = threading.Thread(target=run_monitor, daemon=True)
-    thread.start()
-    logging.info("WebSocket monitor thread started")
+def notify(message):
+    """Fire-and-forget send_discord, safe to call from the event loop."""
+    _discord_pool.submit(send_discord, message)
 
 
-def stop_websocket_monitor():
-    """Stop the WebSocket monitor gracefully"""
-    global ws_monitor_active
-    if ws_monitor_active:
-        logging.info("Stopping WebSocket monitor...")
-        ws_monitor_active = False
-        time.sleep(2)
-        logging.info("WebSocket monitor stopped")
+PROGRESS_NOTIFY_STEP = 0.25  # Discord gets a node's progress at every quarter
+_progress_notified = {}  # (prompt_id, node) -> last quarter posted
 
 
+def forward_comfy_event(msg_type, data):
+    """
+    Websocket listener that logs ComfyUI activity and mirrors milestones to
+    Discord: errors, interruptions, completion and per-node progress in
+    PROGRESS_NOTIFY_STEP increments. Everything else only goes to the log.
+    """
+    if msg_type == "status":
+        return
+    level = logging.WARNING if msg_type in ("execution_error", "execution_interrupted") else logging.INFO
+    ws_log.log(level, f"{msg_type}: {json.dumps(data)[:500]}")
+    prompt_id = data.get("prompt_id")
+    if msg_type == "progress":
+        value, total = data.get("value"), data.get("max")
+        if not total or value is None:
+            return
+        quarter = int(value / total / PROGRESS_NOTIFY_STEP)
+        key = (prompt_id, data.get("node"))
+        if quarter > _progress_notified.get(key, 0):
+            _progress_notified[key] = quarter
+            notify(f"Progress: node {data.get('node')} {value}/{total}")
+    elif msg_type in ("execution_error", "execution_interrupted"):
+        pretty = json.dumps({"type": msg_type, "data": data}, indent=2)
+        notify(f"[ComfyUI] {pretty[:1800]}")
+    elif msg_type == "execution_success":
+        notify(f"[ComfyUI] Prompt {prompt_id} finished")
+    if msg_type in ("execution_error", "execution_interrupted", "execution_success"):
+        for key in [k for k in _progress_notified if k[0] == prompt_id]:
+            del _progress_notified[key]
+
+
+artefacts = ArtefactStore(
+    ARTEFACTS_FILE,
+    run_roots=(OUTPUT_DIR,),
+    budget_bytes=DISK_BUDGET_GB * 1024**3,
+)
 
-# PROCESS MANAGEMENT
+comfy = ComfyClient(COMFY_URL_BASE, WS_URL, OUTPUT_DIR, stall_thresholds=STALL_THRESHOLDS)
+comfy.add_listener(forward_comfy_event)
+admission = Admission(comfy, restart=lambda: restart_comfyui())
 
-def kill_comfy_processes():
-    killed = 0
-    for proc in psutil.process_iter(["pid", "name", "cmdline"]):
-        try:
-            name = (proc.info.get("name") or "").lower()
-            cmdline = proc.info.get("cmdline") or []
-            cmdline_str = " ".join(str(x).lower() for x in cmdline)
 
-            if (
-                ("comfy" in name)
-                or ("comfyui" in name)
-                or ("comfy" in cmdline_str)
-                or ("comfyui" in cmdline_str)
-            ):
-                print(f"Terminating ComfyUI process (PID: {proc.info['pid']})")
-                proc.kill()
-                killed += 1
 
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
+# PROCESS MANAGEMENT
+
+COMFY = ManagedProcess(
+    "ComfyUI", [PATH_TO_COMFY], health_url=f"{COMFY_URL_BASE}/system_stats"
+)
+OLLAMA = ManagedProcess(
+    "Ollama", [PATH_TO_OLLAMA, "serve"], health_url=f"{OLLAMA_URL_BASE}/api/version"
+)
 
-    if killed > 0:
-        time.sleep(2)
 
-    return killed
+def kill_comfy_processes():
+    """Stop our own ComfyUI child and clear any instance left over from a previous run."""
+    COMFY.stop()
+    return kill_by_exe_name(os.path.basename(PATH_TO_COMFY))
 
 
 def launch_comfyui():
     print("Launching ComfyUI...")
-    send_discord("Launching ComfyUI...")
-    comfy_path = PATH_TO_COMFY
-
-    if not os.path.exists(comfy_path):
-        raise RuntimeError(f"ComfyUI.exe not found at: {comfy_path}")
-
-    subprocess.Popen([comfy_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    print("ComfyUI launched.")
-
-
-def port_open(host, port):
-    try:
-        with socket.create_connection((host, port), timeout=1):
-            return True
-    except:
-        return False
-
-
-def wait_for_ollama(
-    hosts=("127.0.0.1", "::1"), port=11434, timeout=600, check_interval=5
-):
-    send_discord("Waiting for Ollama to start...")
-    start_time = time.time()
-    last_log = 0
-
-    while time.time() - start_time < timeout:
-        for host in hosts:
-            try:
-                family = socket.AF_INET6 if ":" in host else socket.AF_INET
-                with socket.socket(family, socket.SOCK_STREAM) as s:
-                    s.settimeout(1.0)
-                    s.connect((host, port))
-                    logging.info(f"Ollama ready on {host}:{port}")
-                    send_discord("Ollama is ready")
-                    return True
-            except Exception:
-                pass
-
-        elapsed = int(time.time() - start_time)
-        if elapsed - last_log >= 30:
-            last_log = elapsed
-            logging.info(f"Still waiting for Ollama... ({elapsed}s elapsed)")
-            try:
-                procs = [
-                    f"{p.pid}:{p.info.get('name')}"
-                    for p in psutil.process_iter(["name"])
-                ][:50]
-                logging.info("Top processes: " + ", ".join(procs))
-            except Exception as e:
-                logging.warning(f"Could not list processes: {e}")
-
-            try:
-                conns = []
-                for c in psutil.net_connections(kind="inet"):
-                    if c.laddr and c.laddr.port == port:
-                        conns.append(f"{c.pid or '?'}:{c.status}")
-                logging.info(f"Connections on port {port}: {conns}")
-            except Exception as e:
-                logging.debug(f"Could not inspect net_connections: {e}")
+    notify("Launching ComfyUI...")
+    COMFY.start()
+    print(f"ComfyUI launched (pid={COMFY.pid}).")
 
-        time.sleep(check_interval)
 
-    logging.error(f"Ollama did not start within {timeout}s")
-    try:
-        for proc in psutil.process_iter(["pid", "name", "cmdline"]):
-            n = proc.info.get("name") or ""
-            if (
-                "ollama" in (n or "").lower()
-                or "ollama" in " ".join(proc.info.get("cmdline") or []).lower()
-            ):
-                logging.error(
-                    f"Found Ollama-like process at timeout: pid={proc.pid} name={n} cmd={proc.info.get('cmdline')}"
-                )
-    except Exception:
-        pass
+async def wait_for_ollama(timeout=600):
+    notify("Waiting for Ollama to start...")
+    with waiting():
+        await OLLAMA.probe().wait_async(timeout=timeout)
+    notify("Ollama is ready")
+    return True
 
-    raise TimeoutError(f"Ollama on port {port} did not start within {timeout} seconds")
 
-
-def wait_for_comfyui(timeout=600):
+async def wait_for_comfyui(timeout=600):
     print("Waiting for ComfyUI to fully start...")
-    send_discord("Waiting for ComfyUI to start...")
-    stats_url = f"{COMFY_URL_BASE}/system_stats"
-    start = time.time()
-
-    while time.time() - start < timeout:
-        if port_open("127.0.0.1", PORT):
-            try:
-                r = requests.get(stats_url, timeout=2)
-                if r.status_code == 200:
-                    print("ComfyUI is ready.")
-                    send_discord("ComfyUI is ready")
-                    return True
-            except:
-                pass
-
-        time.sleep(2)
-
-    raise RuntimeError("ComfyUI did not start within timeout.")
+    notify("Waiting for ComfyUI to start...")
+    try:
+        with waiting():
+            await COMFY.probe().wait_async(timeout=timeout)
+    except TimeoutError:
+        raise RuntimeError("ComfyUI did not start within timeout.")
+    print("ComfyUI is ready.")
+    notify("ComfyUI is ready")
+    return True
 
 
 def find_comfy_port():
-    try:
-        r = requests.get(f"{COMFY_URL_BASE}/system_stats", timeout=1)
-        return r.status_code == 200
-    except Exception:
-        return False
+    return COMFY.is_healthy(timeout=1)
 
 
 def launch_ollama():
-    """Start Ollama only if no existing process is present. Return PID if started, else None."""
+    """Start Ollama only if it is not already serving. Return PID if started, else None."""
     logging.info("Attempting to launch Ollama...")
-    ollama_path = PATH_TO_OLLAMA
-
-    if not os.path.exists(ollama_path):
-        raise RuntimeError(f"Ollama not found at: {ollama_path}")
 
     if ollama_is_running():
         logging.info("launch_ollama: Ollama already present, skipping launch.")
         return None
 
-    proc = subprocess.Popen(
-        [ollama_path],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        creationflags=(
-            subprocess.CREATE_NEW_PROCESS_GROUP
-            if hasattr(subprocess, "CREATE_NEW_PROCESS_GROUP")
-            else 0
-        ),
-    )
-    logging.info(f"Started Ollama (pid={proc.pid})")
-    return proc.pid
+    return OLLAMA.start()
 
 
 def ollama_is_running():
-    for proc in psutil.process_iter(["name", "cmdline"]):
-        try:
-            name = (proc.info.get("name") or "").lower()
-            cmd = " ".join(proc.info.get("cmdline") or []).lower()
-            if "ollama" in name or "ollama" in cmd:
-                logging.info(f"Found Ollama process: {proc.pid} {name} {cmd[:200]}")
-                return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-
-    for host in ("127.0.0.1", "::1"):
-        try:
-            with socket.socket(
-                socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM
-            ) as s:
-                s.settimeout(1.0)
-                s.connect((host, 11434))
-                logging.info(f"Socket connect succeeded to {host}:11434")
-                return True
-        except Exception:
-            pass
+    return OLLAMA.is_healthy(timeout=1)
 
-    return False
 
+def stop_services():
+    """Shut down every service child this run launched."""
+    for service in (COMFY, OLLAMA):
+        try:
+            service.stop()
+        except Exception as e:
+            logging.warning(f"Failed to stop {service.name}: {e}")
 
 
-# INPUT/OUTPUT HELPERS
 
-def copy_to_input_folder(path):
-    comfy_input = os.path.expanduser("~/Documents/ComfyUI/input")
-    os.makedirs(comfy_input, exist_ok=True)
+# INPUT/OUTPUT HELPERS
 
-    dest = os.path.join(comfy_input, os.path.basename(path))
-    shutil.copy2(path, dest)
-    print(f"Copied to input: {os.path.basename(dest)}")
+def copy_to_input_folder(path, stages=()):
+    """Hardlink (or copy) a file into ComfyUI's input folder for `stages` to load."""
+    dest = artefacts.link(path, COMFY_INPUT_DIR, stages=stages)
+    print(f"Linked to input: {os.path.basename(dest)}")
     return dest
 
 
-def pick_largest_mp4(paths):
-    candidates = [p for p in paths if p.lower().endswith(".mp4") and os.path.exists(p)]
-    if not candidates:
-        return None
-    return max(candidates, key=os.path.getsize)
-
-
-def wait_for_file_complete(path, check_interval=3, stable_cycles=3):
-    print(f"Waiting for file to finish writing: {path}")
-
-    last_size = -1
-    stable_count = 0
-
+async def run_comfy_job(workflow, family, timeout=None, what="ComfyUI job"):
+    """
+    Submit once the `family` (image/video/upscale) fits in memory and wait,
+    recovering from failures: a prompt that stalled or raised in a node is
+    resubmitted up to STALL_RETRIES times, then ComfyUI is restarted for a
+    last try. A prompt aborted on its preview is resubmitted with new seeds,
+    up to QUALITY_REGENERATIONS times. Returns (prompt_id, history entry).
+    """
+    failures = aborts = 0
     while True:
-        if os.path.exists(path):
-            try:
-                size = os.path.getsize(path)
-            except OSError:
-                size = -1
-
-            if size > 0:
-                if size == last_size:
-                    stable_count += 1
-                    if stable_count >= stable_cycles:
-                        print(f"File is complete. Size: {size:,} bytes")
-                        return
-                else:
-                    stable_count = 0
-                last_size = size
-
-        time.sleep(check_interval)
-
-
-def wait_for_new_output(before_files, check_interval=10, timeout=3600):
-    print(f"Waiting for output (timeout: {timeout}s)...")
-    start_time = time.time()
-
-    candidate_file = None
-
-    while time.time() - start_time < timeout:
-        time.sleep(check_interval)
-        if not os.path.exists(OUTPUT_DIR):
-            continue
-
-        current_files = {
-            f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith(".mp4")
-        }
-        new_files = current_files - before_files
-
-        if new_files:
-            print(f"Found {len(new_files)} new file(s): {', '.join(new_files)}")
-            full_paths = [os.path.join(OUTPUT_DIR, f) for f in new_files]
-            chosen = pick_largest_mp4(full_paths)
-            if chosen:
-                candidate_file = chosen
-                print(f"Selected: {os.path.basename(chosen)}")
-                break
-            candidate_file = full_paths[0]
-            break
-
-    if not candidate_file:
-        raise RuntimeError(f"No output file appeared within {timeout}s")
-
-    print(f"Waiting for {os.path.basename(candidate_file)} to complete writing...")
-    last_size = -1
-    stable_count = 0
-    stable_cycles_needed = 3
-    min_size = 1024 * 1024  # 1MB minimum
-
-    while time.time() - start_time < timeout:
+        await admission.admit(family)
+        prompt_id = await comfy.submit(workflow)
         try:
-            current_size = os.path.getsize(candidate_file)
-
-            if current_size != last_size:
-                print(f"File size: {current_size / (1024*1024):.2f} MB")
-
-            if current_size >= min_size:
-                if current_size == last_size:
-                    stable_count += 1
-                    if stable_count >= stable_cycles_needed:
-                        print(
-                            f"File is complete and stable at {current_size / (1024*1024):.2f} MB"
-                        )
-                        return candidate_file
-                else:
-                    stable_count = 0
-            else:
-                stable_count = 0
-
-            last_size = current_size
-
-        except OSError as e:
-            print(f"Warning: Could not read file size: {e}")
-            last_size = -1
+            with waiting():
+                return prompt_id, await comfy.wait(prompt_id, timeout=timeout)
+        except TimeoutError:
+            await abandon_prompt(prompt_id)
+            raise
+        except ComfyAborted as e:
+            aborts += 1
+            if aborts > QUALITY_REGENERATIONS:
+                raise RuntimeError(f"{what} aborted {aborts} times on its preview: {e}")
+            notify(f"{what} aborted early ({e.details.get('reason')}), reseeding")
+            randomize_workflow(workflow)
+        except ComfyError as e:
+            if not is_recoverable(e):
+                raise
+            failures += 1
+            if failures > STALL_RETRIES + 1:
+                raise RuntimeError(f"{what} failed again after restarting ComfyUI: {e}")
+            await recover_from_failure(what, e, restart=failures == STALL_RETRIES + 1)
+
+
+async def abandon_prompt(prompt_id):
+    """Stop ComfyUI working on a prompt nobody waits for any more, queued or running."""
+    await comfy.cancel([prompt_id])
+    await comfy.interrupt(prompt_id)
+
+
+def is_recoverable(error):
+    """Stalled, or a node raised (out of memory, say); not a prompt we cancelled."""
+    return isinstance(error, ComfyStalled) or error.details.get("exception_message") is not None
+
+
+async def recover_from_failure(what, error, restart):
+    details = error.details
+    failed = "stalled" if isinstance(error, ComfyStalled) else "failed"
+    print(f"{what} {failed} in node {details.get('node_id')} ({details.get('node_type')})")
+    if details.get("exception_message"):
+        logging.error(
+            f"{what}: {details.get('exception_type')}: {details['exception_message']}\n"
+            f"{''.join(details.get('traceback') or [])}"
+        )
+    if restart:
+        notify(f"{what} keeps failing; restarting ComfyUI")
+        await restart_comfyui()
+    else:
+        notify(f"{what} {failed} in {details.get('node_type')}, resubmitting")
+        if not isinstance(error, ComfyStalled):
+            admission.resident = None  # free memory first in case it ran out
 
-        time.sleep(check_interval)
 
-    raise RuntimeError(f"File did not complete writing within {timeout}s")
+def print_cache_report(prompt_id):
+    report = comfy.node_report(prompt_id)
+    print(f"ComfyUI cache: {len(report['cached'])} node(s) reused, {len(report['executed'])} executed")
 
 
+def pick_largest_mp4(paths):
+    candidates = [p for p in paths if p.lower().endswith(".mp4") and os.path.exists(p)]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getsize)
 
-# WORKFLOW UTILITIES - MARKED FOR CLEANING UP
 
-def randomize_workflow(workflow):
-    for node in workflow.values():
-        if not isinstance(node, dict):
-            continue
-        inputs = node.get("inputs", {})
-        if not isinstance(inputs, dict):
-            continue
-        if "seed" in inputs and isinstance(inputs["seed"], (int, float)):
-            inputs["seed"] = random.randint(0, 2**31 - 1)
-        if "noise_seed" in inputs and isinstance(inputs["noise_seed"], (int, float)):
-            inputs["noise_seed"] = random.randint(0, 2**31 - 1)
-    return workflow
 
+# IMAGE GENERATION
 
-def get_nodes_map(workflow):
+async def generate_images(prompts, per_prompt=1, workflow_file="image_workflow.json", timeout=None,
+                          kind="intermediate"):
     """
-    Return a dict mapping node_id_str -> node_obj regardless of workflow shape.
-    Supports either:
-      - old format: { "1": {...}, "2": {...} }
-      - new format: { "nodes": { "1": {...}, ... }, "links": [...] }
+    Render `per_prompt` images for each prompt as a single ComfyUI job, so
+    model setup and queue overhead are paid once per batch. Returns one list
+    of PNG paths per prompt, matched to the prompt through its SaveImage node.
+    The images are tracked as `kind` artefacts ("final" when they are the
+    result the caller hands out, as in `cli.py images`).
     """
-    if (
-        isinstance(workflow, dict)
-        and "nodes" in workflow
-        and isinstance(workflow["nodes"], dict)
-    ):
-        return workflow["nodes"]
-    return workflow
-
-
-def find_vhs_load_node(nodes_map):
-    if "1" in nodes_map:
-        n = nodes_map["1"]
-        cls = n.get("class_type") or n.get("type") or ""
-        if "VHS_LoadVideo" in str(cls):
-            return "1"
-
-    for nid, node in nodes_map.items():
-        cls = node.get("class_type") or node.get("type") or ""
-        if "VHS_LoadVideo" in str(cls):
-            return nid
-    return None
-
-
-
-# IMAGE GENERATION
-
-def generate_image(prompt, workflow_file="image_workflow.json"):
     print("\n" + "=" * 60)
-    print("GENERATING INITIAL IMAGE")
+    print(f"GENERATING {len(prompts) * per_prompt} IMAGE(S)")
     print("=" * 60)
-    send_discord("Generating initial image")
+    notify("Generating initial image")
 
-    prompt = str(prompt).replace("'", "'").replace("\n", " ").strip()
-    print("Prompt being sent:", repr(prompt))
+    prompts = [str(p).replace("\n", " ").strip() for p in prompts]
+    for p in prompts:
+        print("Prompt being sent:", repr(p))
 
-    with open(workflow_file, "r", encoding="utf-8") as f:
-        workflow = json.load(f)
+    workflow = load_workflow(workflow_file)
 
     if "6" not in workflow or "inputs" not in workflow["6"]:
         raise RuntimeError("Node 6 with inputs not found in workflow")
 
-    workflow["6"]["inputs"]["text"] = prompt
-    workflow = randomize_workflow(workflow)
-
-    url = f"{COMFY_URL_BASE}/prompt"
-    data = {"prompt": workflow, "client_id": f"client_{random.randint(1000,9999)}"}
-    r = requests.post(url, json=data)
-    r.raise_for_status()
-    print("Request sent to ComfyUI...")
+    latent = workflow["27"]["inputs"]
+    budget, eta = durations.budget(
+        "image",
+        f"{os.path.basename(workflow_file)}:{latent['width']}x{latent['height']}",
+        units=len(prompts) * per_prompt,
+        default=1800,
+    )
+    timeout = timeout or budget
 
-    initial_imgs = set(glob.glob(os.path.join(OUTPUT_DIR, "ComfyUI_*.png")))
-    latest = None
+    workflow, save_nodes = build_image_batch(workflow, prompts, per_prompt=per_prompt)
+    workflow = randomize_workflow(set_output_prefix(workflow, artefacts.comfy_prefix("image")))
 
-    while True:
-        imgs = set(glob.glob(os.path.join(OUTPUT_DIR, "ComfyUI_*.png")))
-        new_imgs = imgs - initial_imgs
-        if new_imgs:
-            latest = max(new_imgs, key=os.path.getmtime)
-            break
-        time.sleep(2)
+    print(f"Sending request to ComfyUI (ETA {format_eta(eta)})...")
+    try:
+        prompt_id, entry = await run_comfy_job(workflow, "image", timeout, what="Image generation")
+    except TimeoutError:
+        raise RuntimeError(f"Image generation did not finish within {timeout:.0f}s")
+    print_cache_report(prompt_id)
+
+    results = []
+    for prompt, save_node in zip(prompts, save_nodes):
+        images = [
+            p for p in comfy.output_files(entry, node_id=save_node) if p.lower().endswith(".png")
+        ]
+        if not images:
+            raise RuntimeError(f"Image prompt {prompt_id} saved nothing for {prompt[:60]!r}")
+        for image in images:
+            artefacts.add(image, kind=kind)
+        results.append(images)
 
-    print(f"Generated: {os.path.basename(latest)}")
-    send_discord("Initial image generated")
-    copy_to_input_folder(latest)
-    return latest
+    print(f"Generated: {', '.join(os.path.basename(p) for images in results for p in images)}")
+    notify("Initial image generated")
+    return results
 
 
 
 # VIDEO GENERATION
 
-def generate_video(
-    image_path, prompt, workflow_file="video_workflow.json", video_num=1, timeout=300
+async def generate_video(
+    image_path, prompt, workflow_file="video_workflow.json", video_num=1, timeout=None
 ):
     print(f"\n{'='*60}\nGENERATING VIDEO {video_num}\n{'='*60}")
-    send_discord(f"Generating video {video_num}/3")
+    notify(f"Generating video {video_num}/3")
 
-    with open(workflow_file, "r", encoding="utf-8") as f:
-        workflow = json.load(f)
+    workflow = load_workflow(workflow_file)
 
     workflow["6"]["inputs"]["text"] = str(prompt).replace("\n", " ").strip()
     workflow["52"]["inputs"]["image"] = os.path.basename(image_path)
-    workflow = randomize_workflow(workflow)
-
-    url = f"{COMFY_URL_BASE}/prompt"
-    data = {"prompt": workflow, "client_id": f"client_{random.randint(1000,9999)}"}
-    r = requests.post(url, json=data)
-    r.raise_for_status()
-    print("Request sent to ComfyUI...")
-
-    video_dir = os.path.join(OUTPUT_DIR, "video")
-    os.makedirs(video_dir, exist_ok=True)
+    workflow = randomize_workflow(set_output_prefix(workflow, artefacts.comfy_prefix("video")))
+    budget, eta = durations.budget("video", video_work_key(workflow, workflow_file), default=300)
+    timeout = timeout or budget
 
-    start_time = time.time()
-
-    existing_files = {
-        f: os.path.getmtime(f)
-        for f in glob.glob(os.path.join(video_dir, "ComfyUI_*.mp4"))
-    }
-    latest_video = None
-
-    while time.time() - start_time < timeout:
-        all_videos = glob.glob(os.path.join(video_dir, "ComfyUI_*.mp4"))
-        for f in all_videos:
-            mtime = os.path.getmtime(f)
-            if f not in existing_files or mtime > existing_files[f]:
-                latest_video = f
-                break
-        if latest_video:
-            break
-        time.sleep(2)
-
-    if not latest_video:
+    print(f"Sending request to ComfyUI (ETA {format_eta(eta)})...")
+    try:
+        _, entry = await run_comfy_job(workflow, "video", timeout, what=f"Video {video_num}")
+    except TimeoutError:
         raise RuntimeError(
             f"Video {video_num} generation timeout. No new file detected."
         )
 
+    latest_video = pick_largest_mp4(comfy.output_files(entry))
+    if not latest_video:
+        raise RuntimeError(f"Video {video_num} prompt finished without saving a video")
+    artefacts.add(latest_video, stages=("video", "upscale"))
+
     print(f"Generated: {os.path.basename(latest_video)}")
-    send_discord(f"Video {video_num}/3 complete")
+    notify(f"Video {video_num}/3 complete")
     return latest_video
 
 
 
+def video_work_key(workflow, workflow_file):
+    """Duration model key for one Wan segment: resolution and frame count."""
+    size = workflow["64"]["inputs"]
+    return (
+        f"{os.path.basename(workflow_file)}:{size['width']}x{size['height']}"
+        f"x{workflow['50']['inputs']['length']}"
+    )
+
+
+async def submit_video_chain(chain, save_nodes, first=0):
+    """
+    Queue segments `first`.. as one prompt. Earlier segments are still in
+    the graph as the source of the handed-over frame, but with unchanged
+    seeds ComfyUI serves them from its cache; only their SaveVideo nodes
+    are pruned so they aren't written again.
+    """
+    await admission.admit("video")
+    prompt_id = await comfy.submit(prune_to_outputs(chain, save_nodes[first:]))
+    print(f"Queued {len(save_nodes) - first} chained video segment(s) as one prompt")
+    notify(f"Queued {len(save_nodes) - first} video segments")
+    return prompt_id
+
+
+async def generate_video_chain(image_path, prompts, workflow_file="video_workflow.json",
+                               regenerations=QUALITY_REGENERATIONS, profile=None, seeds=None):
+    """
+    Generate all segments in a single ComfyUI graph, each segment starting
+    from the decoded last frame of the one before. Segments are collected
+    as their SaveVideo nodes run and go through the quality gate while the
+    next one renders; a failing segment is regenerated with a new seed,
+    together with the segments built on it.
+
+    `profile` renders a reduced draft; `seeds` ({node_id: noise_seed}) repeats
+    an earlier run's sampling. Returns the videos and the seeds finally used.
+    """
+    workflow = load_workflow(workflow_file)
+    if profile:
+        workflow = apply_video_profile(workflow, profile)
+
+    work_key = video_work_key(workflow, workflow_file)
+    chain, save_nodes = build_video_chain(workflow, prompts, os.path.basename(image_path))
+    chain = randomize_workflow(set_output_prefix(chain, artefacts.comfy_prefix("video")))
+    for nid, seed in (seeds or {}).items():
+        if nid in chain:
+            chain[nid]["inputs"]["noise_seed"] = seed
+
+    # Which segment each node belongs to, to place a preview abort
+    segment_of = {}
+    for k, save_node in enumerate(save_nodes):
+        for nid in prune_to_outputs(chain, [save_node]):
+            segment_of.setdefault(nid, k)
+
+    videos = []
+    retries = [0] * len(save_nodes)
+    failures = 0
+    # Open for the whole chain: ComfyUI renders the next segment while the
+    # quality span of the last one runs, and telemetry tags by this span
+    with span("video_chain", segments=len(save_nodes)):
+        prompt_id = await submit_video_chain(chain, save_nodes)
+        try:
+            while len(videos) < len(save_nodes):
+                i = len(videos) + 1
+                try:
+                    with span("video", index=i, attempt=retries[i - 1] + 1) as sp:
+                        v = await wait_video_segment(prompt_id, save_nodes[i - 1], i, work_key)
+                        sp.add_output(v)
+                except ComfyAborted as e:
+                    # The failing sampler may belong to a later segment than the
+                    # one awaited; that one and everything after it get new seeds
+                    j = max(segment_of.get(e.details.get("node_id"), i - 1), i - 1)
+                    if retries[j] >= regenerations:
+                        raise RuntimeError(f"Video {j + 1} aborted on its preview {retries[j] + 1} times: {e}")
+                    retries[j] += 1
+                    notify(f"Video {j + 1} aborted early ({e.details.get('reason')}), regenerating")
+                    await comfy.cancel([prompt_id])
+                    reseed_segments(chain, save_nodes, j)
+                    prompt_id = await submit_video_chain(chain, save_nodes, first=i - 1)
+                    continue
+                except ComfyError as e:
+                    if not is_recoverable(e):
+                        raise
+                    # Same seeds: finished segments come back from the cache
+                    failures += 1
+                    if failures > STALL_RETRIES + 1:
+                        raise RuntimeError(f"Video {i} failed again after restarting ComfyUI: {e}")
+                    await comfy.cancel([prompt_id])
+                    await recover_from_failure(f"Video {i}", e, restart=failures == STALL_RETRIES + 1)
+                    prompt_id = await submit_video_chain(chain, save_nodes, first=i - 1)
+                    continue
+
+                with span("quality", index=i) as sp:
+                    sp.add_input(v)
+                    score = await quality.analyse_clip(v)
+                if score["passed"]:
+                    videos.append(v)
+                    continue
+
+                artefacts.release(v)
+                if retries[i - 1] >= regenerations:
+                    raise RuntimeError(
+                        f"Video {i} failed the quality gate {retries[i - 1] + 1} times: "
+                        + ", ".join(score["reasons"])
+                    )
+                retries[i - 1] += 1
+                notify(f"Video {i} rejected ({', '.join(score['reasons'])}), regenerating")
+
+                # Whatever is rendering now started from the rejected frames
+                await abandon_prompt(prompt_id)
+                reseed_segments(chain, save_nodes, i - 1)
+                prompt_id = await submit_video_chain(chain, save_nodes, first=i - 1)
+        except BaseException:
+            await abandon_prompt(prompt_id)
+            raise
+        print_cache_report(prompt_id)
+        comfy.release(prompt_id)
+
+    used_seeds = {
+        nid: node["inputs"]["noise_seed"]
+        for nid, node in chain.items()
+        if "noise_seed" in node.get("inputs", {})
+    }
+    return videos, used_seeds
+
+
+async def wait_video_segment(prompt_id, save_node, video_num, work_key, timeout=None):
+    budget, eta = durations.budget("video", work_key, default=300)
+    timeout = timeout or budget
+    notify(f"Rendering video {video_num}/3 (ETA {format_eta(eta)})")
+    try:
+        with waiting():
+            output = await comfy.wait_output(prompt_id, save_node, timeout=timeout)
+    except TimeoutError:
+        await abandon_prompt(prompt_id)
+        raise RuntimeError(f"Video {video_num} generation timeout. No new file detected.")
+
+    video = pick_largest_mp4(comfy.output_files({"outputs": {save_node: output}}))
+    if not video:
+        raise RuntimeError(f"Video {video_num} segment finished without saving a video")
+    artefacts.add(video, stages=("upscale",))
+
+    print(f"Generated: {os.path.basename(video)}")
+    notify(f"Video {video_num}/3 complete")
+    return video
+
+
+
 # FRAME EXTRACTION
 
-def extract_last_frame(video_path, output_dir=None):
+async def extract_last_frame(video_path, output_dir=None):
     print(f"\nExtracting final frame from: {os.path.basename(video_path)}")
     if output_dir is None:
-        output_dir = OUTPUT_DIR
+        output_dir = artefacts.run_dir(OUTPUT_DIR)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     frame_path = os.path.join(output_dir, f"final_frame_{timestamp}.png")
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-sseof",
-        "-0.1",
-        "-i",
-        video_path,
-        "-vframes",
-        "1",
-        "-q:v",
-        "2",
-        frame_path,
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"FFmpeg extraction failed: {result.stderr}")
-    copy_to_input_folder(frame_path)
+    await run_ffmpeg(
+        ["-sseof", "-0.1", "-i", video_path, "-vframes", "1", "-q:v", "2", frame_path],
+        timeout=60,
+    )
+    artefacts.add(frame_path, stages=("video",))
+    copy_to_input_folder(frame_path, stages=("video",))
     return frame_path
 
 
 
-# SPLITTING
+# PROBING
 
-def get_duration(path):
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-show_entries",
-        "format=duration",
-        "-of",
-        "default=noprint_wrappers=1:nokey=1",
-        path,
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffprobe failed: {result.stderr}")
-    return float(result.stdout.strip())
+async def get_duration(path):
+    return float(await ffprobe(path, "format=duration"))
 
 
-def split_video_half(input_path, out1, out2):
-    dur = get_duration(input_path)
-    mid = dur / 2.0
-
-    (
-        ffmpeg.input(input_path, ss=0, t=mid)
-        .output(out1, vcodec="libx264", acodec="aac", r=30, pix_fmt="yuv420p")
-        .run(overwrite_output=True)
-    )
-
-    (
-        ffmpeg.input(input_path, ss=mid)
-        .output(out2, vcodec="libx264", acodec="aac", r=30, pix_fmt="yuv420p")
-        .run(overwrite_output=True)
-    )
+async def get_fps(path):
+    rate = await ffprobe(path, "stream=r_frame_rate", stream="v:0")
+    num, _, den = rate.partition("/")
+    return float(num) / float(den or 1)
 
 
 
 # CONCATENATION
 
-def concat_videos(video_list, output_path, timeout=600):
+async def concat_videos(video_list, output_path, timeout=600, size=None):
     print("\n" + "=" * 60)
     print("CONCATENATING SEQUENCE")
     print("=" * 60)
-    send_discord("Stitching videos together")
+    notify("Stitching videos together")
 
     missing = [v for v in video_list if not os.path.exists(v)]
     if missing:
         raise RuntimeError(f"Missing input files: {missing}")
 
     for v in video_list:
-        size = os.path.getsize(v)
-        print(f"Input: {v} ({size/1024/1024:.2f} MB)")
-        if size == 0:
+        size_bytes = os.path.getsize(v)
+        print(f"Input: {v} ({size_bytes/1024/1024:.2f} MB)")
+        if size_bytes == 0:
             raise RuntimeError(f"Input file {v} has size 0 — check it.")
 
     tmp_dir = os.path.join(os.path.dirname(output_path), "temp_concat")
@@ -746,36 +622,36 @@ def concat_videos(video_list, output_path, timeout=600):
         shutil.rmtree(tmp_dir)
     os.makedirs(tmp_dir, exist_ok=True)
 
-    temp_files = []
-    try:
-        for i, v in enumerate(video_list):
-            temp_file = os.path.join(tmp_dir, f"clip_{i:03d}.mp4")
-            print(f"Re-encoding -> {temp_file}")
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-i",
-                v,
-                "-c:v",
-                "libx264",
-                "-c:a",
-                "aac",
-                "-r",
-                "30",
-                "-pix_fmt",
-                "yuv420p",
-                temp_file,
+    limit = asyncio.Semaphore(REENCODE_CONCURRENCY)
+
+    async def reencode(i, v):
+        temp_file = os.path.join(tmp_dir, f"clip_{i:03d}.mp4")
+        args = ["-i", v]
+        if size:
+            # Assemble at the final resolution so every clip matches
+            w, h = size
+            args += [
+                "-vf",
+                f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+                f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1",
             ]
-            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=200)
-            if proc.returncode != 0:
-                print("ffmpeg stderr:", proc.stderr)
-                raise RuntimeError(
-                    f"Re-encode failed for {v}: {proc.stderr.splitlines()[-1] if proc.stderr else 'unknown error'}"
-                )
-            temp_files.append(temp_file)
-            print(
-                f"Re-encoded: {temp_file} ({os.path.getsize(temp_file)/1024/1024:.2f} MB)"
-            )
+        args += ["-c:v", "libx264", "-c:a", "aac", "-r", "30", "-pix_fmt", "yuv420p", temp_file]
+
+        async with limit:
+            print(f"Re-encoding -> {temp_file}")
+            try:
+                await run_ffmpeg(args, timeout=200)
+            except RuntimeError as e:
+                raise RuntimeError(f"Re-encode failed for {v}: {e}")
+        print(
+            f"Re-encoded: {temp_file} ({os.path.getsize(temp_file)/1024/1024:.2f} MB)"
+        )
+        return temp_file
+
+    try:
+        temp_files = await asyncio.gather(
+            *(reencode(i, v) for i, v in enumerate(video_list))
+        )
 
         list_path = os.path.join(tmp_dir, "concat_list.txt")
         with open(list_path, "w", encoding="utf-8") as f:
@@ -787,62 +663,35 @@ def concat_videos(video_list, output_path, timeout=600):
         print("Concat list written to:", list_path)
         print("Temp files count:", len(temp_files))
 
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-f",
-            "concat",
-            "-safe",
-            "0",
-            "-i",
-            list_path,
-            "-c:v",
-            "libx264",
-            "-crf",
-            "18",
-            "-preset",
-            "fast",
-            "-c:a",
-            "aac",
-            output_path,
-        ]
         print("Running ffmpeg concat...")
-        proc = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
-        )
-
-        start = time.time()
         try:
-            while True:
-                if time.time() - start > timeout:
-                    proc.kill()
-                    raise RuntimeError(
-                        f"ffmpeg concat timed out after {timeout} seconds."
-                    )
-                line = proc.stderr.readline()
-                if line:
-                    print(line.strip())
-                elif proc.poll() is not None:
-                    break
-                else:
-                    time.sleep(0.1)
-
-            rc = proc.poll()
-            if rc != 0:
-                remaining = proc.stderr.read()
-                raise RuntimeError(
-                    f"ffmpeg concat failed (rc={rc}): {remaining.strip()[:1000]}"
-                )
-            print("ffmpeg concat finished successfully.")
-            send_discord("Video stitching complete")
-            return output_path
+            await run_ffmpeg(
+                [
+                    "-f",
+                    "concat",
+                    "-safe",
+                    "0",
+                    "-i",
+                    list_path,
+                    "-c:v",
+                    "libx264",
+                    "-crf",
+                    "18",
+                    "-preset",
+                    "fast",
+                    "-c:a",
+                    "aac",
+                    output_path,
+                ],
+                timeout=timeout,
+                on_stderr_line=ffmpeg_log.info,
+            )
+        except RuntimeError as e:
+            raise RuntimeError(f"ffmpeg concat failed: {e}")
 
-        finally:
-            try:
-                proc.stdout and proc.stdout.close()
-                proc.stderr and proc.stderr.close()
-            except Exception:
-                pass
+        print("ffmpeg concat finished successfully.")
+        notify("Video stitching complete")
+        return output_path
 
     finally:
         try:
@@ -853,57 +702,20 @@ def concat_videos(video_list, output_path, timeout=600):
 
 
 
-# ADD MUSIC
-
-def add_music(video_path, music_path, output_path):
-    print("\n" + "=" * 60)
-    print("ADDING MUSIC")
-    print("=" * 60)
-    send_discord("Adding music")
-
-    if not os.path.exists(music_path):
-        print("Music not found, skipping.")
-        return video_path
-
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        video_path,
-        "-i",
-        music_path,
-        "-c:v",
-        "copy",
-        "-map",
-        "0:v:0",
-        "-map",
-        "1:a:0",
-        "-shortest",
-        output_path,
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"FFmpeg audio merge failed: {result.stderr}")
-
-    send_discord("Music added")
-    return output_path
-
-
-
 # VIDEO UPSCALING VIA COMFYUI
 
-def upscale_video(input_video_path, workflow_file="upscale_workflow.json"):
+async def upscale_video(input_video_path, workflow_file="upscale_workflow.json", timeout=None,
+                        kind="intermediate"):
     print("\n" + "=" * 60)
     print("UPSCALE: STARTING WORKFLOW")
     print("=" * 60)
-    send_discord("Starting upscale (this will take a while)")
+    notify("Starting upscale (this will take a while)")
 
-    copy_to_input_folder(input_video_path)
+    copy_to_input_folder(input_video_path, stages=("upscale",))
     video_basename = os.path.basename(input_video_path)
 
     print(f"Loading workflow from: {os.path.abspath(workflow_file)}")
-    with open(workflow_file, "r", encoding="utf-8") as f:
-        workflow = json.load(f)
+    workflow = load_workflow(workflow_file)
 
     nodes_map = get_nodes_map(workflow)
 
@@ -922,51 +734,72 @@ def upscale_video(input_video_path, workflow_file="upscale_workflow.json"):
     load_node["inputs"]["video"] = video_basename
     print(f"Set video filename to: {video_basename} on node {load_node_id}")
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    before_files = set(
-        [f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith(".mp4")]
+    # Keep the clip's own frame rate so individually upscaled segments
+    # play back at their original speed
+    fps = await get_fps(input_video_path)
+    frames = round(await get_duration(input_video_path) * fps)
+    budget, eta = durations.budget(
+        "upscale",
+        f"{os.path.basename(workflow_file)}:{UPSCALE_SIZE[0]}x{UPSCALE_SIZE[1]}",
+        units=frames,
+        default=7200,
     )
-    print(f"Existing output files: {len(before_files)}")
-
-    url = f"{COMFY_URL_BASE}/prompt"
-    client_id = f"client_upscale_{random.randint(1000,9999)}"
-    data = {"prompt": nodes_map, "client_id": client_id}
-
-    print(f"Sending prompt to ComfyUI (client: {client_id})...")
-
+    timeout = timeout or budget
+    notify(f"Upscaling {frames} frames (ETA {format_eta(eta)})")
+    for node in nodes_map.values():
+        if "VHS_VideoCombine" in str(node.get("class_type") or node.get("type") or ""):
+            node["inputs"]["frame_rate"] = fps
+            # The metadata PNG beside the mp4 is untracked and would keep the run dir alive
+            node["inputs"]["save_metadata"] = False
+    set_output_prefix(nodes_map, artefacts.comfy_prefix("upscaled"))
+
+    print(f"Sending prompt to ComfyUI (client: {comfy.client_id}), waiting for output file...")
     try:
-        r = requests.post(url, json=data, timeout=30)
-        print(f"Response: {r.status_code}")
-
-        if r.status_code == 200:
-            response_data = r.json()
-            print(f"Response data: {json.dumps(response_data, indent=2)[:500]}")
-        else:
-            print(f"Error response: {r.text[:500]}")
-
-        r.raise_for_status()
-
-    except requests.exceptions.RequestException as e:
-        print(f"Request failed: {e}")
-        raise
+        prompt_id, entry = await run_comfy_job(
+            nodes_map, "upscale", timeout, what=f"Upscale of {video_basename}"
+        )
+    except TimeoutError:
+        raise RuntimeError(f"Upscale of {video_basename} did not finish within {timeout:.0f}s")
 
-    print("\nWaiting for output file...")
-    output_path = wait_for_new_output(before_files, timeout=7200)
+    output_path = pick_largest_mp4(comfy.output_files(entry))
+    if not output_path:
+        raise RuntimeError(f"Upscale prompt {prompt_id} finished without saving a video")
 
     file_size = os.path.getsize(output_path)
     print(f"Output file size: {file_size:,} bytes")
 
     if file_size == 0:
         raise RuntimeError(f"Output file is empty: {output_path}")
-
-    wait_for_file_complete(output_path)
+    artefacts.add(output_path, kind=kind, stages=("assemble",))
 
     print(f"\n{'='*60}")
     print(f"UPSCALE COMPLETE: {os.path.basename(output_path)}")
     print(f"{'='*60}")
-    send_discord("Upscale complete")
+    notify("Upscale complete")
     return output_path
 
+async def get_upscaled_reaction(reaction_path, digest=None):
+    """
+    Return an upscaled copy of a reaction clip, upscaling it only the first
+    time it is seen. Cached copies are keyed by the hash of the source clip,
+    so renamed or moved clips still hit the cache. Pass `digest` when the
+    reaction index already knows it.
+    """
+    os.makedirs(REACTION_CACHE_DIR, exist_ok=True)
+    digest = digest or await asyncio.to_thread(file_hash, reaction_path)
+    cached_path = os.path.join(REACTION_CACHE_DIR, f"{digest}.mp4")
+
+    if os.path.exists(cached_path):
+        print(f"Using cached upscale for {os.path.basename(reaction_path)}")
+        return artefacts.add(cached_path, kind="cache", stages=("assemble",))
+
+    print(f"No cached upscale for {os.path.basename(reaction_path)}, upscaling...")
+    upscaled = await upscale_video(reaction_path)
+    return artefacts.link(
+        upscaled, REACTION_CACHE_DIR, name=f"{digest}.mp4", kind="cache", stages=("assemble",)
+    )
+
+
 def shutdown_pc(delay_seconds=10):
     """
     Initiates a full shutdown of the Windows PC.
@@ -984,23 +817,183 @@ def shutdown_pc(delay_seconds=10):
 
 
 
+# STARTUP ORCHESTRATION
+
+async def warm_up_comfyui(workflow_file="image_workflow.json", timeout=900):
+    """
+    Run a tiny one-step render of the image workflow so the checkpoint is
+    loaded before the first real image is requested. The result goes to a
+    PreviewImage node, so nothing lands in OUTPUT_DIR.
+    """
+    print("Warming up ComfyUI...")
+    workflow = load_workflow(workflow_file)
+
+    for node in workflow.values():
+        cls = node.get("class_type")
+        inputs = node.get("inputs", {})
+        if cls == "EmptySD3LatentImage":
+            inputs.update({"width": 64, "height": 64, "batch_size": 1})
+        elif cls == "KSampler":
+            inputs["steps"] = 1
+        elif cls == "SaveImage":
+            node["class_type"] = "PreviewImage"
+            inputs.pop("filename_prefix", None)
+
+    workflow["6"]["inputs"]["text"] = "warm up"
+    await admission.admit("image")
+    prompt_id = await comfy.submit(workflow)
+    try:
+        with waiting():
+            await comfy.wait(prompt_id, timeout=timeout)
+    except TimeoutError:
+        await abandon_prompt(prompt_id)
+        raise
+    print("ComfyUI warmed up.")
+    notify("ComfyUI warmed up")
+
+
+async def bring_up_comfyui():
+    with span("comfyui_start"):
+        await asyncio.to_thread(kill_comfy_processes)
+        launch_comfyui()
+        await wait_for_comfyui(timeout=600)
+        await comfy.start()
+    with span("comfyui_warmup"):
+        await warm_up_comfyui()
+
+
+async def prepare_metadata():
+    with span("ollama_start"):
+        if not await asyncio.to_thread(ollama_is_running):
+            await asyncio.to_thread(launch_ollama)
+            await wait_for_ollama(timeout=600)
+        else:
+            print("Ollama already running.")
+            notify("Ollama already running")
+
+    notify("Generating video metadata")
+    from prompts import generate_full_video_metadata, release_model
+
+    with span("ollama_metadata"):
+        meta = await asyncio.to_thread(generate_full_video_metadata)
+    # gemma3 stays pinned through the retries above; hand its VRAM to ComfyUI now
+    await asyncio.to_thread(release_model)
+    return meta
+
+
+_metrics_server = None
+
+
+def start_metrics_server():
+    """Serve this run's spans on METRICS_PORT, if set; once per process."""
+    global _metrics_server
+    if METRICS_PORT is None or _metrics_server is not None:
+        return
+    try:
+        _metrics_server = start_prometheus_server(METRICS_PORT)
+    except OSError as e:
+        logging.warning(f"Could not serve metrics on port {METRICS_PORT}: {e}")
+
+
+async def start_pipeline_services(meta=None):
+    """
+    Cold-start and warm up ComfyUI while Ollama writes the metadata.
+    Returns the metadata once both sides are ready, so the first
+    generate_images call never waits on anything else. Metadata that is
+    already known (a promoted draft) skips Ollama entirely.
+    """
+    start_metrics_server()
+    if meta is not None:
+        await bring_up_comfyui()
+        return meta
+    meta, _ = await asyncio.gather(prepare_metadata(), bring_up_comfyui())
+    return meta
+
+
+def prepare_upload():
+    from upload import start_token_refresher
+
+    start_token_refresher()
+
+
+_external_comfy = False
+
+
+def use_external_comfyui():
+    """
+    Work against a ComfyUI this process didn't start (the CLI's one-off
+    commands): it can't be restarted from here, so recoveries that need a
+    restart fail instead of launching a second instance.
+    """
+    global _external_comfy
+    _external_comfy = True
+
+
+async def restart_comfyui():
+    if _external_comfy:
+        raise RuntimeError("ComfyUI needs a restart, but it isn't managed by this process")
+    admission.resident = None
+    await comfy.close()
+    # SIGTERM -> SIGKILL escalation happens inside the supervisor
+    await asyncio.to_thread(COMFY.stop)
+
+    print("ComfyUI processes cleared.")
+
+    print("\n" + "=" * 60)
+    print("RESTARTING COMFYUI")
+    print("=" * 60)
+
+    launch_comfyui()
+    await wait_for_comfyui(timeout=600)
+    await comfy.start()
+
+
+
 # MAIN PIPELINE
 
-def main():
+async def main(draft=False, promote=None):
     start_time = time.time()
     print("\n" + "=" * 60)
     print("COMFYUI SHORT GENERATION + UPLOAD")
     print("=" * 60)
 
-    if not ollama_is_running():
-        launch_ollama()
-        wait_for_ollama(timeout=600)
-    else:
-        print("Ollama already running.")
-        send_discord("Ollama already running")
+    if PREVIEW_ABORT and not comfy.preview_hooks:
+        hook = previews.default_preview_hook()
+        if hook:
+            comfy.add_preview_hook(hook)
+    sampler = telemetry.Sampler(
+        lambda: comfy.get_json("/system_stats", timeout=2), lambda: COMFY.pid
+    ).start()
+    # Get the YouTube client built and its token kept fresh while we render
+    youtube_ready = None if draft else asyncio.create_task(asyncio.to_thread(prepare_upload))
+    try:
+        await run_pipeline(draft=draft, promote=promote, youtube_ready=youtube_ready)
+    finally:
+        if youtube_ready is not None:
+            # The run may have failed before the upload step awaited it
+            youtube_ready.cancel()
+            try:
+                await youtube_ready
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logging.warning(f"YouTube client warm-up failed: {e}")
+        await sampler.stop()
+        await comfy.close()
+
+
+async def run_pipeline(draft=False, promote=None, youtube_ready=None):
+    """
+    Render one short. `draft` renders a cheap preview (DRAFT_PROFILE, no
+    upscale, no upload) and records it for review; `promote` re-renders the
+    draft with that run id at full quality from its manifest and uploads it.
+    `youtube_ready` is the task warming up the YouTube client, if any.
+    """
+    source = run_manifest.load_manifest(promote) if promote else None
+    if source and source["mode"] != "draft":
+        raise RuntimeError(f"Run {promote} is not a draft")
 
-    send_discord("Generating video metadata")
-    meta = generate_full_video_metadata()
+    meta = await start_pipeline_services(source["meta"] if source else None)
     PROMPTS = meta["prompts"]
     TITLE = meta["title"]
     DESCRIPTION = meta["description"]
@@ -1013,138 +1006,295 @@ def main():
     print("Description:", DESCRIPTION)
     print("Tags:", TAGS)
     print("Start generation…")
-    send_discord(f"Starting generation - Title: {TITLE[:100]}")
+    notify(f"Starting generation - Title: {TITLE[:100]}")
 
-    kill_comfy_processes()
-
-    if not find_comfy_port():
-        launch_comfyui()
-        wait_for_comfyui()
+    manifest = run_manifest.new_manifest(
+        "draft" if draft else "final", meta, source["layout"] if source else TIMELINE_FILE
+    )
+    manifest["promoted_from"] = promote
+    run_manifest.save_manifest(manifest)
+
+    # Several seeds come out of one batched job; the first that passes is used
+    current_image = source["image"] if source else None
+    if current_image and not os.path.exists(current_image):
+        raise RuntimeError(f"Draft image is gone: {current_image}")
+    for attempt in range(0 if source else QUALITY_REGENERATIONS + 1):
+        with span("image", attempt=attempt + 1) as sp:
+            candidates = (await generate_images([PROMPTS[0]], per_prompt=IMAGE_CANDIDATES))[0]
+            sp.add_output(*candidates)
+        for candidate in candidates:
+            score = await quality.analyse_image(candidate)
+            if score["passed"]:
+                current_image = candidate
+                break
+        if current_image:
+            break
+        notify(f"Image rejected ({', '.join(score['reasons'])}), regenerating")
     else:
-        print("ComfyUI already running.")
-        send_discord("ComfyUI already running")
-    start_websocket_monitor()
-
-    current_image = generate_image(PROMPTS[0])
+        if not source:
+            raise RuntimeError("Initial image failed the quality gate: " + ", ".join(score["reasons"]))
+    # A draft's image is kept like a final so it can be promoted later
+    artefacts.add(current_image, kind="final" if draft or source else "intermediate", stages=("video",))
+    copy_to_input_folder(current_image, stages=("video",))
+    manifest["image"] = current_image
+    run_manifest.save_manifest(manifest)
 
     generated_videos = []
-    for i, prompt in enumerate(PROMPTS[1:], start=1):
-        v = generate_video(current_image, prompt, video_num=i)
-        generated_videos.append(v)
-        if i < 3:
-            current_image = extract_last_frame(v)
-
-    send_discord("Selecting reaction clips")
-    reactions1_dir = os.path.join(os.getcwd(), "reactions", "1")
-    reactions2_dir = os.path.join(os.getcwd(), "reactions", "2")
-
-    def list_mp4s(path):
-        return [
-            os.path.join(path, f)
-            for f in os.listdir(path)
-            if f.lower().endswith(".mp4")
-        ]
+    if CHAIN_VIDEO_JOBS or draft or source:
+        generated_videos, manifest["video_seeds"] = await generate_video_chain(
+            current_image,
+            PROMPTS[1:],
+            profile=DRAFT_PROFILE if draft else None,
+            seeds=source["video_seeds"] if source else None,
+        )
+        run_manifest.save_manifest(manifest)
+    else:
+        for i, prompt in enumerate(PROMPTS[1:], start=1):
+            for attempt in range(QUALITY_REGENERATIONS + 1):
+                with span("video", index=i, attempt=attempt + 1) as sp:
+                    sp.add_input(current_image)
+                    v = await generate_video(current_image, prompt, video_num=i)
+                    sp.add_output(v)
+                with span("quality", index=i) as sp:
+                    sp.add_input(v)
+                    score = await quality.analyse_clip(v)
+                if score["passed"]:
+                    break
+                artefacts.release(v)
+                notify(f"Video {i} rejected ({', '.join(score['reasons'])}), regenerating")
+            else:
+                raise RuntimeError(
+                    f"Video {i} failed the quality gate: " + ", ".join(score["reasons"])
+                )
+            generated_videos.append(v)
+            if i < 3:
+                with span("frame_extraction", index=i) as sp:
+                    sp.add_input(v)
+                    current_image = await extract_last_frame(v)
+                    sp.add_output(current_image)
+    artefacts.release_stage("video")
+
+    notify("Selecting reaction clips")
+    layout = timeline.load_timeline(manifest["layout"])
+
+    reactions = ReactionIndex()
+    if source:
+        reaction_picks = source["reactions"]
+    else:
+        await reactions.rescan()
+        # Each pool supplies as many distinct clips as the layout asks for,
+        # favouring rarely used ones and skipping the last few runs' picks
+        reaction_picks = {
+            pool: reactions.draw(pool, count)
+            for pool, count in timeline.pool_demand(layout).items()
+        }
+    manifest["reactions"] = {
+        pool: [{"path": c["path"], "hash": c["hash"]} for c in picks]
+        for pool, picks in reaction_picks.items()
+    }
+    run_manifest.save_manifest(manifest)
 
-    r1_list = list_mp4s(reactions1_dir)
-    r2_list = list_mp4s(reactions2_dir)
+    if draft:
+        reactions.close()
+        await render_and_record_draft(manifest, layout, generated_videos, reaction_picks)
+        return
 
-    reaction1_a = random.choice(r1_list)
-    r1_list.remove(reaction1_a)
-    reaction1_b = random.choice(r1_list)
+    # MAKE ROOM FOR SEEDVR2: UNLOAD WAN IN PLACE, RESTART ONLY IF THAT FAILS
+    print("\n" + "=" * 60)
+    print("FREEING COMFYUI MEMORY FOR UPSCALING")
+    print("=" * 60)
 
-    reaction2_a = random.choice(r2_list)
-    r2_list.remove(reaction2_a)
-    reaction2_b = random.choice(r2_list)
+    with span("admission", family="upscale"):
+        action = await admission.admit("upscale")
+    notify(f"ComfyUI ready for upscaling ({action})")
+    print(f"ComfyUI ready for upscaling ({action}).")
+
+    # UPSCALE ONLY THE GENERATED SEGMENTS; REACTIONS COME FROM THE CACHE
+    upscaled_videos = []
+    for i, v in enumerate(generated_videos, start=1):
+        notify(f"Upscaling video {i}/3")
+        with span("upscale", index=i) as sp:
+            sp.add_input(v)
+            upscaled_videos.append(await upscale_video(v))
+            sp.add_output(upscaled_videos[-1])
+
+    notify("Fetching upscaled reaction clips")
+    with span("upscale", index="reactions") as sp:
+        upscaled_picks = {}
+        for pool, picks in reaction_picks.items():
+            upscaled_picks[pool] = []
+            for clip in picks:
+                sp.add_input(clip["path"])
+                cached = await get_upscaled_reaction(clip["path"], digest=clip["hash"])
+                reactions.set_cache_path(clip["hash"], cached)
+                upscaled_picks[pool].append(cached)
+    reactions.close()
+    artefacts.release_stage("upscale")
+
+    # ASSEMBLE THE LAYOUT, MUSIC INCLUDED, IN ONE ENCODE
+    print("\n" + "=" * 60)
+    print(f"ASSEMBLING LAYOUT: {layout.get('name', TIMELINE_FILE)}")
+    print("=" * 60)
+    notify("Assembling final video")
 
-    v1 = generated_videos[0]
-    v1_first = os.path.join(PROJECT_OUTPUT, "v1_first_half.mp4")
-    v1_second = os.path.join(PROJECT_OUTPUT, "v1_second_half.mp4")
-    split_video_half(v1, v1_first, v1_second)
+    sources = {f"video{i}": v for i, v in enumerate(upscaled_videos, start=1)}
+    music_path = os.path.join(os.getcwd(), "song.mp3")
+    if os.path.exists(music_path):
+        sources["music"] = music_path
+    else:
+        print("Music not found, assembling without it.")
 
-    sequence = [
-        v1_first,
-        reaction1_a,
-        v1_second,
-        reaction1_b,
-        generated_videos[1],
-        reaction2_a,
-        generated_videos[2],
-        reaction2_b,
-    ]
+    final_output_with_music = os.path.join(
+        PROJECT_OUTPUT, f"final_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+    )
+    with span("assemble", layout=layout.get("name", "timeline")) as sp:
+        plan = await timeline.plan_timeline(layout, sources, pools=upscaled_picks)
+        cost = timeline.estimate_cost(plan)
+        timeout, eta = assemble_budget(plan, cost)
+        print(f"Timeline: {cost['duration']:.1f}s, {cost['frames']} frames, ETA {format_eta(eta)}")
+        sp.add_input(*(c["path"] for c in plan["clips"]))
+        await timeline.render_timeline(
+            plan, final_output_with_music, timeout=timeout, on_stderr_line=ffmpeg_log.info
+        )
+        sp.add_output(final_output_with_music)
+    artefacts.add(final_output_with_music, kind="final")
+    artefacts.release_stage("assemble")
+    manifest["output"] = final_output_with_music
+    manifest["status"] = "rendered"
+    run_manifest.save_manifest(manifest)
+    notify("Final video assembled")
 
-    stitched_path = os.path.join(PROJECT_OUTPUT, "stitched.mp4")
-    concat_videos(sequence, stitched_path)
+    print("\nFINAL OUTPUT WITH MUSIC:", final_output_with_music)
 
-    print("\nDONE. Stitched path (no music yet):", stitched_path)
+    # UPLOAD
+    import upload_queue
 
-    # CLEAN SHUTDOWN OF COMFYUI
-    print("\n" + "=" * 60)
-    print("SHUTTING DOWN COMFYUI FOR UPSCALE RESTART")
-    print("=" * 60)
-    send_discord("Restarting ComfyUI for upscaling")
+    # Queued first so a failed upload is retried later instead of lost
+    publish_at = (
+        upload_queue.next_publish_time(PUBLISH_CADENCE_HOURS)
+        if PUBLISH_CADENCE_HOURS
+        else None
+    )
+    job_id = upload_queue.enqueue(
+        final_output_with_music, TITLE, DESCRIPTION, TAGS, publish_at=publish_at
+    )
 
-    stop_websocket_monitor()
+    try:
+        if youtube_ready is not None:
+            await youtube_ready
+    except Exception as e:
+        logging.warning(f"YouTube client warm-up failed, building it at upload time: {e}")
 
-    kill_comfy_processes()
-    time.sleep(5)
+    print("\nUPLOADING TO YOUTUBE…")
+    notify("Uploading to YouTube")
+    with span("upload") as sp:
+        sp.add_input(final_output_with_music)
+        attempted = await asyncio.to_thread(upload_queue.process_queue)
+
+    ours = next((j for j in attempted if j["id"] == job_id), None)
+    if ours and ours["status"] == "done":
+        print("Upload complete.")
+        if publish_at:
+            notify(f"Upload complete! Video goes live at {publish_at:%Y-%m-%d %H:%M} UTC")
+        else:
+            notify("Upload complete! Video is live")
+    else:
+        reason = ours["error"] if ours else "waiting for quota or schedule"
+        print(f"Upload deferred ({reason}); it stays queued as {job_id}.")
+        notify(f"Upload deferred, queued as {job_id}: {str(reason)[:300]}")
+
+    manifest["status"] = "uploaded" if ours and ours["status"] == "done" else "queued"
+    manifest["upload_job"] = job_id
+    run_manifest.save_manifest(manifest)
+    if source:
+        source["status"] = "promoted"
+        source["promoted_by"] = manifest["run_id"]
+        run_manifest.save_manifest(source)
 
-    # Verify processes are gone
-    remaining = kill_comfy_processes()
-    if remaining > 0:
-        print(f"Warning: {remaining} processes still found, waiting longer...")
-        time.sleep(5)
-        kill_comfy_processes()
+    # CLEANUP
+    with span("cleanup"):
+        freed = await asyncio.to_thread(artefacts.collect)
+    print(f"Freed {freed / 1024**2:.0f} MB of intermediates and expired outputs")
+    await asyncio.to_thread(stop_services)
+    shutdown_pc()
 
-    print("ComfyUI processes cleared.")
 
-    # RESTART COMFYUI FOR UPSCALING
-    print("\n" + "=" * 60)
-    print("RESTARTING COMFYUI FOR UPSCALING")
-    print("=" * 60)
 
-    launch_comfyui()
-    wait_for_comfyui(timeout=600)
-    start_websocket_monitor()
-    print("ComfyUI ready for upscaling.")
+def assemble_budget(plan, cost):
+    """
+    The timeline's own cost estimate is the unit of work, so the model
+    learns how far this machine is off it. Without history render_timeline
+    sizes the timeout from the estimate alone.
+    """
+    w, h = plan["size"]
+    return durations.budget(
+        "assemble", f"{plan['name']}:{w}x{h}", units=max(cost["estimated_seconds"], 1)
+    )
 
-    # UPSCALE VIDEO
-    upscaled_output = upscale_video(stitched_path)
-    print("\nUPSCALED FINAL:", upscaled_output)
 
-    # NOW ADD MUSIC TO UPSCALED VIDEO
+async def render_and_record_draft(manifest, layout, videos, reaction_picks):
+    """Assemble a draft from the raw segments and reactions and wait for review."""
     print("\n" + "=" * 60)
-    print("ADDING MUSIC TO UPSCALED VIDEO")
+    print("ASSEMBLING DRAFT")
     print("=" * 60)
+    notify("Assembling draft")
 
+    sources = {f"video{i}": v for i, v in enumerate(videos, start=1)}
     music_path = os.path.join(os.getcwd(), "song.mp3")
-    final_path = os.path.join(
-        PROJECT_OUTPUT, f"final_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+    if os.path.exists(music_path):
+        sources["music"] = music_path
+    pools = {pool: [c["path"] for c in picks] for pool, picks in reaction_picks.items()}
+    layout = dict(layout, size=list(DRAFT_PROFILE["assemble_size"]))
+
+    draft_path = os.path.join(
+        PROJECT_OUTPUT, f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+    )
+    with span("assemble", layout=layout.get("name", "timeline"), draft=True) as sp:
+        plan = await timeline.plan_timeline(layout, sources, pools=pools)
+        timeout, _ = assemble_budget(plan, timeline.estimate_cost(plan))
+        sp.add_input(*(c["path"] for c in plan["clips"]))
+        await timeline.render_timeline(
+            plan, draft_path, timeout=timeout, on_stderr_line=ffmpeg_log.info
+        )
+        sp.add_output(draft_path)
+    artefacts.add(draft_path, kind="final")
+    artefacts.release_stage("upscale")
+
+    manifest["output"] = draft_path
+    manifest["status"] = "draft"
+    run_manifest.save_manifest(manifest)
+    print(f"\nDRAFT: {draft_path}")
+    notify(
+        f"Draft ready: {os.path.basename(draft_path)} ({manifest['meta']['title'][:100]}). "
+        f"Promote with: python cli.py promote {manifest['run_id']}"
     )
-    final_output_with_music = add_music(upscaled_output, music_path, final_path)
 
-    print("\nFINAL OUTPUT WITH MUSIC:", final_output_with_music)
+    with span("cleanup"):
+        await asyncio.to_thread(artefacts.collect)
+    await asyncio.to_thread(stop_services)
 
-    # UPLOAD
-    print("\nUPLOADING TO YOUTUBE…")
-    send_discord("Uploading to YouTube")
-    upload_short(final_output_with_music, TITLE, DESCRIPTION, TAGS)
-    print("Upload complete.")
-    send_discord("Upload complete! Video is live")
 
-    # CLEANUP
-    kill_comfy_processes()
-    shutdown_pc()
 
+# ENTRY
 
+def init():
+    """Process-wide setup; kept out of import time so the CLI stays cheap."""
+    setup_logging()
+    os.makedirs(PROJECT_OUTPUT, exist_ok=True)
 
-# ENTRY
 
-if __name__ == "__main__":
-    send_discord("YouTube Shorts pipeline started")
+def run(draft=False, promote=None):
+    """The full nightly pipeline, with notifications, cleanup and metrics."""
+    init()
+    if promote:
+        send_discord(f"YouTube Shorts pipeline started (promoting draft {promote})")
+    else:
+        send_discord(f"YouTube Shorts pipeline started{' (draft)' if draft else ''}")
     logging.info("Script started.")
     pipeline_start = time.time()
     try:
-        main()
+        with span(ROOT_STAGE):
+            asyncio.run(main(draft=draft, promote=promote))
         elapsed = time.time() - pipeline_start
         hours, remainder = divmod(int(elapsed), 3600)
         minutes, seconds = divmod(remainder, 60)
@@ -1157,4 +1307,16 @@ if __name__ == "__main__":
         import traceback
 
         traceback.print_exc()
-    logging.info("Script finished.")
\ No newline at end of file
+    finally:
+        stop_services()
+        _discord_pool.shutdown(wait=True)
+        try:
+            write_prometheus()
+        except OSError as e:
+            logging.warning(f"Could not write metrics: {e}")
+    logging.info("Script finished.")
+    stop_logging()
+
+
+if __name__ == "__main__":
+    run()
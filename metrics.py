@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRICS_DIR = os.path.join(os.getcwd(), "metrics")
+SPANS_FILE = os.path.join(METRICS_DIR, "spans.jsonl")
+PROM_FILE = os.path.join(METRICS_DIR, "pipeline.prom")
+
+ROOT_STAGE = "pipeline"  # the span around a whole run
+RUN_ID = datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+
+_lock = threading.Lock()
+_finished = []
+_current = contextvars.ContextVar("current_span", default=None)
+_open = []  # spans in progress in any task or thread, oldest first
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+class Span:
+    """Timing and I/O totals for one pipeline stage."""
+
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+        self.start = time.time()
+        self.end = None
+        self.wait_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.status = "ok"
+        self.work_key = None
+        self.units = 0.0
+
+    def add_work(self, key, units):
+        """
+        Record what the stage processed (see durations.py): `key` names the
+        kind of job, `units` how much of it. Work of another kind in the
+        same span leaves the span unusable for the duration model.
+        """
+        if self.units and key != self.work_key:
+            self.work_key = None
+        elif not self.units:
+            self.work_key = key
+        self.units += units
+
+    def add_input(self, *paths):
+        self.bytes_in += sum(_size(p) for p in paths)
+
+    def add_output(self, *paths):
+        self.bytes_out += sum(_size(p) for p in paths)
+
+    @contextmanager
+    def waiting(self):
+        """Count the enclosed block as wait time rather than active time."""
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.wait_seconds += time.time() - t0
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            "run_id": RUN_ID,
+            "stage": self.stage,
+            "labels": self.labels,
+            "start": self.start,
+            "duration": round(self.duration, 3),
+            "wait": round(self.wait_seconds, 3),
+            "active": round(max(self.duration - self.wait_seconds, 0.0), 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "status": self.status,
+            "key": self.work_key,
+            "units": round(self.units, 3),
+        }
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a pipeline stage and append it to SPANS_FILE when it ends.
+
+        with span("video", index=2) as s:
+            s.add_input(image_path)
+            path = generate_video(...)
+            s.add_output(path)
+    """
+    s = Span(stage, **labels)
+    token = _current.set(s)
+    with _lock:
+        _open.append(s)
+    try:
+        yield s
+    except BaseException:
+        s.status = "error"
+        raise
+    finally:
+        _current.reset(token)
+        with _lock:
+            _open.remove(s)
+        s.end = time.time()
+        record(s)
+
+
+def current_span():
+    return _current.get()
+
+
+def current_stage():
+    s = _current.get()
+    return s.stage if s else None
+
+
+def longest_stage():
+    """
+    The longest-running span still open in any task or thread, not counting
+    the ROOT_STAGE span around the run. Shorter spans opened alongside it (a
+    quality check while ComfyUI renders) don't take over.
+    """
+    with _lock:
+        stages = [s.stage for s in _open if s.stage != ROOT_STAGE]
+        if stages:
+            return stages[0]
+        return _open[0].stage if _open else None
+
+
+@contextmanager
+def waiting():
+    """Mark a polling/sleep block as wait time on whatever span is current."""
+    s = _current.get()
+    if s is None:
+        yield
+        return
+    with s.waiting():
+        yield
+
+
+def record(s):
+    entry = s.to_dict()
+    with _lock:
+        _finished.append(entry)
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(SPANS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logging.warning(f"Could not write span: {e}")
+    logging.info(
+        f"[{entry['stage']}] {entry['duration']:.1f}s "
+        f"(wait {entry['wait']:.1f}s, in {entry['bytes_in']:,}B, out {entry['bytes_out']:,}B)"
+    )
+
+
+def _tail_lines(path, count, block=64 * 1024):
+    """The last `count` lines of a file, read backwards in blocks."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    # Past `count` newlines, the possibly cut first line is never among the last `count`
+    return data.decode("utf-8", errors="replace").splitlines()[-count:]
+
+
+def load_spans(path=SPANS_FILE, tail=None):
+    """Recorded spans, oldest first; only the last `tail` of them if given."""
+    if not os.path.exists(path):
+        return []
+    if tail is None:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    else:
+        lines = _tail_lines(path, tail)
+    spans = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+
+# PROMETHEUS TEXT FORMAT
+
+def _prom_escape(value):
+    # Exposition format: backslash, double quote and newline must be escaped.
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(entry):
+    labels = {"run_id": RUN_ID, "stage": entry["stage"]}
+    labels.update(entry["labels"])
+    return ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels.items())
+
+
+def render_prometheus():
+    with _lock:
+        entries = list(_finished)
+
+    lines = []
+    for metric, key, help_text in (
+        ("pipeline_stage_duration_seconds", "duration", "Wall time of a pipeline stage"),
+        ("pipeline_stage_wait_seconds", "wait", "Time a stage spent waiting or polling"),
+        ("pipeline_stage_active_seconds", "active", "Time a stage spent doing work"),
+        ("pipeline_stage_bytes_in", "bytes_in", "Bytes read by a stage"),
+        ("pipeline_stage_bytes_out", "bytes_out", "Bytes written by a stage"),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for entry in entries:
+            lines.append(f"{metric}{{{_prom_labels(entry)}}} {entry[key]}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=PROM_FILE):
+    """Write this run's spans for a node_exporter textfile collector."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+def start_prometheus_server(port=9464):
+    """Serve this run's spans at http://127.0.0.1:<port>/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Metrics served on http://127.0.0.1:{port}/metrics")
+    return server
@@ -0,0 +1,77 @@
+"""
+Early-abort checks on ComfyUI's live sampler previews.
+
+ComfyUI streams a small JPEG/PNG of the current latent over the websocket
+while a sampler runs (it has to be started with --preview-method auto or
+latent2rgb). ComfyClient keeps the newest one per prompt and hands it to
+preview hooks; a hook returning a reason aborts the prompt.
+
+The hook here flags sampler output that is already lost a few steps in:
+
+    black      mean luma below BLACK_LEVEL
+    uniform    luma standard deviation below UNIFORM_STD (NaNs, dead latents)
+    collapsed  almost no edges left (mean neighbour difference below
+               COLLAPSE_EDGE): a smeared blob rather than a picture
+
+Pillow and NumPy are imported lazily; without them no hook is installed.
+"""
+import io
+import logging
+
+
+SAMPLER_CLASS_TYPES = {"KSampler", "KSamplerAdvanced", "SamplerCustom", "SamplerCustomAdvanced"}
+MIN_STEP_FRACTION = 0.3  # early previews are mostly noise; judge from here on
+BLACK_LEVEL = 8.0  # 0-255
+UNIFORM_STD = 3.0
+COLLAPSE_EDGE = 0.8
+
+
+def decode_preview(preview):
+    """The preview image as a float32 luma array (height x width)."""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(preview["image"])) as img:
+        return np.asarray(img.convert("L"), dtype=np.float32)
+
+
+def degenerate_reason(luma):
+    """Why a luma array looks like a failed generation, or None."""
+    import numpy as np
+
+    mean = float(luma.mean())
+    if mean < BLACK_LEVEL:
+        return f"black preview (mean luma {mean:.1f})"
+    std = float(luma.std())
+    if std < UNIFORM_STD:
+        return f"uniform preview (luma std {std:.1f})"
+    edges = float(
+        (np.abs(np.diff(luma, axis=0)).mean() + np.abs(np.diff(luma, axis=1)).mean()) / 2
+    )
+    if edges < COLLAPSE_EDGE:
+        return f"collapsed preview (edge energy {edges:.2f})"
+    return None
+
+
+def sampler_preview_check(preview):
+    """
+    Preview hook: judge sampler previews once MIN_STEP_FRACTION of the
+    steps are done. Anything else (loaders, VAE, upscalers) passes.
+    """
+    if preview.get("class_type") not in SAMPLER_CLASS_TYPES:
+        return None
+    step, steps = preview.get("step"), preview.get("steps")
+    if not steps or step is None or step < steps * MIN_STEP_FRACTION:
+        return None
+    return degenerate_reason(decode_preview(preview))
+
+
+def default_preview_hook():
+    """sampler_preview_check if Pillow and NumPy are installed, else None."""
+    try:
+        import numpy  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError:
+        logging.warning("Pillow/NumPy not installed; sampler previews won't be checked")
+        return None
+    return sampler_preview_check
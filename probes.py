@@ -0,0 +1,74 @@
+import time
+import random
+import asyncio
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# SHARED HTTP SESSION
+
+_session = None
+
+
+def get_session():
+    """One pooled session for every local health check and API call."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def http_ok(url, timeout=2):
+    try:
+        return get_session().get(url, timeout=timeout).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+
+# BACKOFF
+
+def backoff_intervals(initial=0.1, maximum=5.0, factor=2.0, jitter=0.25):
+    """
+    Yield sleep intervals that start small and grow exponentially up to
+    `maximum`, each scaled by a random +/- `jitter` fraction.
+    """
+    interval = initial
+    while True:
+        yield interval * random.uniform(1 - jitter, 1 + jitter)
+        interval = min(interval * factor, maximum)
+
+
+class Probe:
+    """
+    A named readiness check.
+
+    `check` returns True once the service is ready. `abort`, if given, is
+    called between attempts and may raise to stop waiting early (e.g. when
+    the child process has already exited).
+    """
+
+    def __init__(self, name, check, abort=None):
+        self.name = name
+        self.check = check
+        self.abort = abort
+
+    async def wait_async(self, timeout=600, initial=0.1, maximum=5.0):
+        start = time.time()
+        for interval in backoff_intervals(initial, maximum):
+            if self.abort:
+                self.abort()
+            if await asyncio.to_thread(self.check):
+                logging.info(f"{self.name} ready after {time.time() - start:.1f}s")
+                return True
+            if time.time() - start + interval > timeout:
+                break
+            await asyncio.sleep(interval)
+
+        raise TimeoutError(f"{self.name} did not become ready within {timeout} seconds")
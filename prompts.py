@@ -1,8 +1,10 @@
 import logging
-from ollama import chat
 import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+from config import OLLAMA_URL_BASE
 
 example_prompts = [
     "A full-body shot of an extremely old, frail man with thin white hair, standing alone on the massive glossy America's Got Talent stage. Bright blue and purple stage lights beam down, dramatic shadows on star-patterned floor. Ultra-realistic, 8k detail, cinematic composition.",
@@ -194,23 +196,30 @@ def concepts_are_too_similar(new_concepts, history_concepts, threshold=0.6):
     
     return False
 
-def generate_full_video_metadata(example_prompts=example_prompts, max_retries=3):
-    recent_concepts = load_recent_creatures()
-    
-    # Build avoidance guidance from recent concepts
-    avoid_items = []
-    if recent_concepts:
-        for concept in recent_concepts[-10:]:
-            if concept.get("starting_character"):
-                avoid_items.append(concept["starting_character"])
-            avoid_items.extend(concept.get("transformations", [])[:2])
-    
-    avoid_text = ", ".join(set(avoid_items)) if avoid_items else "none"
 
-    user_prompt = f"""
-You are a creative visual AI prompt generator generating prompts for videos of an America's Got Talent performance.
+MODEL = "gemma3"
+KEEP_ALIVE = "30m"  # keep gemma3 resident across retries and candidates
+
+_client = None
+
 
-AVOID using these recently used concepts: {avoid_text}
+def get_client():
+    """One pooled Ollama client, so every request reuses the same connection."""
+    global _client
+    if _client is None:
+        from ollama import Client
+        _client = Client(host=OLLAMA_URL_BASE)
+    return _client
+
+
+def build_system_prompt(example_prompts=example_prompts):
+    """
+    The static instructions and examples. This never changes between calls,
+    so Ollama can keep its evaluated KV cache for this prefix and only
+    process the short user message each time.
+    """
+    return f"""
+You are a creative visual AI prompt generator generating prompts for videos of an America's Got Talent performance.
 
 Generate exactly this JSON structure:
 
@@ -251,50 +260,105 @@ EXAMPLES (style reference):
 Return only valid JSON.
 """
 
-    for attempt in range(max_retries):
-        response = chat(
-            model='gemma3',
-            messages=[{'role': 'user', 'content': user_prompt}]
-        )
 
-        resp_text = response.message.content
-        if resp_text.startswith("```"):
-            lines = resp_text.splitlines()
-            resp_text = "\n".join(lines[1:-1])
+def build_user_prompt(avoid_text):
+    """The only part of the request that changes between runs."""
+    return (
+        f"AVOID using these recently used concepts: {avoid_text}\n\n"
+        "Generate the JSON now."
+    )
 
-        # Clean up response - remove markdown code blocks and extra text
-        resp_text = resp_text.strip()
 
-        # Remove markdown code blocks if present
-        if "```json" in resp_text:
-            resp_text = resp_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in resp_text:
-            resp_text = resp_text.split("```")[1].split("```")[0].strip()
+def parse_metadata_response(resp_text):
+    if resp_text.startswith("```"):
+        lines = resp_text.splitlines()
+        resp_text = "\n".join(lines[1:-1])
 
-        # Try to find JSON object boundaries if there's extra text
-        if not resp_text.startswith("{"):
-            # Look for first { and last }
-            start = resp_text.find("{")
-            end = resp_text.rfind("}") + 1
-            if start != -1 and end > start:
-                resp_text = resp_text[start:end]
+    # Clean up response - remove markdown code blocks and extra text
+    resp_text = resp_text.strip()
+
+    # Remove markdown code blocks if present
+    if "```json" in resp_text:
+        resp_text = resp_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in resp_text:
+        resp_text = resp_text.split("```")[1].split("```")[0].strip()
+
+    # Try to find JSON object boundaries if there's extra text
+    if not resp_text.startswith("{"):
+        # Look for first { and last }
+        start = resp_text.find("{")
+        end = resp_text.rfind("}") + 1
+        if start != -1 and end > start:
+            resp_text = resp_text[start:end]
+
+    try:
+        data = json.loads(resp_text)
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse JSON. Raw response:\n{resp_text}")
+        raise
+
+    if ("prompts" not in data or
+        not isinstance(data["prompts"], list) or
+        len(data["prompts"]) != 4):
+        raise ValueError("Ollama did not return a valid prompts array.")
+
+    return data
+
+
+def request_metadata(messages):
+    response = get_client().chat(model=MODEL, messages=messages, keep_alive=KEEP_ALIVE)
+    return parse_metadata_response(response.message.content)
+
+
+def release_model():
+    """Unload gemma3 now rather than letting it hold VRAM the video models need."""
+    try:
+        get_client().generate(model=MODEL, prompt="", keep_alive=0)
+    except Exception as e:
+        logging.warning(f"Could not unload {MODEL}: {e}")
+
+
+def generate_full_video_metadata(example_prompts=example_prompts, max_retries=3, candidates=1):
+    """
+    Ask gemma3 for prompts, title, description and tags that don't repeat
+    recent concepts. With `candidates` > 1 each round requests several
+    generations in parallel; they share the cached system prefix, so the
+    extra candidates mostly cost decode time.
+    """
+    recent_concepts = load_recent_creatures()
+    
+    # Build avoidance guidance from recent concepts
+    avoid_items = []
+    if recent_concepts:
+        for concept in recent_concepts[-10:]:
+            if concept.get("starting_character"):
+                avoid_items.append(concept["starting_character"])
+            avoid_items.extend(concept.get("transformations", [])[:2])
+    
+    # Sorted so an unchanged avoid list gives a byte-identical request
+    avoid_text = ", ".join(sorted(set(avoid_items))) if avoid_items else "none"
+
+    messages = [
+        {"role": "system", "content": build_system_prompt(example_prompts)},
+        {"role": "user", "content": build_user_prompt(avoid_text)},
+    ]
+
+    data = None
+    for attempt in range(max_retries):
+        if candidates > 1:
+            with ThreadPoolExecutor(max_workers=candidates) as pool:
+                batch = list(pool.map(request_metadata, [messages] * candidates))
+        else:
+            batch = [request_metadata(messages)]
+
+        for data in batch:
+            # Extract concepts from this generation
+            new_concepts = extract_key_concepts(data["prompts"])
+
+            # Check for similarity with recent generations
+            if concepts_are_too_similar(new_concepts, recent_concepts):
+                continue
 
-        try:
-            data = json.loads(resp_text)
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse JSON. Raw response:\n{resp_text}")
-            raise
-
-        if ("prompts" not in data or
-            not isinstance(data["prompts"], list) or
-            len(data["prompts"]) != 4):
-            raise ValueError("Ollama did not return a valid prompts array.")
-
-        # Extract concepts from this generation
-        new_concepts = extract_key_concepts(data["prompts"])
-        
-        # Check for similarity with recent generations
-        if not concepts_are_too_similar(new_concepts, recent_concepts):
             # Append tags to description
             if "tags" in data and data["tags"]:
                 hashtags = " ".join(f"#{tag.replace(' ', '')}" for tag in data["tags"])
@@ -0,0 +1,127 @@
+"""
+Cheap checks on generated media before it is worth upscaling.
+
+Each check is a single ffmpeg decode of a downscaled copy and takes a few
+seconds on the CPU:
+
+    clips   blackdetect (black stretches), freezedetect (held frames) and
+            the per-frame scene score (how much actually moves)
+    images  signalstats luma average and spread (black or washed-out frames)
+"""
+import re
+import logging
+
+from ffmpeg_runner import ffprobe, run_ffmpeg
+
+
+ANALYSIS_WIDTH = 160
+
+MAX_BLACK_RATIO = 0.25  # share of the clip that may be black
+MAX_FROZEN_RATIO = 0.5  # share of the clip that may be a held frame
+MIN_MOTION = 0.002  # mean scene score; Wan clips that move score ~0.01 and up
+MIN_BRIGHTNESS = 20  # mean luma, 0-255
+MIN_SPREAD = 12  # YHIGH - YLOW, 0-255
+
+_BLACK = re.compile(r"black_start:\s*([\d.]+)\s+black_end:\s*([\d.]+)")
+_FREEZE = re.compile(r"lavfi\.freezedetect\.freeze_(start|end):\s*([\d.]+)")
+_SCENE = re.compile(r"lavfi\.scene_score=([\d.]+)")
+_SIGNAL = re.compile(r"lavfi\.signalstats\.(YAVG|YLOW|YHIGH)=([\d.]+)")
+
+
+def _frozen_seconds(stderr, duration):
+    total = 0.0
+    start = None
+    for kind, value in _FREEZE.findall(stderr):
+        if kind == "start":
+            start = float(value)
+        elif start is not None:
+            total += float(value) - start
+            start = None
+    if start is not None:
+        # Still frozen when the clip ended
+        total += duration - start
+    return total
+
+
+async def analyse_clip(path, timeout=120):
+    """Score a clip. `passed` is False with `reasons` when it isn't worth keeping."""
+    duration = float(await ffprobe(path, "format=duration"))
+    stderr = await run_ffmpeg(
+        [
+            "-i",
+            path,
+            "-an",
+            "-vf",
+            f"scale={ANALYSIS_WIDTH}:-2,"
+            "blackdetect=d=0.1:pix_th=0.10,"
+            "freezedetect=n=0.003:d=0.5,"
+            "select='gte(scene,0)',"
+            "metadata=print:key=lavfi.scene_score",
+            "-f",
+            "null",
+            "-",
+        ],
+        timeout=timeout,
+    )
+
+    black = sum(float(end) - float(start) for start, end in _BLACK.findall(stderr))
+    frozen = _frozen_seconds(stderr, duration)
+    # The first frame has nothing to compare against
+    scenes = [float(v) for v in _SCENE.findall(stderr)][1:]
+    motion = sum(scenes) / len(scenes) if scenes else 0.0
+
+    score = {
+        "path": path,
+        "duration": round(duration, 3),
+        "black_ratio": round(black / duration, 3) if duration else 1.0,
+        "frozen_ratio": round(frozen / duration, 3) if duration else 1.0,
+        "motion": round(motion, 5),
+    }
+    reasons = []
+    if not scenes:
+        reasons.append("no frames decoded")
+    if score["black_ratio"] > MAX_BLACK_RATIO:
+        reasons.append(f"{score['black_ratio']:.0%} black")
+    if score["frozen_ratio"] > MAX_FROZEN_RATIO:
+        reasons.append(f"{score['frozen_ratio']:.0%} frozen")
+    if motion < MIN_MOTION:
+        reasons.append(f"near-static (motion {motion:.4f})")
+    score["passed"] = not reasons
+    score["reasons"] = reasons
+
+    logging.info(f"Quality {'pass' if score['passed'] else 'FAIL'} for {path}: {score}")
+    return score
+
+
+async def analyse_image(path, timeout=30):
+    stderr = await run_ffmpeg(
+        [
+            "-i",
+            path,
+            "-vf",
+            f"scale={ANALYSIS_WIDTH}:-2,signalstats,metadata=print",
+            "-f",
+            "null",
+            "-",
+        ],
+        timeout=timeout,
+    )
+    stats = {key: float(value) for key, value in _SIGNAL.findall(stderr)}
+
+    score = {
+        "path": path,
+        "brightness": stats.get("YAVG", 0.0),
+        "spread": stats.get("YHIGH", 0.0) - stats.get("YLOW", 0.0),
+    }
+    reasons = []
+    if not stats:
+        reasons.append("could not decode")
+    if score["brightness"] < MIN_BRIGHTNESS:
+        reasons.append(f"too dark (mean luma {score['brightness']:.0f})")
+    if score["spread"] < MIN_SPREAD:
+        reasons.append(f"flat (luma spread {score['spread']:.0f})")
+    score["passed"] = not reasons
+    score["reasons"] = reasons
+
+    logging.info(f"Quality {'pass' if score['passed'] else 'FAIL'} for {path}: {score}")
+    return score
@@ -0,0 +1,275 @@
+"""
+SQLite catalogue of the reaction library.
+
+Every subdirectory of reactions/ is a pool ("1", "2", ...). Each clip is
+recorded once with its size, mtime, sha256, duration, resolution, the path
+of its upscaled copy and how often it has been used. Rescans only list
+pool directories whose mtime changed and only probe/hash files whose
+size or mtime changed, so a large library costs a handful of stats per run.
+
+Clips hold a dense per-pool `slot`, which makes drawing a random clip a
+single indexed lookup. Draws are weighted towards rarely used clips by
+rejection sampling and skip anything used in the last few runs.
+"""
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import sqlite3
+
+from config import PROJECT_OUTPUT
+from ffmpeg_runner import ffprobe
+
+
+REACTIONS_DIR = os.path.join(os.getcwd(), "reactions")
+INDEX_FILE = os.path.join(PROJECT_OUTPUT, "reaction_index.sqlite")
+OLD_INDEX_FILE = os.path.join(REACTIONS_DIR, "index.sqlite")  # inside the content folder
+RECENT_WINDOW = 2  # runs before a clip may be drawn again
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    name TEXT PRIMARY KEY,
+    dir_mtime REAL,
+    size INTEGER NOT NULL DEFAULT 0,
+    picks INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS clips (
+    path TEXT PRIMARY KEY,
+    pool TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    cache_path TEXT,
+    uses INTEGER NOT NULL DEFAULT 0,
+    last_pick INTEGER,
+    last_used REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS clips_slot ON clips(pool, slot);
+CREATE INDEX IF NOT EXISTS clips_uses ON clips(pool, uses);
+CREATE INDEX IF NOT EXISTS clips_hash ON clips(hash);
+"""
+
+
+class ReactionIndexError(RuntimeError):
+    pass
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def _probe(path):
+    try:
+        duration, dims = await asyncio.gather(
+            ffprobe(path, "format=duration"),
+            ffprobe(path, "stream=width,height", stream="v:0"),
+        )
+        width, height = (int(v) for v in dims.split())
+        return float(duration), width, height
+    except Exception as e:
+        # Kept in the index so it isn't re-probed every run, but never drawn
+        logging.warning(f"Could not probe reaction {path}: {e}")
+        return None, None, None
+
+
+class ReactionIndex:
+    def __init__(self, root=REACTIONS_DIR, db_path=INDEX_FILE):
+        self.root = root
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        if db_path == INDEX_FILE and not os.path.exists(db_path) and os.path.exists(OLD_INDEX_FILE):
+            # Keep the use counts; the WAL/SHM files move with the database
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(OLD_INDEX_FILE + suffix):
+                    os.replace(OLD_INDEX_FILE + suffix, db_path + suffix)
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # SCANNING
+
+    async def rescan(self, full=False):
+        """
+        Bring the index in line with the library. Pools whose directory
+        mtime is unchanged are skipped unless `full` is set (needed only
+        when a clip was overwritten in place under the same name).
+        """
+        stats = {"added": 0, "changed": 0, "removed": 0, "skipped_pools": 0}
+        on_disk = sorted(e.name for e in os.scandir(self.root) if e.is_dir())
+
+        for gone in self.db.execute("SELECT name FROM pools").fetchall():
+            if gone["name"] not in on_disk:
+                with self.db:
+                    stats["removed"] += self.db.execute(
+                        "DELETE FROM clips WHERE pool = ?", (gone["name"],)
+                    ).rowcount
+                    self.db.execute("DELETE FROM pools WHERE name = ?", (gone["name"],))
+
+        for pool in on_disk:
+            pool_dir = os.path.join(self.root, pool)
+            dir_mtime = os.stat(pool_dir).st_mtime
+            row = self.db.execute("SELECT dir_mtime FROM pools WHERE name = ?", (pool,)).fetchone()
+            if row and row["dir_mtime"] == dir_mtime and not full:
+                stats["skipped_pools"] += 1
+                continue
+            if not row:
+                with self.db:
+                    self.db.execute("INSERT INTO pools (name) VALUES (?)", (pool,))
+            await self._scan_pool(pool, pool_dir, stats)
+            with self.db:
+                self.db.execute("UPDATE pools SET dir_mtime = ? WHERE name = ?", (dir_mtime, pool))
+
+        logging.info(f"Reaction index rescan: {stats}")
+        return stats
+
+    async def _scan_pool(self, pool, pool_dir, stats):
+        files = {
+            os.path.abspath(e.path): e.stat()
+            for e in os.scandir(pool_dir)
+            if e.is_file() and e.name.lower().endswith(VIDEO_EXTENSIONS)
+        }
+        known = {
+            r["path"]: r
+            for r in self.db.execute("SELECT * FROM clips WHERE pool = ?", (pool,))
+        }
+
+        # Remember what vanished by hash so a renamed clip keeps its history
+        vanished = {}
+        for path in set(known) - set(files):
+            if known[path]["hash"]:
+                vanished[known[path]["hash"]] = known[path]
+            self._remove(pool, path)
+            stats["removed"] += 1
+
+        for path, st in files.items():
+            row = known.get(path)
+            if row and row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+                continue
+
+            digest = await asyncio.to_thread(file_hash, path)
+            duration, width, height = await _probe(path)
+            previous = vanished.pop(digest, None) or row
+            carried = (
+                (previous["uses"], previous["last_pick"], previous["last_used"], previous["cache_path"])
+                if previous is not None and previous["hash"] == digest
+                else (0, None, None, None)
+            )
+
+            with self.db:
+                if row:
+                    self.db.execute(
+                        "UPDATE clips SET size = ?, mtime = ?, hash = ?, duration = ?, width = ?, "
+                        "height = ?, cache_path = ? WHERE path = ?",
+                        (st.st_size, st.st_mtime, digest, duration, width, height, carried[3], path),
+                    )
+                    stats["changed"] += 1
+                else:
+                    size = self.db.execute(
+                        "SELECT size FROM pools WHERE name = ?", (pool,)
+                    ).fetchone()["size"]
+                    self.db.execute(
+                        "INSERT INTO clips (path, pool, slot, size, mtime, hash, duration, width, "
+                        "height, uses, last_pick, last_used, cache_path) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, pool, size, st.st_size, st.st_mtime, digest, duration, width, height, *carried),
+                    )
+                    self.db.execute("UPDATE pools SET size = size + 1 WHERE name = ?", (pool,))
+                    stats["added"] += 1
+
+    def _remove(self, pool, path):
+        """Delete a clip and move the pool's last slot into its place."""
+        with self.db:
+            slot = self.db.execute("SELECT slot FROM clips WHERE path = ?", (path,)).fetchone()["slot"]
+            self.db.execute("DELETE FROM clips WHERE path = ?", (path,))
+            self.db.execute("UPDATE pools SET size = size - 1 WHERE name = ?", (pool,))
+            last = self.db.execute(
+                "SELECT size FROM pools WHERE name = ?", (pool,)
+            ).fetchone()["size"]
+            if slot != last:
+                self.db.execute(
+                    "UPDATE clips SET slot = ? WHERE pool = ? AND slot = ?", (slot, pool, last)
+                )
+
+    # SELECTION
+
+    def draw(self, pool, count, recent_window=RECENT_WINDOW, max_tries=200):
+        """
+        Pick `count` distinct clips from `pool` and record the use.
+
+        Each try looks up one random slot and accepts it with probability
+        1 / (1 + uses - least_uses), so the least used clips are always
+        accepted and heavily used ones rarely. Clips drawn in the last
+        `recent_window` runs are rejected. If the pool is too small for
+        that to succeed, the least used, least recent clips fill the gap.
+        """
+        row = self.db.execute("SELECT size, picks FROM pools WHERE name = ?", (pool,)).fetchone()
+        if row is None or row["size"] < count:
+            raise ReactionIndexError(f"Pool {pool!r} has fewer than {count} clips")
+        size, picks = row["size"], row["picks"]
+        floor = self.db.execute(
+            "SELECT MIN(uses) FROM clips WHERE pool = ? AND duration IS NOT NULL", (pool,)
+        ).fetchone()[0] or 0
+
+        chosen = {}
+        for _ in range(max_tries):
+            if len(chosen) == count:
+                break
+            clip = self.db.execute(
+                "SELECT * FROM clips WHERE pool = ? AND slot = ?", (pool, random.randrange(size))
+            ).fetchone()
+            if clip is None or clip["duration"] is None or clip["path"] in chosen:
+                continue
+            if clip["last_pick"] is not None and picks - clip["last_pick"] < recent_window:
+                continue
+            if random.random() >= 1.0 / (1 + clip["uses"] - floor):
+                continue
+            chosen[clip["path"]] = clip
+
+        if len(chosen) < count:
+            for clip in self.db.execute(
+                "SELECT * FROM clips WHERE pool = ? AND duration IS NOT NULL "
+                "ORDER BY uses, COALESCE(last_pick, -1), RANDOM() LIMIT ?",
+                (pool, count + len(chosen)),
+            ):
+                if len(chosen) < count and clip["path"] not in chosen:
+                    chosen[clip["path"]] = clip
+        if len(chosen) < count:
+            raise ReactionIndexError(f"Pool {pool!r} has fewer than {count} usable clips")
+
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "UPDATE clips SET uses = uses + 1, last_pick = ?, last_used = ? WHERE path = ?",
+                [(picks, now, path) for path in chosen],
+            )
+            self.db.execute("UPDATE pools SET picks = picks + 1 WHERE name = ?", (pool,))
+        return [dict(c) for c in chosen.values()]
+
+    # CACHE BOOKKEEPING
+
+    def set_cache_path(self, clip_hash, cache_path):
+        with self.db:
+            self.db.execute("UPDATE clips SET cache_path = ? WHERE hash = ?", (cache_path, clip_hash))
+
+    def summary(self):
+        return [
+            dict(r)
+            for r in self.db.execute(
+                "SELECT pool, COUNT(*) AS clips, SUM(duration IS NULL) AS unreadable, "
+                "MIN(uses) AS min_uses, MAX(uses) AS max_uses, "
+                "SUM(cache_path IS NOT NULL) AS cached FROM clips GROUP BY pool ORDER BY pool"
+            )
+        ]
@@ -0,0 +1,69 @@
+"""
+One JSON file per pipeline run recording what it made and how: metadata,
+the starting image, the seed of every sampler in the video chain, the
+reaction clips and the layout. Draft runs are re-rendered from this record
+at full quality by `cli.py promote`.
+"""
+import os
+import json
+import logging
+from datetime import datetime
+
+from metrics import RUN_ID
+
+
+MANIFEST_DIR = os.path.join(os.getcwd(), "run_manifests")
+
+
+def _path(run_id):
+    return os.path.join(MANIFEST_DIR, f"{run_id}.json")
+
+
+def new_manifest(mode, meta, layout_file):
+    return {
+        "run_id": RUN_ID,
+        "mode": mode,
+        "status": "rendering",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "meta": meta,
+        "layout": layout_file,
+        "image": None,
+        "video_seeds": {},
+        "reactions": {},
+        "output": None,
+        "promoted_by": None,
+        "promoted_from": None,
+    }
+
+
+def save_manifest(manifest):
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    path = _path(manifest["run_id"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def load_manifest(run_id):
+    with open(_path(run_id), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_manifests(mode=None):
+    if not os.path.isdir(MANIFEST_DIR):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(MANIFEST_DIR)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(MANIFEST_DIR, name), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Skipping unreadable manifest {name}: {e}")
+            continue
+        if mode is None or manifest.get("mode") == mode:
+            manifests.append(manifest)
+    return manifests
@@ -0,0 +1,136 @@
+import os
+import signal
+import subprocess
+import logging
+
+import psutil
+
+from probes import Probe, http_ok
+
+
+class ManagedProcess:
+    """
+    A service child (ComfyUI, Ollama) launched and owned by the pipeline.
+
+    The process is started in its own process group so it can be shut down
+    together with anything it spawns, and readiness is judged from the child
+    itself (is it still alive, does its health URL answer) rather than from
+    scanning every process on the machine.
+    """
+
+    def __init__(self, name, cmd, health_url=None):
+        self.name = name
+        self.cmd = list(cmd)
+        self.health_url = health_url
+        self.proc = None
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    def start(self):
+        if self.is_running():
+            logging.info(f"{self.name} already running (pid={self.pid})")
+            return self.pid
+
+        if not os.path.exists(self.cmd[0]):
+            raise RuntimeError(f"{self.name} not found at: {self.cmd[0]}")
+
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+
+        self.proc = subprocess.Popen(
+            self.cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs
+        )
+        logging.info(f"Started {self.name} (pid={self.proc.pid})")
+        return self.proc.pid
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def is_healthy(self, timeout=2):
+        if not self.health_url:
+            return self.is_running()
+        return http_ok(self.health_url, timeout=timeout)
+
+    def check_alive(self):
+        """Raise if a child we launched has already exited."""
+        if self.proc is not None and self.proc.poll() is not None:
+            raise RuntimeError(
+                f"{self.name} exited with code {self.proc.returncode} before becoming ready"
+            )
+
+    def probe(self):
+        return Probe(self.name, self.is_healthy, abort=self.check_alive)
+
+    def _family(self):
+        """The child plus everything it has spawned."""
+        try:
+            parent = psutil.Process(self.proc.pid)
+            return [parent] + parent.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return []
+
+    def stop(self, grace=10):
+        """SIGTERM the process group, then SIGKILL whatever is left after `grace` seconds."""
+        if self.proc is None:
+            return
+
+        procs = self._family()
+        logging.info(f"Stopping {self.name} (pid={self.proc.pid}, {len(procs)} processes)")
+
+        try:
+            if os.name == "nt":
+                self.proc.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                os.killpg(self.proc.pid, signal.SIGTERM)
+        except (ProcessLookupError, OSError):
+            pass
+
+        _, alive = psutil.wait_procs(procs, timeout=grace)
+        if alive:
+            logging.warning(
+                f"{self.name}: {len(alive)} processes ignored SIGTERM, killing"
+            )
+            for p in alive:
+                try:
+                    p.kill()
+                except psutil.NoSuchProcess:
+                    pass
+            psutil.wait_procs(alive, timeout=5)
+
+        self.proc.poll()
+        self.proc = None
+
+
+def kill_by_exe_name(exe_name):
+    """
+    Kill processes whose executable name is exactly `exe_name`, along with
+    their children. Used only to clear instances left over from a previous
+    run that no ManagedProcess owns.
+    """
+    exe_name = exe_name.lower()
+    victims = []
+    for proc in psutil.process_iter(["name"]):
+        if (proc.info.get("name") or "").lower() != exe_name:
+            continue
+        try:
+            victims.append(proc)
+            victims.extend(proc.children(recursive=True))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+    for proc in victims:
+        try:
+            print(f"Terminating leftover {exe_name} process (PID: {proc.pid})")
+            proc.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+    if victims:
+        psutil.wait_procs(victims, timeout=5)
+
+    return len(victims)
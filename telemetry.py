@@ -0,0 +1,324 @@
+"""
+Resource sampling while the pipeline runs.
+
+Every SAMPLE_INTERVAL seconds one row is recorded: host CPU and RAM, disk
+throughput, the RSS of the ComfyUI process tree, the CPU of ffmpeg
+children, and VRAM from ComfyUI's /system_stats. Each row is tagged with
+the run and the longest-running pipeline stage at the time
+(metrics.longest_stage), so a slow stage can be matched to what the
+machine was doing, and stores the seconds it covers.
+
+Rows go to a fixed-size ring buffer in telemetry/samples.npy, a structured
+NumPy array opened as a memmap, so history costs a constant ~10 MB and
+old runs are overwritten oldest first. Run ids and stage names are stored
+as indices into telemetry/labels.json; labels no longer used by any row
+are dropped when a sampler starts.
+
+NumPy is only needed here; without it the sampler logs a warning and the
+pipeline runs unobserved.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+
+import psutil
+
+from metrics import RUN_ID, longest_stage
+
+
+TELEMETRY_DIR = os.path.join(os.getcwd(), "telemetry")
+SAMPLES_FILE = os.path.join(TELEMETRY_DIR, "samples.npy")
+LABELS_FILE = os.path.join(TELEMETRY_DIR, "labels.json")
+SAMPLE_INTERVAL = 2.0  # seconds
+CAPACITY = 200_000  # rows; about 4.5 days of sampling
+FLUSH_EVERY = 15  # rows between memmap flushes
+
+FIELDS = [
+    ("t", "f8"),
+    ("dt", "f4"),  # seconds since the previous sample, i.e. the time this row stands for
+    ("run", "u2"),
+    ("stage", "u2"),
+    ("cpu", "f4"),  # host CPU, %
+    ("ram_used_mb", "f4"),
+    ("comfy_rss_mb", "f4"),
+    ("vram_used_mb", "f4"),
+    ("vram_total_mb", "f4"),
+    ("disk_read_mbs", "f4"),
+    ("disk_write_mbs", "f4"),
+    ("ffmpeg_cpu", "f4"),  # summed over ffmpeg children, % of one core
+]
+# What the report summarises, with the unit it prints
+REPORT_FIELDS = [
+    ("cpu", "%"),
+    ("ffmpeg_cpu", "%"),
+    ("ram_used_mb", "MB"),
+    ("comfy_rss_mb", "MB"),
+    ("vram_used_mb", "MB"),
+    ("disk_read_mbs", "MB/s"),
+    ("disk_write_mbs", "MB/s"),
+]
+
+
+def _dtype():
+    import numpy as np
+
+    return np.dtype(FIELDS)
+
+
+def _load_labels(path=LABELS_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return ["-"]  # index 0: no run / no stage
+
+
+def _open_ring(path=SAMPLES_FILE, capacity=CAPACITY):
+    """The ring buffer memmap and the slot to write next."""
+    import numpy as np
+    from numpy.lib.format import open_memmap
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        try:
+            ring = open_memmap(path, mode="r+")
+            if ring.dtype == _dtype() and ring.shape == (capacity,):
+                # Continue after the newest row; empty slots have t == 0
+                newest = int(np.argmax(ring["t"]))
+                return ring, (newest + 1) % capacity if ring["t"][newest] > 0 else 0
+            logging.warning(f"{path} has an old layout; starting a new ring buffer")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not open {path} ({e}); starting a new ring buffer")
+    ring = open_memmap(path, mode="w+", dtype=_dtype(), shape=(capacity,))
+    return ring, 0
+
+
+def _prune_labels(ring, labels):
+    """Renumber `ring` to use only the labels its rows refer to; the new label list."""
+    import numpy as np
+
+    rows = ring[ring["t"] > 0]
+    used = np.union1d(rows["run"], rows["stage"])
+    keep = [0] + [int(code) for code in used if 0 < code < len(labels)]
+    if len(keep) == len(labels):
+        return labels
+    # Unknown codes (a lost labels file) fall back to 0, "-"
+    lut = np.zeros(max(len(labels), int(used.max()) + 1 if len(used) else 1), dtype="u2")
+    lut[keep] = np.arange(len(keep))
+    for field in ("run", "stage"):
+        ring[field] = lut[ring[field]]
+    ring.flush()
+    return [labels[code] for code in keep]
+
+
+class Sampler:
+    """
+    Background sampler on the pipeline's event loop.
+
+    `system_stats` is an async callable returning ComfyUI's /system_stats
+    body; `comfy_pid` returns the pid of the ComfyUI process (or None).
+    """
+
+    def __init__(self, system_stats, comfy_pid, interval=SAMPLE_INTERVAL,
+                 path=SAMPLES_FILE, labels_path=LABELS_FILE):
+        self.system_stats = system_stats
+        self.comfy_pid = comfy_pid
+        self.interval = interval
+        self.path = path
+        self.labels_path = labels_path
+        self.labels = _load_labels(labels_path)
+        self._ring = None
+        self._pos = 0
+        self._last = None  # time of the previous sample
+        self._rows = 0
+        self._task = None
+        self._ffmpeg = {}  # pid -> psutil.Process, kept so cpu_percent has a baseline
+        self._disk = None
+
+    def start(self):
+        try:
+            self._ring, self._pos = _open_ring(self.path)
+        except ImportError:
+            logging.warning("NumPy is not installed; resource telemetry is off")
+            return self
+        labels = _prune_labels(self._ring, self.labels)
+        if labels is not self.labels:
+            logging.info(f"Dropped {len(self.labels) - len(labels)} unused telemetry labels")
+            self.labels = labels
+            self._save_labels()
+        psutil.cpu_percent(None)
+        self._task = asyncio.create_task(self._loop(), name="telemetry")
+        logging.info(f"Telemetry sampling every {self.interval}s into {self.path}")
+        return self
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._ring is not None:
+            self._ring.flush()
+            self._ring = None
+
+    def _label(self, name):
+        name = name or "-"
+        if name not in self.labels:
+            self.labels.append(name)
+            self._save_labels()
+        return self.labels.index(name)
+
+    def _save_labels(self):
+        tmp = self.labels_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.labels, f)
+        os.replace(tmp, self.labels_path)
+
+    async def _loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self._sample()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Telemetry sample failed: {e}")
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0.1))
+
+    async def _sample(self):
+        stage = longest_stage()
+        host = await asyncio.to_thread(self._host_sample)
+        try:
+            stats = await self.system_stats()
+            device = (stats.get("devices") or [{}])[0]
+            vram_total = device.get("vram_total", 0) / 1024**2
+            vram_used = vram_total - device.get("vram_free", 0) / 1024**2
+        except Exception:
+            vram_total = vram_used = float("nan")  # ComfyUI down or restarting
+
+        now = time.time()
+        dt = self.interval if self._last is None else min(now - self._last, 10 * self.interval)
+        self._last = now
+        row = dict(
+            host,
+            t=now,
+            dt=dt,
+            run=self._label(RUN_ID),
+            stage=self._label(stage),
+            vram_used_mb=vram_used,
+            vram_total_mb=vram_total,
+        )
+        self._ring[self._pos] = tuple(row[name] for name, _ in FIELDS)
+
+        self._pos = (self._pos + 1) % len(self._ring)
+        self._rows += 1
+        if self._rows % FLUSH_EVERY == 0:
+            self._ring.flush()
+
+    def _host_sample(self):
+        now = time.monotonic()
+        disk = psutil.disk_io_counters()
+        read_mbs = write_mbs = 0.0
+        if disk and self._disk:
+            t0, previous = self._disk
+            dt = max(now - t0, 1e-3)
+            read_mbs = (disk.read_bytes - previous.read_bytes) / dt / 1024**2
+            write_mbs = (disk.write_bytes - previous.write_bytes) / dt / 1024**2
+        self._disk = (now, disk) if disk else None
+
+        return {
+            "cpu": psutil.cpu_percent(None),
+            "ram_used_mb": psutil.virtual_memory().used / 1024**2,
+            "comfy_rss_mb": self._comfy_rss() / 1024**2,
+            "disk_read_mbs": read_mbs,
+            "disk_write_mbs": write_mbs,
+            "ffmpeg_cpu": self._ffmpeg_cpu(),
+        }
+
+    def _comfy_rss(self):
+        pid = self.comfy_pid()
+        if not pid:
+            return 0
+        try:
+            root = psutil.Process(pid)
+            procs = [root] + root.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return 0
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total
+
+    def _ffmpeg_cpu(self):
+        seen = {}
+        for child in psutil.Process().children(recursive=True):
+            try:
+                if child.name().lower().startswith(("ffmpeg", "ffprobe")):
+                    seen[child.pid] = self._ffmpeg.get(child.pid, child)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self._ffmpeg = seen
+
+        total = 0.0
+        for proc in seen.values():
+            try:
+                # The first call for a new process only sets its baseline
+                total += proc.cpu_percent(None)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total
+
+
+# REPORT
+
+def load_samples(path=SAMPLES_FILE, labels_path=LABELS_FILE, run_id=None):
+    """Recorded rows in time order (optionally one run's) and the label table."""
+    import numpy as np
+
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=_dtype()), _load_labels(labels_path)
+    ring = np.load(path, mmap_mode="r")
+    labels = _load_labels(labels_path)
+    rows = ring[ring["t"] > 0]
+    if run_id is not None:
+        if run_id not in labels:
+            return rows[:0], labels
+        rows = rows[rows["run"] == labels.index(run_id)]
+    return np.sort(rows, order="t"), labels
+
+
+def summarise(rows, labels):
+    """Per stage: sample count, covered seconds, and peak/mean of REPORT_FIELDS."""
+    import numpy as np
+
+    summary = {}
+    for code in np.unique(rows["stage"]):
+        stage_rows = rows[rows["stage"] == code]
+        entry = {"samples": int(len(stage_rows)), "seconds": float(stage_rows["dt"].sum())}
+        for field, _ in REPORT_FIELDS:
+            values = stage_rows[field][np.isfinite(stage_rows[field])]
+            entry[field] = (
+                (float(values.max()), float(values.mean())) if len(values) else (None, None)
+            )
+        summary[labels[code] if code < len(labels) else str(code)] = entry
+    return summary
+
+
+def format_report(summary):
+    lines = []
+    for stage, entry in sorted(summary.items(), key=lambda kv: -kv[1]["seconds"]):
+        lines.append(f"{stage}  ({entry['samples']} samples, ~{entry['seconds']:.0f}s)")
+        for field, unit in REPORT_FIELDS:
+            peak, mean = entry[field]
+            if peak is None:
+                lines.append(f"  {field:<15} n/a")
+            else:
+                lines.append(f"  {field:<15} peak {peak:>9.1f} {unit:<5} avg {mean:>9.1f} {unit}")
+    return "\n".join(lines)
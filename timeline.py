@@ -0,0 +1,347 @@
+"""
+Declarative sequence layouts.
+
+A layout is a JSON file describing the finished short:
+
+    {
+      "name": "reaction_sandwich",
+      "size": [1080, 1920],
+      "fps": 30,
+      "clips": [
+        {"source": "video1", "end": "50%"},
+        {"pool": "1", "transition": {"type": "fade", "duration": 0.3}},
+        ...
+      ],
+      "audio": {"source": "music", "volume": 1.0, "fade_out": 1.0, "optional": true}
+    }
+
+`source` names a clip the caller binds at render time (video1, music, ...);
+`pool` takes the next clip drawn from a named reaction pool. `start`/`end`
+are seconds or percentages of the clip. A transition blends a clip into
+the one before it; the default is a hard cut.
+
+Layouts compile to a single ffmpeg invocation: every clip is its own
+seeked input, normalised to the output size and rate, and joined in one
+filter graph, so the output duration is known before anything runs.
+"""
+import json
+import asyncio
+import logging
+
+from ffmpeg_runner import ffprobe, run_ffmpeg
+
+
+TRANSITIONS = {
+    "cut",
+    "fade",
+    "fadeblack",
+    "fadewhite",
+    "dissolve",
+    "wipeleft",
+    "wiperight",
+    "wipeup",
+    "wipedown",
+    "slideleft",
+    "slideright",
+    "slideup",
+    "slidedown",
+    "circleopen",
+    "circleclose",
+}
+
+# Rough libx264 -preset fast / decoder throughput on the render box, in
+# megapixels per second. Only used to estimate cost and size timeouts.
+ENCODE_MPIX_PER_SEC = 60.0
+DECODE_MPIX_PER_SEC = 400.0
+
+
+class TimelineError(ValueError):
+    pass
+
+
+def load_timeline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    validate_timeline(spec)
+    return spec
+
+
+def _check_time(value, where):
+    if value is None or isinstance(value, (int, float)):
+        if value is not None and value < 0:
+            raise TimelineError(f"{where}: negative time {value}")
+        return
+    if isinstance(value, str) and value.endswith("%"):
+        try:
+            pct = float(value[:-1])
+        except ValueError:
+            raise TimelineError(f"{where}: bad percentage {value!r}") from None
+        if not 0 <= pct <= 100:
+            raise TimelineError(f"{where}: percentage out of range {value!r}")
+        return
+    raise TimelineError(f"{where}: time must be seconds or 'N%', got {value!r}")
+
+
+def validate_timeline(spec):
+    """Structural checks that don't need the clips on disk."""
+    size = spec.get("size")
+    if not (isinstance(size, list) and len(size) == 2 and all(isinstance(v, int) and v > 0 for v in size)):
+        raise TimelineError("size must be [width, height]")
+    if any(v % 2 for v in size):
+        raise TimelineError("size must be even for yuv420p")
+    if not spec.get("fps") or spec["fps"] <= 0:
+        raise TimelineError("fps must be positive")
+
+    clips = spec.get("clips")
+    if not clips:
+        raise TimelineError("layout has no clips")
+
+    for i, clip in enumerate(clips):
+        where = f"clip {i}"
+        if ("source" in clip) == ("pool" in clip):
+            raise TimelineError(f"{where}: needs exactly one of 'source' or 'pool'")
+        _check_time(clip.get("start"), where)
+        _check_time(clip.get("end"), where)
+        if clip.get("duration") is not None and clip.get("end") is not None:
+            raise TimelineError(f"{where}: give 'end' or 'duration', not both")
+
+        transition = clip.get("transition")
+        if transition:
+            if i == 0:
+                raise TimelineError("the first clip can't have a transition")
+            if transition.get("type", "cut") not in TRANSITIONS:
+                raise TimelineError(f"{where}: unknown transition {transition.get('type')!r}")
+            if transition.get("type", "cut") != "cut" and transition.get("duration", 0) <= 0:
+                raise TimelineError(f"{where}: transition needs a positive duration")
+
+    audio = spec.get("audio")
+    if audio is not None and "source" not in audio:
+        raise TimelineError("audio needs a 'source'")
+
+
+def pool_demand(spec):
+    """How many distinct clips each pool has to supply, e.g. {"1": 2, "2": 2}."""
+    demand = {}
+    for clip in spec["clips"]:
+        if "pool" in clip:
+            demand[clip["pool"]] = demand.get(clip["pool"], 0) + 1
+    return demand
+
+
+def _resolve_time(value, length):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return length * float(value[:-1]) / 100.0
+    return float(value)
+
+
+async def _probe(path):
+    duration, dims = await asyncio.gather(
+        ffprobe(path, "format=duration"),
+        ffprobe(path, "stream=width,height", stream="v:0"),
+    )
+    width, height = (int(v) for v in dims.split())
+    return {"duration": float(duration), "width": width, "height": height}
+
+
+async def plan_timeline(spec, sources, pools=None):
+    """
+    Bind a layout to real files and resolve every trim against the probed
+    clip lengths. `sources` maps source names to paths; `pools` maps pool
+    names to lists of paths, consumed in order.
+
+    Returns a plan: the resolved clips, the audio track and the exact
+    output duration.
+    """
+    validate_timeline(spec)
+    pools = {name: list(paths) for name, paths in (pools or {}).items()}
+
+    paths = []
+    for i, clip in enumerate(spec["clips"]):
+        if "source" in clip:
+            path = sources.get(clip["source"])
+            if not path:
+                raise TimelineError(f"clip {i}: source {clip['source']!r} is not bound")
+        else:
+            remaining = pools.get(clip["pool"])
+            if not remaining:
+                raise TimelineError(f"clip {i}: pool {clip['pool']!r} ran out of clips")
+            path = remaining.pop(0)
+        paths.append(path)
+
+    unique = sorted(set(paths))
+    probed = dict(zip(unique, await asyncio.gather(*(_probe(p) for p in unique))))
+
+    clips = []
+    total = 0.0
+    for i, (clip, path) in enumerate(zip(spec["clips"], paths)):
+        info = probed[path]
+        start = _resolve_time(clip.get("start"), info["duration"]) or 0.0
+        if clip.get("duration") is not None:
+            end = start + _resolve_time(clip["duration"], info["duration"])
+        else:
+            end = _resolve_time(clip.get("end"), info["duration"])
+        end = info["duration"] if end is None else min(end, info["duration"])
+        if end - start <= 0:
+            raise TimelineError(f"clip {i} ({path}) is empty after trimming")
+
+        transition = dict(clip.get("transition") or {"type": "cut"})
+        transition.setdefault("type", "cut")
+        overlap = 0.0 if transition["type"] == "cut" else float(transition["duration"])
+        if overlap and (overlap >= end - start or overlap >= clips[-1]["duration"]):
+            raise TimelineError(f"clip {i}: transition is longer than the clips it joins")
+
+        clips.append(
+            {
+                "path": path,
+                "start": start,
+                "duration": end - start,
+                "width": info["width"],
+                "height": info["height"],
+                "transition": transition,
+            }
+        )
+        total += end - start - overlap
+
+    audio = None
+    if spec.get("audio"):
+        audio_spec = spec["audio"]
+        audio_path = sources.get(audio_spec["source"])
+        if audio_path:
+            audio = {
+                "path": audio_path,
+                "volume": float(audio_spec.get("volume", 1.0)),
+                "fade_out": min(float(audio_spec.get("fade_out", 0.0)), total),
+            }
+        elif not audio_spec.get("optional"):
+            raise TimelineError(f"audio source {audio_spec['source']!r} is not bound")
+
+    return {
+        "name": spec.get("name", "timeline"),
+        "size": tuple(spec["size"]),
+        "fps": spec["fps"],
+        "clips": clips,
+        "audio": audio,
+        "duration": total,
+    }
+
+
+def estimate_cost(plan):
+    """Frames, pixel work and a rough encode time for a plan, before rendering."""
+    w, h = plan["size"]
+    frames = plan["duration"] * plan["fps"]
+    encode_mpix = frames * w * h / 1e6
+    decode_mpix = sum(
+        c["duration"] * plan["fps"] * c["width"] * c["height"] for c in plan["clips"]
+    ) / 1e6
+    return {
+        "duration": round(plan["duration"], 3),
+        "frames": int(round(frames)),
+        "encode_mpix": round(encode_mpix, 1),
+        "decode_mpix": round(decode_mpix, 1),
+        "estimated_seconds": round(
+            encode_mpix / ENCODE_MPIX_PER_SEC + decode_mpix / DECODE_MPIX_PER_SEC, 1
+        ),
+    }
+
+
+def build_ffmpeg_args(plan, output_path):
+    """The complete ffmpeg argument list (without the binary) for a plan."""
+    w, h = plan["size"]
+    fps = plan["fps"]
+    args = []
+    graph = []
+
+    for i, clip in enumerate(plan["clips"]):
+        # Input seeking decodes only the frames each clip actually uses
+        args += ["-ss", f"{clip['start']:.3f}", "-t", f"{clip['duration']:.3f}", "-i", clip["path"]]
+        graph.append(
+            f"[{i}:v]setpts=PTS-STARTPTS,fps={fps},"
+            f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+            f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p,settb=AVTB[c{i}]"
+        )
+
+    # Runs of hard cuts become one concat; blended transitions become xfades
+    run = ["c0"]
+    run_duration = plan["clips"][0]["duration"]
+    node = 0
+
+    def flush(run):
+        nonlocal node
+        if len(run) == 1:
+            return run[0]
+        node += 1
+        label = f"cat{node}"
+        graph.append("".join(f"[{r}]" for r in run) + f"concat=n={len(run)}:v=1:a=0[{label}]")
+        return label
+
+    for i, clip in enumerate(plan["clips"][1:], start=1):
+        transition = clip["transition"]
+        if transition["type"] == "cut":
+            run.append(f"c{i}")
+            run_duration += clip["duration"]
+            continue
+
+        left = flush(run)
+        overlap = float(transition["duration"])
+        node += 1
+        label = f"x{node}"
+        graph.append(
+            f"[{left}][c{i}]xfade=transition={transition['type']}:"
+            f"duration={overlap:.3f}:offset={run_duration - overlap:.3f}[{label}]"
+        )
+        run = [label]
+        run_duration += clip["duration"] - overlap
+
+    graph.append(f"[{flush(run)}]null[vout]")
+
+    maps = ["-map", "[vout]"]
+    audio = plan["audio"]
+    if audio:
+        idx = len(plan["clips"])
+        args += ["-i", audio["path"]]
+        # Pad then trim so the track is exactly as long as the picture
+        chain = f"[{idx}:a]apad,atrim=0:{plan['duration']:.3f},asetpts=PTS-STARTPTS"
+        if audio["volume"] != 1.0:
+            chain += f",volume={audio['volume']}"
+        if audio["fade_out"] > 0:
+            chain += f",afade=t=out:st={plan['duration'] - audio['fade_out']:.3f}:d={audio['fade_out']:.3f}"
+        graph.append(chain + "[aout]")
+        maps += ["-map", "[aout]", "-c:a", "aac"]
+
+    return args + [
+        "-filter_complex",
+        ";".join(graph),
+        *maps,
+        "-c:v",
+        "libx264",
+        "-crf",
+        "18",
+        "-preset",
+        "fast",
+        "-pix_fmt",
+        "yuv420p",
+        "-r",
+        str(fps),
+        "-movflags",
+        "+faststart",
+        "-t",
+        f"{plan['duration']:.3f}",
+        output_path,
+    ]
+
+
+async def render_timeline(plan, output_path, timeout=None, on_stderr_line=None):
+    """Encode a plan in one ffmpeg pass and return `output_path`."""
+    cost = estimate_cost(plan)
+    if timeout is None:
+        timeout = max(300, 5 * cost["estimated_seconds"])
+    logging.info(
+        f"Rendering timeline '{plan['name']}': {len(plan['clips'])} clips, "
+        f"{cost['duration']:.1f}s, ~{cost['estimated_seconds']:.0f}s to encode"
+    )
+    await run_ffmpeg(
+        build_ffmpeg_args(plan, output_path), timeout=timeout, on_stderr_line=on_stderr_line
+    )
+    return output_path
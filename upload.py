@@ -1,29 +1,40 @@
 import os
 import json
+import time
+import threading
 from glob import glob
 from datetime import datetime
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import google.auth.exceptions
+
+from config import PROJECT_OUTPUT
 
 SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
-PROJECT_OUTPUT = os.path.join(os.getcwd(), "outputs")  # matches main.py
-COMFY_OUTPUT = os.path.join(
-    os.path.expanduser("~"),
-    "Documents",
-    "ComfyUI",
-    "output"
-)
 
-    
 
-def get_youtube():
+TOKEN_FILE = "token.json"
+CLIENT_SECRET_FILE = "client_secret.json"
+DISCOVERY_FILE = "youtube_v3_discovery.json"
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/youtube/v3/rest"
+REFRESH_MARGIN = 300  # refresh this many seconds before the token expires
+REFRESH_TIMEOUT = 30  # seconds for the token endpoint to answer
+
+_lock = threading.Lock()
+_creds = None
+_youtube = None
+_refresher = None
+
+
+def load_credentials(token_file=TOKEN_FILE):
+    """Load, refresh if needed, and persist the OAuth credentials."""
+    # The Google client stack is slow to import, so only pay for it when uploading
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    import google.auth.exceptions
+
     creds = None
-    if os.path.exists("token.json"):
-        with open("token.json", "r") as f:
-            creds = google.oauth2.credentials.Credentials.from_authorized_user_info(json.load(f), SCOPES)
+    if os.path.exists(token_file):
+        with open(token_file, "r") as f:
+            creds = Credentials.from_authorized_user_info(json.load(f), SCOPES)
 
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
@@ -33,15 +44,146 @@ def get_youtube():
                 creds = None
 
         if not creds:
-            flow = InstalledAppFlow.from_client_secrets_file("client_secret.json", SCOPES)
+            flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
             creds = flow.run_local_server(port=8080)
 
-        with open("token.json", "w") as f:
+        with open(token_file, "w") as f:
             f.write(creds.to_json())
 
-    return build("youtube", "v3", credentials=creds)
+    return creds
+
+
+def load_discovery_document(path=DISCOVERY_FILE):
+    """
+    Return the serialized YouTube discovery document, downloading it once and
+    reusing the local copy afterwards. With the file present this never
+    touches the network.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    from probes import get_session
+
+    r = get_session().get(DISCOVERY_URL, timeout=30)
+    r.raise_for_status()
+    document = r.text
+    json.loads(document)  # don't cache something that isn't a discovery doc
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(document)
+    os.replace(tmp, path)
+    return document
+
+
+def get_youtube(discovery_path=DISCOVERY_FILE, credentials=None):
+    """
+    Return the memoised YouTube service, built from the cached discovery
+    document so repeat uploads skip both discovery and client construction.
+    """
+    global _creds, _youtube
+    from googleapiclient.discovery import build_from_document
+
+    with _lock:
+        if _youtube is None:
+            _creds = credentials or load_credentials()
+            _youtube = build_from_document(
+                load_discovery_document(discovery_path), credentials=_creds
+            )
+        return _youtube
+
+
+def check_offline(discovery_path=DISCOVERY_FILE):
+    """
+    Build the YouTube client from a stored discovery document, with dummy
+    credentials and every socket connect refused, and return the service.
+    Proves an upload can start without a discovery fetch or a token file.
+    """
+    import socket
+    from google.auth.credentials import AnonymousCredentials
+
+    if not os.path.exists(discovery_path):
+        raise FileNotFoundError(f"No stored discovery document at {discovery_path}")
+
+    def refuse(sock, address):
+        raise OSError(f"network access to {address} during the offline check")
+
+    connect = socket.socket.connect
+    socket.socket.connect = refuse
+    try:
+        youtube = get_youtube(discovery_path, credentials=AnonymousCredentials())
+        youtube.videos().insert  # the upload method is described by the document
+    finally:
+        socket.socket.connect = connect
+    return youtube
+
+
+def refresh_credentials_if_due(margin=REFRESH_MARGIN, timeout=REFRESH_TIMEOUT):
+    """
+    Refresh the shared credentials if they expire within `margin` seconds.
+    The round trip runs on a copy outside the lock, so get_youtube() and
+    uploads never wait on the token endpoint; the new token is copied into
+    the shared credentials afterwards.
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    with _lock:
+        creds = _creds
+        if creds is None or not creds.refresh_token:
+            return False
+        expiry = creds.expiry  # naive UTC
+        if expiry and (expiry - datetime.utcnow()).total_seconds() > margin:
+            return False
+        fresh = Credentials.from_authorized_user_info(json.loads(creds.to_json()), SCOPES)
+
+    request = Request()
+    fresh.refresh(lambda *args, **kwargs: request(*args, **{"timeout": timeout, **kwargs}))
+
+    with _lock:
+        creds.token = fresh.token
+        creds.expiry = fresh.expiry
+        with open(TOKEN_FILE, "w") as f:
+            f.write(fresh.to_json())
+    print("YouTube token refreshed")
+    return True
+
+
+def start_token_refresher(margin=REFRESH_MARGIN, check_interval=60):
+    """
+    Build the YouTube client now and keep its token fresh from a daemon
+    thread, so an upload never starts with a discovery fetch or a refresh
+    round trip.
+    """
+    global _refresher
+    get_youtube()
+
+    if _refresher is not None and _refresher.is_alive():
+        return _refresher
+
+    def loop():
+        while True:
+            try:
+                refresh_credentials_if_due(margin)
+            except Exception as e:
+                print(f"YouTube token refresh failed, will retry: {e}")
+            time.sleep(check_interval)
+
+    _refresher = threading.Thread(target=loop, name="youtube-token", daemon=True)
+    _refresher.start()
+    return _refresher
+
+def upload_short(video_path, title, description="", tags=None, publish_at=None):
+    """
+    Upload a short and return its video id. With `publish_at` (an aware
+    datetime or RFC 3339 string) the video is uploaded private and YouTube
+    publishes it at that time.
+    """
+    from googleapiclient.http import MediaFileUpload
+    import google_auth_httplib2
+    import httplib2
 
-def upload_short(video_path, title, description="", tags=None):
     youtube = get_youtube()
 
     body = {
@@ -57,6 +199,12 @@ def upload_short(video_path, title, description="", tags=None):
         }
     }
 
+    if publish_at:
+        if isinstance(publish_at, datetime):
+            publish_at = publish_at.isoformat()
+        body["status"]["privacyStatus"] = "private"
+        body["status"]["publishAt"] = publish_at
+
     media = MediaFileUpload(video_path, chunksize=-1, resumable=True)
 
     request = youtube.videos().insert(
@@ -65,17 +213,23 @@ def upload_short(video_path, title, description="", tags=None):
         media_body=media
     )
 
+    # httplib2 connections aren't thread-safe, so each upload gets its own
+    # while sharing the memoised service and credentials
+    http = google_auth_httplib2.AuthorizedHttp(_creds, http=httplib2.Http())
+
     response = None
     while response is None:
-        status, response = request.next_chunk()
+        status, response = request.next_chunk(http=http)
         if status:
             print(f"Upload progress: {int(status.progress() * 100)}%")
 
     print("Upload complete:", response["id"])
     return response["id"]
 
-def get_latest_upscaled_video():
-    files = glob(os.path.join(COMFY_OUTPUT, "SEEDVR_*.mp4"))
+def get_latest_final_video():
+    # Segments are upscaled one by one, so the assembled short only exists
+    # in the project outputs; an upscaled segment is not a short
+    files = glob(os.path.join(PROJECT_OUTPUT, "final_*.mp4"))
     if not files:
         return None
     return max(files, key=os.path.getmtime)
@@ -85,7 +239,9 @@ if __name__ == "__main__":
     from prompts import generate_full_video_metadata
     # Generate video metadata from Ollama
     metadata = generate_full_video_metadata()
-    video_path = get_latest_upscaled_video()
+    video_path = get_latest_final_video()
+    if not video_path:
+        raise SystemExit("No finished video found.")
 
     print(f"Uploading latest video: {os.path.basename(video_path)}")
     print(f"Title: {metadata['title']}")
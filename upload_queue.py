@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+
+QUEUE_DIR = os.path.join(os.getcwd(), "upload_queue")
+QUOTA_FILE = os.path.join(QUEUE_DIR, "quota.json")
+DRAIN_LOCK = os.path.join(QUEUE_DIR, "drain.lock")
+
+DAILY_QUOTA = 10000  # default YouTube Data API allowance
+UPLOAD_COST = 1600  # units charged per videos.insert
+MAX_ATTEMPTS = 6
+MAX_CONCURRENT_UPLOADS = 2
+PUBLISH_LEAD = timedelta(minutes=15)  # a publishAt closer than this is published at once
+
+_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _quota_day():
+    """YouTube quota resets at midnight Pacific time."""
+    try:
+        from zoneinfo import ZoneInfo
+
+        return datetime.now(ZoneInfo("America/Los_Angeles")).date().isoformat()
+    except Exception:
+        return (_now() - timedelta(hours=8)).date().isoformat()
+
+
+def _next_quota_reset():
+    try:
+        from zoneinfo import ZoneInfo
+
+        pacific = ZoneInfo("America/Los_Angeles")
+        tomorrow = datetime.now(pacific).date() + timedelta(days=1)
+        return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=pacific)
+    except Exception:
+        shifted = _now() - timedelta(hours=8)
+        return datetime(shifted.year, shifted.month, shifted.day, tzinfo=timezone.utc) + timedelta(
+            days=1, hours=8
+        )
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _as_utc(timestamp):
+    """An ISO timestamp as an aware datetime; naive ones are taken as UTC."""
+    parsed = datetime.fromisoformat(timestamp)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _job_path(job_id):
+    return os.path.join(QUEUE_DIR, f"{job_id}.json")
+
+
+def _owner():
+    """This process, identified so a reused pid isn't mistaken for it."""
+    proc = psutil.Process()
+    return {"pid": proc.pid, "started": proc.create_time()}
+
+
+def _owner_alive(owner):
+    if not owner:
+        return False
+    try:
+        return psutil.Process(owner["pid"]).create_time() == owner["started"]
+    except psutil.NoSuchProcess:
+        return False
+    except psutil.AccessDenied:
+        return True
+
+
+
+# QUEUE
+
+def enqueue(video_path, title, description="", tags=None, publish_at=None):
+    """Persist a finished short for upload and return its job id."""
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    # Nanoseconds after the second keep ids queued in the same second FIFO
+    seconds, nanos = divmod(time.time_ns(), 10**9)
+    job_id = (
+        datetime.fromtimestamp(seconds).strftime("%Y%m%d_%H%M%S_")
+        + f"{nanos:09d}_{uuid.uuid4().hex[:4]}"
+    )
+    if isinstance(publish_at, datetime):
+        publish_at = publish_at.astimezone(timezone.utc).isoformat()
+
+    job = {
+        "id": job_id,
+        "video_path": os.path.abspath(video_path),
+        "title": title,
+        "description": description,
+        "tags": tags,
+        "publish_at": publish_at,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": None,
+        "video_id": None,
+        "error": None,
+        "owner": None,
+        "created": _now().isoformat(),
+    }
+    with _lock:
+        _write_json(_job_path(job_id), job)
+    logging.info(f"Queued upload {job_id}: {title}")
+    return job_id
+
+
+def load_jobs():
+    if not os.path.isdir(QUEUE_DIR):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(QUEUE_DIR)):
+        if not name.endswith(".json") or name == os.path.basename(QUOTA_FILE):
+            continue
+        try:
+            with open(os.path.join(QUEUE_DIR, name), "r", encoding="utf-8") as f:
+                jobs.append(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Skipping unreadable upload job {name}: {e}")
+    return jobs
+
+
+def save_job(job):
+    with _lock:
+        _write_json(_job_path(job["id"]), job)
+
+
+def next_publish_time(cadence_hours, earliest=None):
+    """
+    The next free release slot: `cadence_hours` after the latest scheduled
+    job, and never earlier than `earliest` (default: one cadence from now).
+    """
+    earliest = earliest or _now() + timedelta(hours=cadence_hours)
+    scheduled = [
+        datetime.fromisoformat(j["publish_at"])
+        for j in load_jobs()
+        if j.get("publish_at") and j["status"] != "failed"
+    ]
+    if scheduled:
+        return max(earliest, max(scheduled) + timedelta(hours=cadence_hours))
+    return earliest
+
+
+
+# QUOTA
+
+def _load_quota():
+    try:
+        with open(QUOTA_FILE, "r", encoding="utf-8") as f:
+            quota = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        quota = {}
+    if quota.get("day") != _quota_day():
+        quota = {"day": _quota_day(), "used": 0}
+    return quota
+
+
+def reserve_quota(cost=UPLOAD_COST, daily_quota=DAILY_QUOTA):
+    """Claim quota for one upload; False if today's allowance can't cover it."""
+    with _lock:
+        quota = _load_quota()
+        if quota["used"] + cost > daily_quota:
+            return False
+        quota["used"] += cost
+        os.makedirs(QUEUE_DIR, exist_ok=True)
+        _write_json(QUOTA_FILE, quota)
+        return True
+
+
+def release_quota(cost=UPLOAD_COST):
+    """Give back a reservation for an upload that never reached the API."""
+    with _lock:
+        quota = _load_quota()
+        quota["used"] = max(quota["used"] - cost, 0)
+        _write_json(QUOTA_FILE, quota)
+
+
+def exhaust_quota(daily_quota=DAILY_QUOTA):
+    """YouTube says we're out, whatever our own count thinks."""
+    with _lock:
+        quota = _load_quota()
+        quota["used"] = daily_quota
+        _write_json(QUOTA_FILE, quota)
+
+
+def _is_quota_error(e):
+    return "quotaExceeded" in str(e) or "uploadLimitExceeded" in str(e)
+
+
+
+# PROCESSING
+
+def _due(job, now):
+    if job["status"] != "pending":
+        return False
+    return not job.get("next_attempt_at") or datetime.fromisoformat(job["next_attempt_at"]) <= now
+
+
+def _upload_one(job):
+    from upload import upload_short
+
+    job["status"] = "uploading"
+    job["owner"] = _owner()
+    job["attempts"] += 1
+    save_job(job)
+
+    try:
+        if not os.path.exists(job["video_path"]):
+            raise FileNotFoundError(f"Video is gone: {job['video_path']}")
+        if job.get("publish_at") and _as_utc(job["publish_at"]) < _now() + PUBLISH_LEAD:
+            # Held back by quota or backoff past its slot; YouTube rejects a
+            # publishAt in the past, so release it now instead
+            logging.warning(f"Upload {job['id']} missed its slot {job['publish_at']}; publishing at once")
+            job["missed_publish_at"] = job["publish_at"]
+            job["publish_at"] = None
+            save_job(job)
+        job["video_id"] = upload_short(
+            job["video_path"],
+            job["title"],
+            job["description"],
+            job["tags"],
+            publish_at=job.get("publish_at"),
+        )
+        job["status"] = "done"
+        job["error"] = None
+        logging.info(f"Uploaded {job['id']} as {job['video_id']}")
+
+    except Exception as e:
+        job["error"] = str(e)[:1000]
+        if _is_quota_error(e):
+            exhaust_quota()
+            job["attempts"] -= 1  # not the video's fault
+            job["status"] = "pending"
+            job["next_attempt_at"] = _next_quota_reset().isoformat()
+        elif isinstance(e, FileNotFoundError):
+            release_quota()
+            job["status"] = "failed"
+        elif job["attempts"] >= MAX_ATTEMPTS:
+            job["status"] = "failed"
+        else:
+            job["status"] = "pending"
+            delay = min(60 * 2 ** job["attempts"], 6 * 3600)
+            job["next_attempt_at"] = (_now() + timedelta(seconds=delay)).isoformat()
+        logging.warning(f"Upload {job['id']} attempt {job['attempts']} failed: {e}")
+
+    job["owner"] = None
+    save_job(job)
+    return job
+
+
+def _acquire_drain_lock():
+    """Claim the queue for this process; False while a live drainer holds it."""
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(DRAIN_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(DRAIN_LOCK, "r", encoding="utf-8") as f:
+                    holder = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                # Being written right now, or left half-written by a crash
+                try:
+                    if time.time() - os.path.getmtime(DRAIN_LOCK) < 60:
+                        return False
+                except OSError:
+                    continue
+                holder = None
+            if _owner_alive(holder):
+                return False
+            logging.info(f"Removing stale upload drain lock held by {holder}")
+            try:
+                os.remove(DRAIN_LOCK)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(_owner(), f)
+        return True
+    return False
+
+
+def _release_drain_lock():
+    try:
+        os.remove(DRAIN_LOCK)
+    except FileNotFoundError:
+        pass
+
+
+def process_queue(max_concurrent=MAX_CONCURRENT_UPLOADS, daily_quota=DAILY_QUOTA):
+    """
+    Upload every due job, up to `max_concurrent` at a time, while today's
+    quota lasts. Returns the jobs that were attempted; none if another
+    process is already draining the queue.
+    """
+    if not _acquire_drain_lock():
+        logging.info("Another process is draining the upload queue; leaving it to that one")
+        return []
+    try:
+        return _drain(max_concurrent, daily_quota)
+    finally:
+        _release_drain_lock()
+
+
+def _drain(max_concurrent, daily_quota):
+    jobs = load_jobs()
+
+    # A previous drainer died mid-upload; YouTube never got the video
+    for job in jobs:
+        if job["status"] == "uploading" and not _owner_alive(job.get("owner")):
+            job["status"] = "pending"
+            job["owner"] = None
+            save_job(job)
+
+    now = _now()
+    due = [j for j in jobs if _due(j, now)]
+    if not due:
+        return []
+
+    batch = []
+    for job in due:
+        if not reserve_quota(daily_quota=daily_quota):
+            logging.warning(
+                f"Daily upload quota reached; {len(due) - len(batch)} uploads wait for reset"
+            )
+            break
+        batch.append(job)
+
+    with ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="upload") as pool:
+        return list(pool.map(_upload_one, batch))
+
+
+def summary():
+    counts = {}
+    for job in load_jobs():
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return counts
@@ -0,0 +1,235 @@
+"""
+Pure transformations of ComfyUI API-format workflows: loading, seeding,
+pruning and expanding the single-job graphs in the workflow JSON files
+into the chained and batched graphs the pipeline submits.
+
+Nothing here talks to ComfyUI or touches the output folders.
+
+ComfyUI only re-executes nodes whose inputs changed since the previous
+prompt, so everything here leaves the loaders and constant conditioning
+exactly as they are in the JSON files: templates are parsed once and
+copied, and only samplers that inject noise get a new seed.
+"""
+import os
+import json
+import random
+
+
+# Nodes whose inputs must stay identical between jobs for ComfyUI to keep
+# their (expensive) outputs cached
+STATIC_CLASS_TYPES = {
+    "CheckpointLoaderSimple",
+    "UnetLoaderGGUF",
+    "CLIPLoader",
+    "VAELoader",
+    "LoraLoaderModelOnly",
+}
+
+_templates = {}
+
+
+def load_workflow(path):
+    """A fresh copy of the workflow in `path`, parsed once per file version."""
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    cached = _templates.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, json.load(f))
+        _templates[path] = cached
+    return json.loads(json.dumps(cached[1]))
+
+
+def static_signature(workflow):
+    """{node_id: canonical JSON} for the nodes in STATIC_CLASS_TYPES."""
+    return {
+        nid: json.dumps(node, sort_keys=True)
+        for nid, node in workflow.items()
+        if isinstance(node, dict) and node.get("class_type") in STATIC_CLASS_TYPES
+    }
+
+
+def set_output_prefix(workflow, prefix):
+    """Point every saving node at `prefix` below the ComfyUI output folder."""
+    for node in workflow.values():
+        if isinstance(node, dict) and "filename_prefix" in node.get("inputs", {}):
+            node["inputs"]["filename_prefix"] = prefix
+    return workflow
+
+
+def randomize_workflow(workflow):
+    """
+    New seeds for the samplers that add noise. A KSamplerAdvanced with
+    add_noise disabled (the second Wan expert) ignores its seed, so it is
+    left alone like every other node.
+    """
+    for node in workflow.values():
+        if not isinstance(node, dict):
+            continue
+        inputs = node.get("inputs", {})
+        if not isinstance(inputs, dict) or inputs.get("add_noise") == "disable":
+            continue
+        if "seed" in inputs and isinstance(inputs["seed"], (int, float)):
+            inputs["seed"] = random.randint(0, 2**31 - 1)
+        if "noise_seed" in inputs and isinstance(inputs["noise_seed"], (int, float)):
+            inputs["noise_seed"] = random.randint(0, 2**31 - 1)
+    return workflow
+
+
+def get_nodes_map(workflow):
+    """
+    Return a dict mapping node_id_str -> node_obj regardless of workflow shape.
+    Supports either:
+      - old format: { "1": {...}, "2": {...} }
+      - new format: { "nodes": { "1": {...}, ... }, "links": [...] }
+    """
+    if (
+        isinstance(workflow, dict)
+        and "nodes" in workflow
+        and isinstance(workflow["nodes"], dict)
+    ):
+        return workflow["nodes"]
+    return workflow
+
+
+def _links(node):
+    """(input_name, source_node_id) for every input wired to another node."""
+    return [
+        (name, str(value[0]))
+        for name, value in node.get("inputs", {}).items()
+        if isinstance(value, list) and len(value) == 2
+    ]
+
+
+def prune_to_outputs(workflow, output_ids):
+    """The subgraph needed to compute `output_ids`."""
+    keep = set()
+    stack = [str(n) for n in output_ids]
+    while stack:
+        nid = stack.pop()
+        if nid in keep:
+            continue
+        keep.add(nid)
+        stack.extend(src for _, src in _links(workflow[nid]))
+    return {nid: node for nid, node in workflow.items() if nid in keep}
+
+
+def _downstream(workflow, roots):
+    """`roots` plus every node that (transitively) takes input from them."""
+    found = set(roots)
+    changed = True
+    while changed:
+        changed = False
+        for nid, node in workflow.items():
+            if nid not in found and any(src in found for _, src in _links(node)):
+                found.add(nid)
+                changed = True
+    return found
+
+
+def _add_branch(workflow, template, rename):
+    """Copy `template` nodes into `workflow` under their renamed ids, rewiring links."""
+    for nid, node in template.items():
+        node = json.loads(json.dumps(node))
+        for name, src in _links(node):
+            if src in rename:
+                node["inputs"][name] = [rename[src], node["inputs"][name][1]]
+        workflow[rename[nid]] = node
+
+
+def build_video_chain(workflow, prompts, image_name, start_node="52", prompt_node="6",
+                      decode_node="8", save_node="72"):
+    """
+    Expand the single-segment Wan graph into one segment per prompt.
+
+    Loaders and the negative prompt are shared. Every node downstream of the
+    start image or the prompt is copied per segment (ids suffixed _s2, _s3..),
+    and segment N+1 starts from the last frame segment N decoded, picked
+    in-graph with ImageFromBatch instead of a round trip through ffmpeg.
+    Returns the graph and each segment's SaveVideo node id.
+    """
+    workflow = json.loads(json.dumps(workflow))
+    workflow[start_node]["inputs"]["image"] = image_name
+
+    per_segment = _downstream(workflow, {prompt_node, start_node}) - {start_node}
+    template = {nid: workflow.pop(nid) for nid in per_segment}
+
+    save_nodes = []
+    previous_decode = None
+    for k, prompt in enumerate(prompts, start=1):
+        rename = {nid: nid if k == 1 else f"{nid}_s{k}" for nid in template}
+        if previous_decode:
+            frame_node = f"last_frame_s{k}"
+            workflow[frame_node] = {
+                "class_type": "ImageFromBatch",
+                # batch_index is clamped to the batch, so this is always the last frame
+                "inputs": {"image": [previous_decode, 0], "batch_index": 4095, "length": 1},
+            }
+            rename[start_node] = frame_node
+
+        _add_branch(workflow, template, rename)
+        workflow[rename[prompt_node]]["inputs"]["text"] = str(prompt).replace("\n", " ").strip()
+        save_nodes.append(rename[save_node])
+        previous_decode = rename[decode_node]
+
+    return workflow, save_nodes
+
+
+def apply_video_profile(workflow, profile):
+    """Scale the Wan graph down to a draft profile (see DRAFT_PROFILE)."""
+    width, height = profile["video_size"]
+    workflow["64"]["inputs"]["width"] = width
+    workflow["64"]["inputs"]["height"] = height
+    workflow["50"]["inputs"]["length"] = profile["video_length"]
+    steps = profile["video_steps"]
+    for nid in ("57", "58"):
+        workflow[nid]["inputs"]["steps"] = steps
+    workflow["57"]["inputs"]["end_at_step"] = steps // 2
+    workflow["58"]["inputs"]["start_at_step"] = steps // 2
+    return workflow
+
+
+def build_image_batch(workflow, prompts, per_prompt=1, prompt_node="6", latent_node="27",
+                      save_node="9"):
+    """
+    Expand the Flux graph to render every prompt in one submission.
+
+    The checkpoint, negative prompt and empty latent are shared; each prompt
+    gets its own sampler branch (ids suffixed _p2, _p3..). `per_prompt` is
+    the latent batch size, so one sampler call yields that many seeds of the
+    same prompt. Returns the graph and each prompt's SaveImage node id.
+    """
+    workflow = json.loads(json.dumps(workflow))
+    workflow[latent_node]["inputs"]["batch_size"] = per_prompt
+
+    template = {nid: workflow.pop(nid) for nid in _downstream(workflow, {prompt_node})}
+    save_nodes = []
+    for k, prompt in enumerate(prompts, start=1):
+        rename = {nid: nid if k == 1 else f"{nid}_p{k}" for nid in template}
+        _add_branch(workflow, template, rename)
+        workflow[rename[prompt_node]]["inputs"]["text"] = prompt
+        save_nodes.append(rename[save_node])
+
+    return workflow, save_nodes
+
+
+def find_vhs_load_node(nodes_map):
+    if "1" in nodes_map:
+        n = nodes_map["1"]
+        cls = n.get("class_type") or n.get("type") or ""
+        if "VHS_LoadVideo" in str(cls):
+            return "1"
+
+    for nid, node in nodes_map.items():
+        cls = node.get("class_type") or node.get("type") or ""
+        if "VHS_LoadVideo" in str(cls):
+            return nid
+    return None
+
+
+def reseed_segments(chain, save_nodes, first):
+    """New seeds for segment `first` and everything chained after it."""
+    keep = (
+        set(prune_to_outputs(chain, [save_nodes[first - 1]])) if first > 0 else set()
+    )
+    randomize_workflow({nid: node for nid, node in chain.items() if nid not in keep})